@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -19,13 +21,22 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
+def env_bool(name, default=False):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+# Alle produktionsrelevanten Werte lassen sich über Umgebungsvariablen setzen,
+# ohne Variablen gelten die bisherigen Entwicklungs-Einstellungen.
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-g+qbgas&hm003-ts+lpomyln37uvzd+wzcn-6-2yanw(5oa742'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY', 'django-insecure-g+qbgas&hm003-ts+lpomyln37uvzd+wzcn-6-2yanw(5oa742'
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_bool('DJANGO_DEBUG', True)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -41,6 +52,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Zuerst, damit die Abfragen der übrigen Middleware mitgezählt werden
+    'myapp.messung.MessungMiddleware',
+    # Vor der Session-Middleware, damit deren Schreibzugriffe das Klebe-Cookie auslösen
+    'myapp.replikate.ReplikatMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,7 +66,6 @@ MIDDLEWARE = [
 ]
 
 ROOT_URLCONF = 'DjangoProject.urls'
-import os
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -60,7 +74,8 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 BASE_DIR = Path(__file__).resolve().parent.parent
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus Messung der Renderzeit (Server-Timing)
+        'BACKEND': 'myapp.messung.MessendeTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')]
         ,
         'APP_DIRS': True,
@@ -81,12 +96,107 @@ WSGI_APPLICATION = 'DjangoProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# DB_ENGINE=sqlite (Standard) oder postgresql. Verbindungen bleiben DB_CONN_MAX_AGE
+# Sekunden offen statt je Request neu aufgebaut zu werden (unter ASGI besser
+# DB_CONN_MAX_AGE=0 und für PostgreSQL DB_POOL=1 verwenden).
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+
+# Wird beim Öffnen jeder SQLite-Verbindung ausgeführt (gilt nur für die Verbindung):
+# - synchronous=NORMAL: mit WAL absturzsicher, spart das fsync je Commit
+# - busy_timeout: Schreiber warten auf die Sperre statt sofort "database is locked"
+# - mmap_size: Lesezugriffe über Memory-Mapping statt read()-Aufrufe
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '20000')),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
 }
+# Journalmodus der Datei; WAL: Leser blockieren Schreiber nicht mehr und umgekehrt.
+# Er wird in der Datei gespeichert und daher nur von `migrate` gesetzt (myapp.apps),
+# nicht bei jeder Verbindung. DELETE ist der Django-Standard.
+SQLITE_JOURNAL_MODE = 'WAL' if env_bool('SQLITE_TUNING', True) else 'DELETE'
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'lagerverwaltung'),
+            'USER': os.environ.get('POSTGRES_USER', 'lagerverwaltung'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if env_bool('DB_POOL'):
+        # Verbindungspool von psycopg (benötigt psycopg[pool]); schließt persistente Verbindungen aus
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+                'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+            },
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Schreibsperre gleich zu Beginn der Transaktion holen; sonst scheitert das
+                # spätere Hochstufen von Lese- auf Schreibsperre ohne Warten am busy_timeout vorbei
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join(f'PRAGMA {name}={wert}' for name, wert in SQLITE_PRAGMAS.items()),
+            } if env_bool('SQLITE_TUNING', True) else {},
+        }
+    }
+
+
+# Lesereplikate (siehe myapp.replikate): DB_REPLIKATE=host1,host2 für PostgreSQL-
+# Streaming-Replikate bzw. Dateipfade gespiegelter SQLite-Datenbanken. Lesende Views
+# fragen dann eines davon ab. In Tests spiegeln die Aliase die Standard-Datenbank.
+for nummer, ziel in enumerate(filter(None, os.environ.get('DB_REPLIKATE', '').split(',')), 1):
+    DATABASES[f'replikat_{nummer}'] = {
+        **DATABASES['default'],
+        'HOST' if DB_ENGINE == 'postgresql' else 'NAME': ziel,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLIKATE = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['myapp.replikate.ReplikatRouter']
+# So viele Sekunden nach einem Schreibzugriff (des Benutzers bzw. auf das Lager)
+# wird weiter vom Primärsystem gelesen; muss die Verzögerung der Replikate abdecken
+REPLIKAT_KLEBEZEIT = int(os.environ.get('DB_REPLIKAT_KLEBEZEIT', '5'))
+
+# Cache (Kennzahlen, Seiten-Versionen, Fragmente). Bei mehreren Prozessen muss er
+# gemeinsam sein, z. B. REDIS_URL=redis://localhost:6379/0 (benötigt redis).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
+# Sessions (siehe myapp.anmeldung): SESSION_BACKEND=cached_db (Standard) liest sie aus
+# dem Cache und nur bei Fehlzugriffen aus der Datenbank, signed_cookies speichert sie
+# signiert im Cookie (keine Abfrage, aber kein serverseitiges Abmelden anderer Geräte),
+# db ist das Django-Verhalten (eine Abfrage je Request).
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[os.environ.get('SESSION_BACKEND', 'cached_db')]
+
+# Der angemeldete Benutzer wird so viele Sekunden im Cache gehalten (0: je Request aus der Datenbank).
+# ModelBackend bleibt eingetragen, damit Sessions von vor der Umstellung gültig bleiben; sie
+# laden den Benutzer weiter je Request, bis sich der Benutzer neu anmeldet.
+AUTHENTICATION_BACKENDS = ['myapp.anmeldung.BenutzerCacheBackend', 'django.contrib.auth.backends.ModelBackend']
+AUTH_BENUTZER_CACHE = int(os.environ.get('AUTH_BENUTZER_CACHE', '300'))
+
+# Verteilung der Live-Ereignisse (siehe myapp.live)
+LIVE_BACKEND = os.environ.get('LIVE_BACKEND', 'myapp.live.LokalerKanal')
 
 
 # Password validation
@@ -108,6 +218,11 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Die Tests legen viele Benutzer an; dort genügt ein schneller Hash statt PBKDF2
+if sys.argv[1:2] == ['test']:
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
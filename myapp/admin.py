@@ -1,6 +1,23 @@
 from django.contrib import admin
+from .archiv import artikel_geloescht
 from .models import Lager, Artikel
 
 # Lager-Modell für das Admin-Interface registrieren
 admin.site.register(Lager)
-admin.site.register(Artikel)
\ No newline at end of file
+
+
+@admin.register(Artikel)
+class ArtikelAdmin(admin.ModelAdmin):
+    # Buchungen gelöschter Artikel räumt ein Hintergrundauftrag ab (myapp.archiv)
+    def delete_model(self, request, obj):
+        lager_id, artikel_id = obj.lager_id, obj.id
+        super().delete_model(request, obj)
+        artikel_geloescht(lager_id, [artikel_id])
+
+    def delete_queryset(self, request, queryset):
+        geloescht = {}
+        for lager_id, artikel_id in queryset.values_list('lager_id', 'id'):
+            geloescht.setdefault(lager_id, []).append(artikel_id)
+        super().delete_queryset(request, queryset)
+        for lager_id, artikel_ids in geloescht.items():
+            artikel_geloescht(lager_id, artikel_ids)
@@ -0,0 +1,47 @@
+"""Angemeldeter Benutzer ohne Datenbankzugriff je Request.
+
+Django lädt bei jedem Request die Session und danach den Benutzer. Die
+Session liegt je nach ``SESSION_BACKEND`` im Cache oder im signierten Cookie
+(siehe settings), den Benutzer hält ``BenutzerCacheBackend``
+``AUTH_BENUTZER_CACHE`` Sekunden im Cache. Jede Änderung am Benutzer
+(Passwort, ``is_active``, ``last_login`` beim Login, Löschen) entfernt ihn
+nach dem Commit wieder, der Abgleich des Session-Hashes mit dem Passwort
+bleibt also wirksam. ``QuerySet.update()`` auf Benutzer umgeht die Signale
+und darf daher nicht für Passwort, Rechte oder ``is_active`` benutzt werden.
+Wie die übrigen Cache-Einträge muss der Cache bei mehreren Prozessen gemeinsam
+sein (REDIS_URL).
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _benutzer_key(user_id):
+    return f'benutzer:{user_id}'
+
+
+class BenutzerCacheBackend(ModelBackend):
+    """``ModelBackend``, das den Benutzer für ``get_user`` aus dem Cache liefert.
+
+    Anmelden (``authenticate``) und Berechtigungen bleiben unverändert.
+    """
+
+    def get_user(self, user_id):
+        timeout = settings.AUTH_BENUTZER_CACHE
+        if not timeout:
+            return super().get_user(user_id)
+        key = _benutzer_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, timeout)
+        return user
+
+
+def benutzer_geaendert(sender, instance, **kwargs):
+    key = _benutzer_key(instance.pk)
+    # Sofort und nach dem Commit: sonst könnte ein paralleler Request den alten Stand erneut ablegen
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
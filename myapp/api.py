@@ -0,0 +1,278 @@
+"""JSON-API für Scanner und ERP-Anbindung (``/api/...``).
+
+Alle Antworten entstehen aus ``values()``-Abfragen ohne Modellinstanzen und
+werden kompakt (ohne Leerzeichen) serialisiert. Listen sind per Cursor
+seitenweise abrufbar, ``fields`` wählt die Spalten aus. Lesende Lager-
+Endpunkte liefern ETags aus der Lager-Version und antworten auf
+``If-None-Match`` mit ``304``. Zugriff wie in der Oberfläche: angemeldet und
+Mitglied des Lagers.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_http_methods
+
+from .bilder import thumbnail_url
+from .messung import abfragen_budget
+from .models import Artikel, Lager, Transaction
+from .replikate import nur_lesend
+from .seitencache import bedingte_anfrage
+from .services import buche_bewegung, ganzzahl, AnfrageKonflikt, NichtGenugBestand
+from .zugriff import lade_lager, lager_mitglied_erforderlich, zugaengliche_lager
+
+# Einträge je Seite: Standard und Obergrenze
+LIMIT = 100
+MAX_LIMIT = 1000
+
+LAGER_FELDER = ['id', 'name', 'owner_id']
+ARTIKEL_FELDER = ['id', 'name', 'code', 'menge', 'mindestbestand', 'foto']
+ARTIKEL_STANDARD = ['id', 'name', 'menge', 'mindestbestand']
+BUCHUNG_FELDER = ['id', 'article_id', 'type', 'quantity', 'date', 'anfrage_id']
+BUCHUNG_STANDARD = ['id', 'article_id', 'type', 'quantity', 'date']
+
+
+class UngueltigeAnfrage(Exception):
+    """Fehlerhafte Parameter; wird als 400 mit Meldung beantwortet."""
+
+
+def antwort(daten, status=200):
+    return JsonResponse(daten, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'separators': (',', ':')})
+
+
+def fehler(meldung, status):
+    return antwort({'error': meldung}, status=status)
+
+
+def api_view(view=None, *, lager=True):
+    """Decorator für API-Views.
+
+    Nicht angemeldet: ``401`` statt Weiterleitung zum Login. Mit ``lager``
+    gelten die Mitgliedschaftsregeln der Oberfläche (sonst ``403``).
+    ``UngueltigeAnfrage`` wird zu ``400``.
+    """
+    def decorator(view):
+        innen = lager_mitglied_erforderlich(view, json_antwort=True) if lager else view
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return fehler('Anmeldung erforderlich.', 401)
+            try:
+                return innen(request, *args, **kwargs)
+            except UngueltigeAnfrage as e:
+                return fehler(str(e), 400)
+        return wrapper
+
+    if view is not None:
+        return decorator(view)
+    return decorator
+
+
+def felder(request, erlaubt, standard=None):
+    """Spaltenauswahl aus ``?fields=a,b``; unbekannte Felder sind ein Fehler."""
+    if not request.GET.get('fields'):
+        return list(standard or erlaubt)
+    gewaehlt = [feld for feld in request.GET['fields'].split(',') if feld]
+    unbekannt = [feld for feld in gewaehlt if feld not in erlaubt]
+    if unbekannt:
+        raise UngueltigeAnfrage(f"Unbekannte Felder: {', '.join(unbekannt)} (erlaubt: {', '.join(erlaubt)})")
+    return gewaehlt
+
+
+def limit(request):
+    wert = request.GET.get('limit', '')
+    if not wert:
+        return LIMIT
+    if not wert.isdigit() or int(wert) < 1:
+        raise UngueltigeAnfrage('"limit" muss eine positive Zahl sein.')
+    return min(int(wert), MAX_LIMIT)
+
+
+def cursor_kodieren(werte):
+    # Zeitpunkte mit voller Genauigkeit (DjangoJSONEncoder kürzt auf Millisekunden)
+    text = json.dumps(werte, default=lambda wert: wert.isoformat(), separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def cursor_lesen(request, *typen):
+    """Der undurchsichtige Cursor aus ``?cursor=`` als Liste der Sortierwerte (oder None).
+
+    ``typen`` gibt Anzahl und Typ der Sortierwerte vor; ein Cursor, der nicht
+    passt (z. B. von Hand gebaut), ist ein Fehler.
+    """
+    text = request.GET.get('cursor')
+    if not text:
+        return None
+    try:
+        werte = json.loads(base64.urlsafe_b64decode(text.encode()))
+    except (ValueError, binascii.Error):
+        raise UngueltigeAnfrage('Ungültiger Cursor.')
+    if not isinstance(werte, list) or len(werte) != len(typen) or not all(
+        isinstance(wert, typ) and not isinstance(wert, bool) for wert, typ in zip(werte, typen)
+    ):
+        raise UngueltigeAnfrage('Ungültiger Cursor.')
+    return werte
+
+
+def seite(queryset, spalten, sortierung, groesse):
+    """Liest ``groesse`` Zeilen nach ``sortierung`` und liefert ``(zeilen, cursor)``.
+
+    Die Sortierspalten werden für den Cursor mitgelesen und, wenn nicht
+    angefordert, wieder entfernt.
+    """
+    schluessel = [feld.lstrip('-') for feld in sortierung]
+    zeilen = list(queryset.order_by(*sortierung).values(*dict.fromkeys(spalten + schluessel))[:groesse + 1])
+    naechste = None
+    if len(zeilen) > groesse:
+        zeilen = zeilen[:groesse]
+        naechste = cursor_kodieren([zeilen[-1][feld] for feld in schluessel])
+    zusaetzlich = [feld for feld in schluessel if feld not in spalten]
+    if zusaetzlich:
+        for zeile in zeilen:
+            for feld in zusaetzlich:
+                del zeile[feld]
+    return zeilen, naechste
+
+
+def liste(zeilen, naechste):
+    return antwort({'results': zeilen, 'next': naechste})
+
+
+@abfragen_budget(4)
+@nur_lesend
+@require_GET
+@api_view(lager=False)
+def lager_liste(request):
+    """Lager, in denen der Benutzer Mitglied ist (Besitzer, M2M oder Freigabe), nach ID."""
+    lager = zugaengliche_lager(request.user)
+    nach = cursor_lesen(request, int)
+    if nach:
+        lager = lager.filter(id__gt=nach[0])
+    return liste(*seite(lager, felder(request, LAGER_FELDER), ['id'], limit(request)))
+
+
+@abfragen_budget(4)
+@nur_lesend
+@require_GET
+@api_view
+@bedingte_anfrage()
+def lager_einzeln(request, lager_id):
+    spalten = felder(request, LAGER_FELDER)
+    return antwort(Lager.objects.filter(id=lager_id).values(*spalten).get())
+
+
+def _artikel_zeilen(zeilen):
+    for zeile in zeilen:
+        if 'foto' in zeile:
+            zeile['foto'] = thumbnail_url(zeile['foto'])
+    return zeilen
+
+
+@abfragen_budget(4)
+@nur_lesend
+@require_GET
+@api_view
+@bedingte_anfrage()
+def artikel_liste(request, lager_id):
+    """Artikel nach Name (Cursor über den (lager, name)-Index); ``bestand=1`` nur mit Bestand."""
+    artikel = Artikel.objects.filter(lager_id=lager_id)
+    if request.GET.get('bestand'):
+        artikel = artikel.filter(menge__gt=0)
+    nach = cursor_lesen(request, str)
+    if nach:
+        artikel = artikel.filter(name__gt=nach[0])
+    zeilen, naechste = seite(artikel, felder(request, ARTIKEL_FELDER, ARTIKEL_STANDARD), ['name'], limit(request))
+    return liste(_artikel_zeilen(zeilen), naechste)
+
+
+@abfragen_budget(4)
+@nur_lesend
+@require_GET
+@api_view
+@bedingte_anfrage()
+def artikel_einzeln(request, lager_id, artikel_id):
+    zeilen = list(
+        Artikel.objects.filter(lager_id=lager_id, id=artikel_id).values(*felder(request, ARTIKEL_FELDER, ARTIKEL_STANDARD))
+    )
+    if not zeilen:
+        return fehler('Artikel nicht gefunden.', 404)
+    return antwort(_artikel_zeilen(zeilen)[0])
+
+
+def _zeitpunkt(request, name):
+    wert = request.GET.get(name)
+    if not wert:
+        return None
+    try:
+        zeitpunkt = datetime.fromisoformat(wert)
+    except ValueError:
+        raise UngueltigeAnfrage(f'"{name}" muss ein ISO-Zeitpunkt sein.')
+    if zeitpunkt.tzinfo is None:
+        raise UngueltigeAnfrage(f'"{name}" braucht eine Zeitzone.')
+    return zeitpunkt
+
+
+@abfragen_budget(10)
+@require_http_methods(['GET', 'POST'])
+@api_view
+def buchungen(request, lager_id):
+    """GET: Buchungen des Lagers, neueste zuerst (``von``/``bis``, ``article``). POST: eine Buchung."""
+    if request.method == 'POST':
+        return _buchen(request, lager_id)
+    return _buchungen_liste(request, lager_id=lager_id)
+
+
+@nur_lesend
+@bedingte_anfrage()
+def _buchungen_liste(request, lager_id):
+    buchungen = Transaction.objects.filter(lager_id=lager_id)
+    von, bis = _zeitpunkt(request, 'von'), _zeitpunkt(request, 'bis')
+    if von:
+        buchungen = buchungen.filter(date__gte=von)
+    if bis:
+        buchungen = buchungen.filter(date__lte=bis)
+    if request.GET.get('article', '').isdigit():
+        buchungen = buchungen.filter(article_id=int(request.GET['article']))
+    nach = cursor_lesen(request, str, int)
+    if nach:
+        try:
+            datum, buchung_id = datetime.fromisoformat(nach[0]), nach[1]
+        except ValueError:
+            raise UngueltigeAnfrage('Ungültiger Cursor.')
+        buchungen = buchungen.filter(Q(date__lt=datum) | Q(date=datum, id__lt=buchung_id))
+    spalten = felder(request, BUCHUNG_FELDER, BUCHUNG_STANDARD)
+    return liste(*seite(buchungen, spalten, ['-date', '-id'], limit(request)))
+
+
+def _buchen(request, lager_id):
+    """Bucht ``{"article": <id>, "type": "in"|"out", "quantity": <n>}``; idempotent per ``Idempotency-Key``."""
+    try:
+        daten = json.loads(request.body)
+        article_id, transaction_type, quantity = ganzzahl(daten['article']), daten['type'], ganzzahl(daten['quantity'])
+    except (ValueError, KeyError, TypeError):
+        return fehler('Erwartet {"article": <id>, "type": "in"|"out", "quantity": <n>}.', 400)
+
+    anfrage_id = request.headers.get('Idempotency-Key') or daten.get('anfrage_id') or None
+    if anfrage_id is not None and not isinstance(anfrage_id, str):
+        raise UngueltigeAnfrage('"anfrage_id" muss ein Text sein.')
+    try:
+        buchung = buche_bewegung(lade_lager(request, lager_id), article_id, transaction_type, quantity, anfrage_id)
+    except AnfrageKonflikt:
+        return fehler('Die Anfrage-Kennung wurde bereits für eine andere Buchung verwendet.', 422)
+    except Artikel.DoesNotExist:
+        return fehler('Artikel nicht gefunden.', 404)
+    except NichtGenugBestand:
+        return fehler('Nicht genügend Artikel für den Abgang verfügbar!', 409)
+    except ValueError as e:
+        return fehler(str(e), 400)
+
+    response = antwort({feld: getattr(buchung, feld) for feld in BUCHUNG_FELDER}, status=201)
+    if getattr(buchung, 'wiederholt', False):
+        response['Idempotent-Replayed'] = 'true'
+    return response
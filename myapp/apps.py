@@ -1,6 +1,41 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+
+
+def suchindex_pruefen(sender, using, **kwargs):
+    # SQLite verwirft die FTS-Trigger, wenn eine Migration myapp_artikel neu aufbaut
+    from django.db import connections
+    from .suche import suchindex_einrichten
+    conn = connections[using]
+    if 'myapp_artikel' in conn.introspection.table_names():
+        suchindex_einrichten(conn)
+
+
+def journal_einrichten(sender, using, **kwargs):
+    # Der Journalmodus bleibt in der Datei gespeichert: einmal beim Migrieren statt je Verbindung
+    from django.conf import settings
+    from django.db import connections
+    conn = connections[using]
+    if conn.vendor == 'sqlite' and not conn.is_in_memory_db():
+        with conn.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}')
 
 
 class MyappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from .anmeldung import benutzer_geaendert
+        from .archiv import lager_geloescht
+        from .messung import verbindung_instrumentieren
+        post_migrate.connect(suchindex_pruefen, sender=self)
+        post_migrate.connect(journal_einrichten, sender=self)
+        connection_created.connect(verbindung_instrumentieren)
+        # Buchungen gelöschter Lager räumt ein Hintergrundauftrag schubweise ab (Artikel: myapp.admin)
+        pre_delete.connect(lager_geloescht, sender=self.get_model('Lager'))
+        # Zwischengespeicherte Benutzer (myapp.anmeldung) bei jeder Änderung verwerfen
+        post_save.connect(benutzer_geaendert, sender=get_user_model())
+        post_delete.connect(benutzer_geaendert, sender=get_user_model())
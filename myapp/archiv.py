@@ -0,0 +1,142 @@
+import math
+import threading
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .auftraege import aufgabe, einreihen
+from .bestand import erstelle_snapshot
+from .models import ArchivBuchung, Artikel, Lager, Transaction
+from .prognose import HISTORIE
+
+# Zeilen je Schub beim Verschieben und Löschen; jeder Schub ist eine eigene, kurze Transaktion
+SCHUB = 5000
+
+# Prognosen (HISTORIE Tage) und Kennzahlen lesen nur das Journal; bei mindestens
+# 28 Tagen je Monat muss es so viele volle Monate zurückreichen
+MIN_MONATE = math.ceil(HISTORIE / 28)
+
+
+def archivgrenze(monate, jetzt=None):
+    """Beginn des Monats vor ``monate`` Monaten (lokale Zeit); ältere Buchungen werden archiviert."""
+    jetzt = timezone.localtime(jetzt)
+    jahr, monat = divmod(jetzt.year * 12 + jetzt.month - 1 - monate, 12)
+    return timezone.make_aware(datetime.combine(jetzt.date().replace(year=jahr, month=monat + 1, day=1), time.min))
+
+
+def archivieren(lager, grenze, schub=SCHUB):
+    """Verschiebt die Buchungen eines Lagers vor ``grenze`` schubweise ins Archiv.
+
+    Vorher wird der Bestand zum Ende der archivierten Zeit als Snapshot
+    festgeschrieben, Stichtagsbestände ab dort kommen also ohne das Archiv
+    aus. Jeder Schub (``INSERT ... SELECT`` ins Archiv, ``DELETE`` aus dem
+    Journal) läuft in einer eigenen Transaktion, Sperren bleiben kurz.
+    Liefert die Anzahl verschobener Buchungen.
+    """
+    if not Transaction.objects.filter(lager=lager, date__lt=grenze).exists():
+        return 0
+    erstelle_snapshot(lager, grenze - timedelta(microseconds=1))
+
+    qn = connection.ops.quote_name
+    spalten = 'id, lager_id, article_id, type, quantity, date, anfrage_id, umbuchung'
+    verschoben = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Transaction.objects.filter(lager=lager, date__lt=grenze)
+                .order_by('date', 'id').values_list('id', flat=True)[:schub]
+            )
+            if not ids:
+                return verschoben
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {qn(ArchivBuchung._meta.db_table)} ({spalten}) "
+                    f"SELECT {spalten} FROM {qn(Transaction._meta.db_table)} "
+                    f"WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                    ids,
+                )
+            verschoben += Transaction.objects.filter(id__in=ids).delete()[0]
+
+
+def buchungen_bereinigen(lager_id, artikel_ids=None, schub=SCHUB):
+    """Löscht Journal- und Archivbuchungen eines gelöschten Lagers bzw. gelöschter Artikel.
+
+    Ohne ``artikel_ids`` ist das ganze Lager gemeint. Gelöscht wird nur, was
+    tatsächlich keinen Artikel bzw. kein Lager mehr hat (ein zurückgerolltes
+    Löschen richtet also keinen Schaden an), schubweise und mit je einem
+    kurzen ``DELETE``. Liefert die Anzahl gelöschter Zeilen.
+    """
+    if artikel_ids is None:
+        if Lager.objects.filter(id=lager_id).exists():
+            return 0
+        quellen = [Transaction.objects.filter(lager_id=lager_id), ArchivBuchung.objects.filter(lager_id=lager_id)]
+    else:
+        geloescht = set(artikel_ids) - set(Artikel.objects.filter(id__in=artikel_ids).values_list('id', flat=True))
+        if not geloescht:
+            return 0
+        quellen = [
+            Transaction.objects.filter(article_id__in=geloescht),
+            ArchivBuchung.objects.filter(lager_id=lager_id, article_id__in=geloescht),
+        ]
+
+    geloeschte_zeilen = 0
+    for buchungen in quellen:
+        while ids := list(buchungen.values_list('id', flat=True)[:schub]):
+            geloeschte_zeilen += buchungen.model.objects.filter(id__in=ids).delete()[0]
+    return geloeschte_zeilen
+
+
+def _bereinigen_abschliessen(parameter, ergebnis):
+    buchungen_bereinigen(parameter['lager_id'], parameter.get('artikel_ids'))
+
+
+@aufgabe('buchungen_bereinigen', _bereinigen_abschliessen)
+def bereinigen_vorbereiten(lager_id, artikel_ids=None):
+    # Nichts zu berechnen; gelöscht wird im Abschluss mit Datenbankzugriff
+    return None
+
+
+# Gelöschte Lager/Artikel eines Threads, bis ihre Transaktion committet ist
+_vorgemerkt = threading.local()
+
+
+def _vormerken(lager_id, artikel_ids=()):
+    if not hasattr(_vorgemerkt, 'lager'):
+        _vorgemerkt.lager, _vorgemerkt.artikel = set(), {}
+    if not artikel_ids:
+        _vorgemerkt.lager.add(lager_id)
+    else:
+        _vorgemerkt.artikel.setdefault(lager_id, []).extend(artikel_ids)
+    # Der erste Rückruf nach dem Commit reiht alles Gesammelte ein, die übrigen finden nichts mehr vor
+    transaction.on_commit(_einreihen)
+
+
+def _einreihen():
+    lager, artikel = getattr(_vorgemerkt, 'lager', set()), getattr(_vorgemerkt, 'artikel', {})
+    _vorgemerkt.lager, _vorgemerkt.artikel = set(), {}
+    for lager_id in sorted(lager):
+        einreihen('buchungen_bereinigen', lager_id=lager_id)
+    for lager_id, artikel_ids in sorted(artikel.items()):
+        # Beim Löschen eines Lagers fallen auch seine Artikel; das Lager deckt sie mit ab
+        if lager_id not in lager:
+            einreihen('buchungen_bereinigen', lager_id=lager_id, artikel_ids=sorted(artikel_ids))
+
+
+def lager_geloescht(sender, instance, **kwargs):
+    """``pre_delete``-Empfänger für ``Lager``: ein Auftrag je Lager, auch für alle seine Artikel.
+
+    Für ``Artikel`` gibt es bewusst keinen Empfänger, er würde Djangos
+    schnelles Löschen (ein ``DELETE`` statt Laden jeder Zeile) beim
+    Kaskadieren aus dem Lager verhindern; siehe ``artikel_geloescht``.
+    """
+    _vormerken(instance.id)
+
+
+def artikel_geloescht(lager_id, artikel_ids):
+    """Merkt gelöschte Artikel eines Lagers zum Bereinigen nach dem Commit vor.
+
+    Muss von jeder Stelle aufgerufen werden, die einzelne Artikel löscht
+    (derzeit nur der Admin, siehe ``myapp.admin``).
+    """
+    _vormerken(lager_id, artikel_ids)
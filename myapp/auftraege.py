@@ -0,0 +1,169 @@
+import os
+import socket
+import traceback
+import uuid
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from .bilder import verarbeite_upload
+from .models import Artikel, Auftrag
+from .seitencache import lager_geaendert
+
+# Aufgabe -> (Berechnung im Worker-Prozess ohne DB, Abschluss und Fehlschlag im Hauptprozess mit DB)
+AUFGABEN = {}
+
+MAX_VERSUCHE = 3
+
+
+def aufgabe(name, abschluss, fehlschlag=None):
+    """Registriert eine Funktion als Aufgabe der Warteschlange.
+
+    Die Funktion selbst läuft in einem Prozess des Pools und bekommt die
+    Parameter des Auftrags; ``abschluss(parameter, ergebnis)`` schreibt das
+    Ergebnis anschließend im Worker-Hauptprozess in die Datenbank.
+    ``fehlschlag(parameter)`` räumt auf, wenn alle Versuche gescheitert sind.
+    """
+    def decorator(func):
+        AUFGABEN[name] = (func, abschluss, fehlschlag)
+        return func
+    return decorator
+
+
+def einreihen(name, **parameter):
+    """Legt einen neuen Auftrag an; der Request muss darauf nicht warten."""
+    return Auftrag.objects.create(aufgabe=name, parameter=parameter)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def auftraege_holen(worker, anzahl):
+    """Übernimmt bis zu ``anzahl`` offene Aufträge für ``worker``.
+
+    Das bedingte UPDATE (``WHERE status = 'offen'``) stellt sicher, dass
+    parallele Worker denselben Auftrag nie doppelt übernehmen.
+    """
+    ids = list(Auftrag.objects.filter(status='offen').order_by('id').values_list('id', flat=True)[:anzahl])
+    if not ids:
+        return []
+    Auftrag.objects.filter(id__in=ids, status='offen').update(
+        status='laeuft', worker=worker, gestartet=timezone.now(), versuche=F('versuche') + 1
+    )
+    return list(Auftrag.objects.filter(id__in=ids, status='laeuft', worker=worker).order_by('id'))
+
+
+def haengende_freigeben(nach=timedelta(minutes=15)):
+    """Gibt Aufträge wieder frei, deren Worker abgestürzt ist."""
+    return Auftrag.objects.filter(status='laeuft', gestartet__lt=timezone.now() - nach).update(status='offen', worker='')
+
+
+def _berechnen(name, parameter):
+    return AUFGABEN[name][0](**parameter)
+
+
+def _einreichen(pool, auftrag):
+    try:
+        return pool.submit(_berechnen, auftrag.aufgabe, auftrag.parameter)
+    except BrokenProcessPool as e:
+        # Schon vorher abgestürzt: wie ein Absturz während der Berechnung behandeln
+        future = Future()
+        future.set_exception(e)
+        return future
+
+
+def abarbeiten(worker, anzahl=10, pool=None):
+    """Arbeitet einen Schub offener Aufträge ab und liefert deren Anzahl.
+
+    Mit ``pool`` (z. B. ``ProcessPoolExecutor``) laufen die Berechnungen
+    parallel in eigenen Prozessen, ohne Pool direkt im aufrufenden Prozess.
+
+    Stirbt dabei ein Prozess des Pools (Speicher, Absturz in Pillow), ist der
+    Pool unbrauchbar und alle Berechnungen des Schubs scheitern. Welcher
+    Auftrag schuld war, ist dann nicht bekannt: bei mehreren gehen alle ohne
+    verbrauchten Versuch zurück in die Warteschlange, nur ein einzelner
+    Auftrag zählt den Versuch. Anschließend wird ``BrokenProcessPool``
+    ausgelöst, der Aufrufer muss den Pool neu anlegen (und sollte danach
+    einzeln abarbeiten, siehe ``manage.py auftraege_abarbeiten``).
+    """
+    auftraege = auftraege_holen(worker, anzahl)
+    if pool is not None:
+        laufend = [(a, _einreichen(pool, a)) for a in auftraege]
+    else:
+        laufend = [(a, None) for a in auftraege]
+
+    pool_defekt = False
+    for auftrag, future in laufend:
+        try:
+            ergebnis = future.result() if future else _berechnen(auftrag.aufgabe, auftrag.parameter)
+            AUFGABEN[auftrag.aufgabe][1](auftrag.parameter, ergebnis)
+        except BrokenProcessPool:
+            pool_defekt = True
+            if len(auftraege) > 1:
+                Auftrag.objects.filter(id=auftrag.id).update(status='offen', worker='', versuche=F('versuche') - 1)
+                continue
+            _fehlgeschlagen(auftrag)
+        except Exception:
+            _fehlgeschlagen(auftrag)
+        else:
+            auftrag.status = 'fertig'
+            auftrag.fehler = ''
+        auftrag.save(update_fields=['status', 'fehler', 'worker'])
+    if pool_defekt:
+        raise BrokenProcessPool('Ein Prozess des Pools wurde beendet.')
+    return len(auftraege)
+
+
+def _fehlgeschlagen(auftrag):
+    auftrag.status = 'offen' if auftrag.versuche < MAX_VERSUCHE else 'fehler'
+    auftrag.fehler = traceback.format_exc(limit=5)
+    auftrag.worker = ''
+    fehlschlag = AUFGABEN[auftrag.aufgabe][2]
+    if auftrag.status == 'fehler' and fehlschlag:
+        fehlschlag(auftrag.parameter)
+
+
+# Bildverarbeitung
+
+def _bild_abschliessen(parameter, name):
+    # Nur übernehmen, wenn seitdem kein neueres Bild hochgeladen wurde
+    if Artikel.objects.filter(id=parameter['artikel_id'], foto_auftrag=parameter['upload']).update(
+        foto=name, foto_auftrag=''
+    ):
+        _bild_geaendert(parameter['artikel_id'])
+    default_storage.delete(parameter['upload'])
+
+
+def _bild_verwerfen(parameter):
+    if Artikel.objects.filter(id=parameter['artikel_id'], foto_auftrag=parameter['upload']).update(foto_auftrag=''):
+        _bild_geaendert(parameter['artikel_id'])
+    default_storage.delete(parameter['upload'])
+
+
+def _bild_geaendert(artikel_id):
+    lager_id = Artikel.objects.filter(id=artikel_id).values_list('lager_id', flat=True).first()
+    if lager_id:
+        lager_geaendert(lager_id)
+
+
+@aufgabe('bild_verarbeiten', _bild_abschliessen, _bild_verwerfen)
+def bild_verarbeiten(artikel_id, upload):
+    return verarbeite_upload(upload)
+
+
+def bild_einreihen(artikel, datei):
+    """Legt den Upload unverarbeitet ab und reiht die Bildverarbeitung ein.
+
+    Bis der Worker fertig ist, zeigt der Artikel sein bisheriges Bild bzw.
+    den Platzhalter.
+    """
+    endung = os.path.splitext(datei.name)[1].lower()
+    upload = default_storage.save(f'uploads/{uuid.uuid4().hex}{endung}', datei)
+    Artikel.objects.filter(id=artikel.id).update(foto_auftrag=upload)
+    artikel.foto_auftrag = upload
+    return einreihen('bild_verarbeiten', artikel_id=artikel.id, upload=upload)
@@ -0,0 +1,250 @@
+import multiprocessing
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .messung import perzentil
+from .models import Artikel, Lager, Transaction
+from .warnungen import warnungen_pruefen
+
+# Zeilen pro bulk_create beim Anlegen der Testdaten
+SCHUB = 2000
+
+
+@contextmanager
+def frische_datenbank(pfad, optionen=None):
+    """Leitet die Standard-Datenbank vorübergehend auf eine neue SQLite-Datei um und migriert sie.
+
+    Messungen laufen so reproduzierbar auf leeren Daten, die eigentliche
+    Datenbank bleibt unberührt. ``optionen`` ersetzt die ``OPTIONS`` der
+    Verbindung (``None``: die aus den Settings).
+    """
+    einstellungen = connections.settings['default']
+    vorher = {'NAME': einstellungen['NAME'], 'OPTIONS': einstellungen['OPTIONS']}
+    connections.close_all()
+    einstellungen['NAME'] = Path(pfad)
+    if optionen is not None:
+        einstellungen['OPTIONS'] = optionen
+    try:
+        call_command('migrate', verbosity=0)
+        yield
+    finally:
+        connections.close_all()
+        einstellungen.update(vorher)
+
+
+@contextmanager
+def eigener_cache():
+    """Leitet den Standard-Cache vorübergehend auf einen eigenen Namensraum um.
+
+    Wie bei ``frische_datenbank`` bleiben die Einträge des laufenden Betriebs
+    unberührt: die Messung liest und schreibt nur Schlüssel mit eigenem
+    ``KEY_PREFIX`` (bei LocMem zusätzlich in einem eigenen Speicher).
+    """
+    namensraum = f'bench-{uuid.uuid4().hex}'
+    konfiguration = {**settings.CACHES['default'], 'KEY_PREFIX': namensraum}
+    if konfiguration['BACKEND'].endswith('LocMemCache'):
+        konfiguration['LOCATION'] = namensraum
+    with override_settings(CACHES={**settings.CACHES, 'default': konfiguration}):
+        yield
+
+
+def cache_verwerfen():
+    """Lässt alle bisherigen Einträge des Standard-Caches ins Leere laufen.
+
+    Statt ``cache.clear()`` (leert bei Redis die ganze Datenbank) wird die
+    Schlüsselversion erhöht; alte Einträge laufen über ihren Timeout ab.
+    """
+    cache.version += 1
+
+
+def daten_anlegen(lager=5, artikel=200, buchungen=1000, benutzer=5, seed=0):
+    """Legt synthetische Daten an: je Lager ``benutzer`` Mitglieder, ``artikel`` Artikel und ``buchungen`` Buchungen.
+
+    Die Bestände ergeben sich aus den erzeugten Buchungen, ein Teil der
+    Artikel hat einen Mindestbestand (mit passenden offenen Warnungen).
+    Liefert ``[(lager_id, [benutzer_ids], [artikel_ids]), ...]``.
+    """
+    zufall = random.Random(seed)
+    lauf = User.objects.count()
+    nutzer = User.objects.bulk_create(
+        User(username=f'bench-{lauf}-{i}', password='!') for i in range(lager * benutzer)
+    )
+    lager_liste = Lager.objects.bulk_create(
+        Lager(name=f'Lager {i + 1}', owner=nutzer[i * benutzer]) for i in range(lager)
+    )
+    Lager.users.through.objects.bulk_create(
+        [
+            Lager.users.through(lager_id=l.id, user_id=u.id)
+            for i, l in enumerate(lager_liste) for u in nutzer[i * benutzer:(i + 1) * benutzer]
+        ],
+        batch_size=SCHUB,
+    )
+
+    ergebnis = []
+    for i, l in enumerate(lager_liste):
+        neue = Artikel.objects.bulk_create(
+            [
+                Artikel(
+                    lager_id=l.id, name=f'Artikel {n:05d}', menge=0,
+                    mindestbestand=zufall.choice([0, 0, 0, 5, 20]),
+                )
+                for n in range(artikel)
+            ],
+            batch_size=SCHUB,
+        )
+        bestand = dict.fromkeys((a.id for a in neue), 0)
+        journal = []
+        for _ in range(buchungen):
+            artikel_id = zufall.choice(neue).id
+            menge = zufall.randint(1, 20)
+            typ = 'out' if bestand[artikel_id] >= menge and zufall.random() < 0.4 else 'in'
+            bestand[artikel_id] += menge if typ == 'in' else -menge
+            journal.append(Transaction(article_id=artikel_id, lager_id=l.id, type=typ, quantity=menge))
+        Transaction.objects.bulk_create(journal, batch_size=SCHUB)
+        for a in neue:
+            a.menge = bestand[a.id]
+        Artikel.objects.bulk_update(neue, ['menge'], batch_size=SCHUB)
+        warnungen_pruefen(l.id)
+        ergebnis.append((l.id, [u.id for u in nutzer[i * benutzer:(i + 1) * benutzer]], [a.id for a in neue]))
+    return ergebnis
+
+
+def auswerten(messungen, dauer):
+    """Fasst ``[(sekunden, abfragen, status), ...]`` zu Latenz-Perzentilen, Abfragen und Durchsatz zusammen."""
+    zeiten = sorted(sekunden * 1000 for sekunden, _, _ in messungen)
+    anzahl = len(messungen)
+    status = {}
+    for _, _, code in messungen:
+        status[str(code)] = status.get(str(code), 0) + 1
+    return {
+        'requests': anzahl,
+        'p50_ms': _runden(perzentil(zeiten, 50)),
+        'p95_ms': _runden(perzentil(zeiten, 95)),
+        'p99_ms': _runden(perzentil(zeiten, 99)),
+        'max_ms': _runden(zeiten[-1] if zeiten else None),
+        'abfragen_je_request': _runden(sum(a for _, a, _ in messungen) / anzahl if anzahl else None),
+        'requests_je_sekunde': _runden(anzahl / dauer if dauer else None),
+        'status': status,
+    }
+
+
+def _runden(wert):
+    return None if wert is None else round(wert, 2)
+
+
+def _messen(client, methode, url, daten=None, kalt=False):
+    if kalt:
+        cache_verwerfen()
+    with CaptureQueriesContext(connection) as abfragen:
+        start = time.perf_counter()
+        antwort = getattr(client, methode)(url, daten)
+        dauer = time.perf_counter() - start
+    return dauer, len(abfragen), antwort.status_code
+
+
+def _client(user_id):
+    client = Client()
+    client.force_login(User.objects.get(id=user_id))
+    return client
+
+
+def views_messen(daten, anfragen=50, kalt=False, seed=0):
+    """Ruft ``lager_list``, ``current_status`` und ``artikel_management`` je ``anfragen``-mal auf.
+
+    Lager und Benutzer wechseln reihum. ``kalt`` leert vor jedem Request den
+    Cache und misst damit den Weg ohne Kennzahlen- und Fragment-Cache.
+    """
+    zufall = random.Random(seed)
+    clients = {user_id: _client(user_id) for _, benutzer, _ in daten for user_id in benutzer[:2]}
+    seiten = {
+        'lager_list': lambda lager_id: reverse('lager_list'),
+        'current_status': lambda lager_id: reverse('current_status', args=[lager_id]),
+        'artikel_management': lambda lager_id: reverse('artikel_management', args=[lager_id]),
+    }
+    ergebnisse = {}
+    for name, url in seiten.items():
+        messungen = []
+        start = time.perf_counter()
+        for i in range(anfragen):
+            lager_id, benutzer, _ = daten[i % len(daten)]
+            client = clients[zufall.choice(benutzer[:2])]
+            messungen.append(_messen(client, 'get', url(lager_id), kalt=kalt))
+        ergebnisse[name] = auswerten(messungen, time.perf_counter() - start)
+    return ergebnisse
+
+
+def anmeldung_messen(daten, anfragen=50, seed=0):
+    """Aufwand der Anmeldung je Request, gemessen an ``statistik`` (ohne eigene Abfragen).
+
+    ``vorher``: Sessions in der Datenbank, Benutzer je Request geladen (Django-
+    Standard); ``nachher``: Session- und Benutzer-Cache laut Settings.
+    """
+    varianten = {
+        'vorher': {'SESSION_ENGINE': 'django.contrib.sessions.backends.db', 'AUTH_BENUTZER_CACHE': 0},
+        'nachher': {},
+    }
+    benutzer = [user_id for _, ids, _ in daten for user_id in ids[:2]]
+    # Messbenutzer als Staff, sonst antwortet ``statistik`` mit 403
+    User.objects.filter(id__in=benutzer).update(is_staff=True)
+    ergebnisse = {}
+    for name, einstellungen in varianten.items():
+        # Clients erst hier anlegen: die Session-Middleware liest SESSION_ENGINE beim ersten Request
+        with override_settings(**einstellungen):
+            zufall = random.Random(seed)
+            clients = {user_id: _client(user_id) for user_id in benutzer}
+            messungen = []
+            start = time.perf_counter()
+            for _ in range(anfragen):
+                messungen.append(_messen(clients[zufall.choice(benutzer)], 'get', reverse('statistik')))
+            ergebnisse[name] = auswerten(messungen, time.perf_counter() - start)
+    return ergebnisse
+
+
+def _buchen(auftrag):
+    """Arbeitet die Buchungen eines Prozesses ab (läuft im Kindprozess)."""
+    lager_id, user_id, artikel_ids, anzahl, seed = auftrag
+    zufall = random.Random(seed)
+    try:
+        client = _client(user_id)
+        url = reverse('transaction', args=[lager_id])
+        messungen = []
+        for _ in range(anzahl):
+            buchung = {
+                'transaction_type': 'out' if zufall.random() < 0.3 else 'in',
+                'article': zufall.choice(artikel_ids),
+                'quantity': zufall.randint(1, 5),
+            }
+            messungen.append(_messen(client, 'post', url, buchung))
+        return messungen
+    finally:
+        connections.close_all()
+
+
+def buchungen_messen(daten, prozesse=4, je_prozess=50, seed=0):
+    """Bucht aus ``prozesse`` parallelen Prozessen über den ``transaction``-View.
+
+    Die Prozesse werden geforkt und erben so die (umgeleitete) Datenbank-
+    Konfiguration; jeder öffnet seine eigene Verbindung. Die Prozesse buchen
+    reihum in verschiedene Lager, treffen aber bewusst auch dieselben Artikel.
+    """
+    auftraege = []
+    for i in range(prozesse):
+        lager_id, benutzer, artikel_ids = daten[i % len(daten)]
+        auftraege.append((lager_id, benutzer[i % len(benutzer)], artikel_ids, je_prozess, seed + i))
+    connections.close_all()
+    start = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(prozesse) as pool:
+        messungen = [m for teil in pool.map(_buchen, auftraege) for m in teil]
+    return auswerten(messungen, time.perf_counter() - start)
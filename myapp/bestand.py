@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Sum, When
+from django.utils import timezone
+
+from .models import ArchivBuchung, BestandsSnapshot, Transaction
+
+
+def saldo():
+    """Summe der Buchungen mit Vorzeichen: Eingänge positiv, Ausgänge negativ."""
+    return Sum(Case(
+        When(type='in', then=F('quantity')),
+        default=-F('quantity'),
+        output_field=IntegerField(),
+    ))
+
+
+def letzter_snapshot(lager, zeitpunkt):
+    """Liefert den Stichtag des letzten Snapshots eines Lagers bis ``zeitpunkt`` oder None."""
+    return BestandsSnapshot.objects.filter(
+        lager=lager, stichtag__lte=zeitpunkt
+    ).aggregate(stichtag=Max('stichtag'))['stichtag']
+
+
+def bestand_am(lager, zeitpunkt):
+    """Berechnet den Bestand aller Artikel eines Lagers zum ``zeitpunkt``.
+
+    Ausgangspunkt ist der nächstgelegene frühere Snapshot; darauf werden nur die
+    Buchungen zwischen Snapshot und ``zeitpunkt`` addiert. Ohne Snapshot wird
+    das Journal (samt Archiv) von Anfang an summiert. Ergebnis: ``{artikel_id: menge}``.
+    Buchungen gelöschter Artikel, die der Hintergrundauftrag noch nicht
+    bereinigt hat, zählen nicht mit.
+    """
+    stichtag = letzter_snapshot(lager, zeitpunkt)
+
+    bestand = {}
+    zeitraum = {'date__lte': zeitpunkt}
+    if stichtag is not None:
+        bestand.update(
+            BestandsSnapshot.objects.filter(lager=lager, stichtag=stichtag).values_list('artikel_id', 'menge')
+        )
+        zeitraum['date__gt'] = stichtag
+
+    # Archivierte Buchungen zählen mit, wenn der Zeitraum vor die Archivgrenze reicht
+    artikel_ids = lager.artikel.values('id')
+    for buchungen in (Transaction.objects.filter(lager=lager), ArchivBuchung.objects.filter(lager_id=lager.id)):
+        deltas = buchungen.filter(article_id__in=artikel_ids, **zeitraum).values('article_id').annotate(delta=saldo()).values_list('article_id', 'delta')
+        for artikel_id, delta in deltas:
+            bestand[artikel_id] = bestand.get(artikel_id, 0) + delta
+    return bestand
+
+
+def erstelle_snapshot(lager, stichtag=None):
+    """Schreibt den aus dem Journal berechneten Bestand zum ``stichtag`` fest.
+
+    Ein bereits vorhandener Snapshot desselben Stichtags wird ersetzt.
+    """
+    stichtag = stichtag or timezone.now()
+    bestand = bestand_am(lager, stichtag)
+
+    with transaction.atomic():
+        BestandsSnapshot.objects.filter(lager=lager, stichtag=stichtag).delete()
+        return BestandsSnapshot.objects.bulk_create(
+            [
+                BestandsSnapshot(lager=lager, artikel_id=artikel_id, stichtag=stichtag, menge=menge)
+                for artikel_id, menge in bestand.items()
+            ],
+            batch_size=1000,
+        )
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import warnings
+from functools import lru_cache
+from io import BytesIO
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from PIL import Image, ImageOps, features
+
+# Originale werden beim Verarbeiten auf diese Kantenlänge begrenzt
+MAX_ORIGINAL = 2000
+# Kantenlängen der Vorschaubilder: Liste (80 px, doppelt für hochauflösende Displays) und Bearbeiten
+THUMBNAIL_GROESSEN = (160, 400)
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+THUMBNAIL_ENDUNG = '.webp' if THUMBNAIL_FORMAT == 'WEBP' else '.jpg'
+
+
+class InhaltsSpeicher(FileSystemStorage):
+    """Speichert Dateien unter dem SHA-256 ihres Inhalts.
+
+    Identische Uploads landen in derselben Datei (``fotos/ab/abcdef….png``)
+    und werden nur einmal geschrieben.
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        hasher = hashlib.sha256()
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        content.seek(0)
+
+        digest = hasher.hexdigest()
+        verzeichnis, dateiname = os.path.split(name)
+        ziel = os.path.join(verzeichnis, digest[:2], digest + os.path.splitext(dateiname)[1].lower())
+        if self.exists(ziel):
+            return ziel
+        return super().save(ziel, content, max_length=max_length)
+
+
+_foto_speicher = InhaltsSpeicher()
+
+
+def foto_speicher():
+    """Storage für ``Artikel.foto`` (als Callable, damit Migrationen stabil bleiben)."""
+    return _foto_speicher
+
+
+def thumbnail_name(name, groesse):
+    """Pfad des Vorschaubilds zu ``name`` mit maximaler Kantenlänge ``groesse``."""
+    return f'thumbs/{os.path.splitext(name)[0]}_{groesse}{THUMBNAIL_ENDUNG}'
+
+
+def erzeuge_thumbnail(name, groesse):
+    """Rechnet ein Vorschaubild (EXIF-Drehung angewendet, Metadaten entfernt) und speichert es.
+
+    Ein vorhandenes Vorschaubild bleibt stehen: es hängt nur vom Inhalt des
+    Originals ab, das unter seinem Namen nie wechselt. Schreiben zwei Worker
+    gleichzeitig, wird die zweite Datei wieder gelöscht statt der ersten.
+    """
+    ziel = thumbnail_name(name, groesse)
+    if default_storage.exists(ziel):
+        return ziel
+    with _foto_speicher.open(name) as datei:
+        bild = ImageOps.exif_transpose(_oeffnen(datei))
+        bild.thumbnail((groesse, groesse))
+        if THUMBNAIL_FORMAT == 'JPEG' or bild.mode not in ('RGB', 'RGBA'):
+            bild = bild.convert('RGB' if THUMBNAIL_FORMAT == 'JPEG' else 'RGBA')
+        puffer = BytesIO()
+        bild.save(puffer, THUMBNAIL_FORMAT, quality=80)
+    gespeichert = default_storage.save(ziel, ContentFile(puffer.getvalue()))
+    if gespeichert != ziel:
+        default_storage.delete(gespeichert)
+    return ziel
+
+
+def erzeuge_thumbnails(name):
+    """Erzeugt alle fehlenden Vorschaugrößen; läuft im Worker (siehe ``verarbeite_upload``)."""
+    for groesse in THUMBNAIL_GROESSEN:
+        erzeuge_thumbnail(name, groesse)
+
+
+# Vorhandene Vorschaubilder können dauerhaft gemerkt werden (spart den
+# exists()-Aufruf je Listenzeile); fehlende nicht, lru_cache merkt keine Ausnahmen
+@lru_cache(maxsize=4096)
+def _thumbnail_vorhanden(name, groesse):
+    ziel = thumbnail_name(name, groesse)
+    if not default_storage.exists(ziel):
+        raise FileNotFoundError(ziel)
+    return ziel
+
+
+def thumbnail_url(name, groesse=THUMBNAIL_GROESSEN[0]):
+    """URL des Vorschaubilds, solange es (noch) fehlt die des Originals.
+
+    Im Request wird nie gerechnet: Vorschaubilder entstehen im Worker beim
+    Upload, für ältere Bilder mit ``manage.py fotos_deduplizieren``.
+    """
+    if not name:
+        return None
+    try:
+        return default_storage.url(_thumbnail_vorhanden(name, groesse))
+    except FileNotFoundError:
+        return _foto_speicher.url(name)
+
+
+def _oeffnen(datei):
+    """``Image.open``, das auch die Warnung vor Dekompressionsbomben als Fehler behandelt.
+
+    Pillow warnt erst ab ``Image.MAX_IMAGE_PIXELS`` und bricht ab dem
+    Doppelten ab; ein Worker soll keines von beiden dekodieren.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        return Image.open(datei)
+
+
+def verarbeite_upload(upload_name):
+    """Prüft, bereinigt und speichert ein hochgeladenes Bild; liefert den endgültigen Namen.
+
+    Läuft im Worker-Prozess, nicht im Request: Das Bild wird vollständig
+    dekodiert (ungültige Dateien und Dekompressionsbomben lösen einen Fehler aus), gemäß EXIF gedreht,
+    auf ``MAX_ORIGINAL`` verkleinert und ohne Metadaten neu kodiert. Danach
+    wird es nach Inhalt abgelegt und die Vorschaubilder werden erzeugt.
+    """
+    with default_storage.open(upload_name) as datei:
+        bild = _oeffnen(datei)
+        bild.verify()
+    with default_storage.open(upload_name) as datei:
+        bild = _oeffnen(datei)
+        bildformat = bild.format if bild.format in ('JPEG', 'PNG', 'WEBP') else 'PNG'
+        bild = ImageOps.exif_transpose(bild)
+        bild.thumbnail((MAX_ORIGINAL, MAX_ORIGINAL))
+        if bildformat == 'JPEG' and bild.mode != 'RGB':
+            bild = bild.convert('RGB')
+        puffer = BytesIO()
+        bild.save(puffer, bildformat, **({'quality': 90} if bildformat != 'PNG' else {'optimize': True}))
+
+    endung = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}[bildformat]
+    name = _foto_speicher.save(f'fotos/bild{endung}', ContentFile(puffer.getvalue()))
+    erzeuge_thumbnails(name)
+    return name
@@ -0,0 +1,81 @@
+import csv
+from datetime import datetime, time, timedelta
+
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import ArchivBuchung, Artikel, Transaction
+
+# Zeilen pro Datenbank-Abruf beim Streamen
+CHUNK_SIZE = 2000
+
+# Semikolon und BOM, damit Excel mit deutscher Ländereinstellung die Datei direkt öffnet
+TRENNZEICHEN = ';'
+BOM = '\ufeff'
+
+# Zellen mit diesen Anfangszeichen würde eine Tabellenkalkulation als Formel ausführen
+FORMELZEICHEN = ('=', '+', '-', '@', '\t', '\r')
+
+
+class _Puffer:
+    """Dateiähnliches Objekt, das geschriebene Zeilen direkt zurückgibt statt sie zu sammeln."""
+
+    def write(self, wert):
+        return wert
+
+
+def _entschaerfen(wert):
+    """Stellt Texten, die wie eine Formel beginnen, ein ``'`` voran (CSV-Injection)."""
+    if isinstance(wert, str) and wert.startswith(FORMELZEICHEN):
+        return "'" + wert
+    return wert
+
+
+def csv_stream(zeilen):
+    """Erzeugt die CSV-Ausgabe Zeile für Zeile (konstanter Speicherbedarf)."""
+    writer = csv.writer(_Puffer(), delimiter=TRENNZEICHEN)
+    yield BOM
+    for zeile in zeilen:
+        yield writer.writerow([_entschaerfen(wert) for wert in zeile])
+
+
+def bestand_zeilen(lager, using=None):
+    yield ['Artikel-ID', 'Artikel', 'Menge']
+    yield from lager.artikel.using(using).order_by('name').values_list('id', 'name', 'menge').iterator(chunk_size=CHUNK_SIZE)
+
+
+def transaktions_zeilen(lager, von=None, bis=None, using=None):
+    """Buchungen eines Lagers im Zeitraum samt Archiv, sortiert über die (lager, date)-Indizes.
+
+    ``using`` legt die Datenbank fest (z. B. ein Lesereplikat), sonst entscheidet der Router.
+    """
+    zeitraum = {}
+    if von:
+        zeitraum['date__gte'] = von
+    if bis:
+        zeitraum['date__lte'] = bis
+    spalten = ['date', 'id', 'article_id', 'artikel_name', 'type', 'quantity']
+    archiv = ArchivBuchung.objects.using(using).filter(lager_id=lager.id, **zeitraum).annotate(
+        artikel_name=Subquery(Artikel.objects.filter(id=OuterRef('article_id')).values('name')[:1])
+    ).values_list(*spalten)
+    journal = Transaction.objects.using(using).filter(lager=lager, **zeitraum).annotate(
+        artikel_name=F('article__name')
+    ).values_list(*spalten)
+
+    yield ['Datum', 'Artikel-ID', 'Artikel', 'Typ', 'Menge']
+    zeilen = archiv.union(journal, all=True).order_by('date', 'id').iterator(chunk_size=CHUNK_SIZE)
+    for datum, _, artikel_id, name, typ, menge in zeilen:
+        yield [timezone.localtime(datum).strftime('%d.%m.%Y %H:%M:%S'), artikel_id, name, typ, menge]
+
+
+def tagesgrenzen(von=None, bis=None):
+    """Wandelt ``YYYY-MM-DD`` in Beginn (``von``) bzw. Ende (``bis``) des Tages um.
+
+    Leere Werte bleiben None; ungültige Daten lösen ``ValueError`` aus.
+    """
+    def tag(wert):
+        return datetime.strptime(wert, '%Y-%m-%d').date()
+
+    beginn = timezone.make_aware(datetime.combine(tag(von), time.min)) if von else None
+    ende = timezone.make_aware(datetime.combine(tag(bis) + timedelta(days=1), time.min)) - timedelta(microseconds=1) if bis else None
+    return beginn, ende
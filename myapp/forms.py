@@ -1,5 +1,10 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from django.core.validators import FileExtensionValidator
+from django.db.models import Q
 from .models import Lager, Artikel, Transaction
+from .scanner import code_normalisieren
+from .services import MAX_MENGE, MENGE_ZU_GROSS
 
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
@@ -14,6 +19,33 @@ class CustomUserCreationForm(UserCreationForm):
         model = User
         fields = ['username', 'first_name', 'last_name', 'email', 'password1', 'password2']
 
+    def clean_username(self):
+        # Geprüft wird zusammen mit der E-Mail-Adresse in clean(), mit einer Abfrage statt zweier
+        return self.cleaned_data.get('username')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        username, email = cleaned_data.get('username'), cleaned_data.get('email')
+        if username or email:
+            vorhanden = User.objects.filter(
+                Q(username__iexact=username or '') | Q(email__iexact=email or '')
+            ).values_list('username', 'email')[:2]
+            for vorhandener_name, vorhandene_email in vorhanden:
+                if username and vorhandener_name.lower() == username.lower():
+                    self.add_error('username', forms.ValidationError(
+                        'Dieser Benutzername ist bereits vergeben. Bitte wähle einen anderen.', code='vergeben'
+                    ))
+                elif email and vorhandene_email.lower() == email.lower():
+                    self.add_error('email', forms.ValidationError(
+                        'Diese E-Mail-Adresse ist bereits registriert. Bitte benutze eine andere.', code='vergeben'
+                    ))
+        return cleaned_data
+
+    def validate_unique(self):
+        # Der Benutzername ist in clean() schon (ohne Groß-/Kleinschreibung) geprüft; gleichzeitige
+        # Registrierungen fängt der Unique-Index beim Speichern ab
+        pass
+
     def save(self, commit=True):
         # Benutzername, Vorname, Nachname und E-Mail setzen
         user = super().save(commit=False)
@@ -32,16 +64,63 @@ class LagerForm(forms.ModelForm):
         fields = ['name']
 
 
+def menge_pruefen(menge):
+    if menge < 0:
+        raise forms.ValidationError('Die Menge darf nicht negativ sein.')
+    # Der Bestand wird als Buchung ins Journal geschrieben
+    if menge > MAX_MENGE:
+        raise forms.ValidationError(MENGE_ZU_GROSS)
+
+
+# Obergrenze für hochgeladene Artikelbilder
+BILD_MAX_BYTES = 20 * 1024 * 1024
+
+
 class ArtikelForm(forms.ModelForm):
     class Meta:
         model = Artikel
-        fields = ['name', 'menge', 'foto']
+        fields = ['name', 'code', 'menge', 'mindestbestand']
 
-    # Optionales Bildfeld bleibt im Formular leer, wenn kein Bild hochgeladen wird
-    foto = forms.ImageField(required=False)  # optionales Fotofeld
+    # Optionales Bildfeld bleibt im Formular leer, wenn kein Bild hochgeladen wird.
+    # Bewusst kein ImageField: Das Bild wird erst im Worker dekodiert und geprüft (myapp.auftraege).
+    foto = forms.FileField(
+        required=False,
+        validators=[FileExtensionValidator(['jpg', 'jpeg', 'png', 'webp', 'gif'])],
+        widget=forms.ClearableFileInput(attrs={'accept': 'image/*'}),
+    )
+
+    def clean_foto(self):
+        foto = self.cleaned_data['foto']
+        # Ohne Upload liefert das Feld das vorhandene Bild (initial), das nicht erneut geprüft wird
+        if isinstance(foto, UploadedFile) and foto.size > BILD_MAX_BYTES:
+            raise forms.ValidationError('Das Bild ist zu groß (maximal 20 MB).')
+        return foto
+
+    # Leer gelassen heißt: Bestand wird nicht überwacht
+    mindestbestand = forms.IntegerField(min_value=0, required=False, initial=0)
+
+    def clean_mindestbestand(self):
+        return self.cleaned_data['mindestbestand'] or 0
+
+    def clean_code(self):
+        # Leer bleibt None, damit der eindeutige Teilindex (lager, code) den Artikel auslässt
+        return code_normalisieren(self.cleaned_data['code'])
+
+    def clean_menge(self):
+        menge = self.cleaned_data['menge']
+        menge_pruefen(menge)
+        return menge
 
 
 class TransactionForm(forms.ModelForm):
     class Meta:
         model = Transaction
         fields = ['article', 'type', 'quantity']
+
+
+class ArtikelImportForm(forms.Form):
+    datei = forms.FileField(
+        label='CSV-Datei',
+        validators=[FileExtensionValidator(['csv', 'txt'])],
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv,text/csv', 'class': 'form-control'}),
+    )
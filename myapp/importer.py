@@ -0,0 +1,133 @@
+import codecs
+import csv
+import io
+
+from django import forms
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .forms import ArtikelForm, menge_pruefen
+from .live import melden
+from .models import Artikel, Transaction
+from .seitencache import lager_geaendert
+from .warnungen import warnungen_pruefen
+
+# Zeilen pro Upsert-Schub (eine Lese-, eine Upsert- und eine Journalabfrage je Schub)
+CHUNK_SIZE = 1000
+
+# Höchstens so viele Fehlermeldungen werden gesammelt
+MAX_FEHLER = 1000
+
+# Zeilen, die kein UTF-8 sind, stammen meist aus Excel unter Windows;
+# latin-1 ordnet jedem Byte ein Zeichen zu und kann nicht fehlschlagen
+KODIERUNGEN = ('utf-8', 'cp1252', 'latin-1')
+
+
+def importiere_artikel(lager, datei, chunk_size=CHUNK_SIZE):
+    """Importiert Artikel aus einer CSV-Datei (Spalten ``name`` und ``menge``).
+
+    Die Datei wird zeilenweise gelesen und nach den Regeln des ``ArtikelForm``
+    geprüft. Gültige Zeilen werden schubweise per ``bulk_create(update_conflicts=True)``
+    über (lager, name) angelegt oder aktualisiert; Bestandsänderungen werden
+    als Buchungen ins Journal geschrieben. ``datei`` ist ein Binär- oder Textstrom;
+    Binärdaten werden zeilenweise als UTF-8 gelesen, ersatzweise als cp1252.
+    """
+    zeilen = iter(datei) if isinstance(datei, io.TextIOBase) else _textzeilen(datei)
+
+    kopf = next(zeilen, '')
+    trennzeichen = ';' if kopf.count(';') >= kopf.count(',') else ','
+    spalten = [spalte.strip().lower() for spalte in next(csv.reader([kopf], delimiter=trennzeichen), [])]
+    ergebnis = {'angelegt': 0, 'aktualisiert': 0, 'unveraendert': 0, 'fehler': []}
+    if 'name' not in spalten or 'menge' not in spalten:
+        ergebnis['fehler'].append((1, 'Die Kopfzeile muss die Spalten "name" und "menge" enthalten.'))
+        return ergebnis
+
+    name_feld = ArtikelForm.base_fields['name']
+    menge_feld = ArtikelForm.base_fields['menge']
+    schub = {}
+    for nummer, zeile in enumerate(csv.DictReader(zeilen, fieldnames=spalten, delimiter=trennzeichen), start=2):
+        try:
+            name = name_feld.clean((zeile.get('name') or '').strip())
+            menge = menge_feld.clean((zeile.get('menge') or '').strip())
+            menge_pruefen(menge)
+        except forms.ValidationError as e:
+            if len(ergebnis['fehler']) < MAX_FEHLER:
+                ergebnis['fehler'].append((nummer, ' '.join(e.messages)))
+            continue
+        schub[name] = menge  # Doppelte Namen: die letzte Zeile gewinnt
+        if len(schub) >= chunk_size:
+            _schub_speichern(lager, schub, ergebnis)
+            schub = {}
+    if schub:
+        _schub_speichern(lager, schub, ergebnis)
+    if ergebnis['angelegt'] or ergebnis['aktualisiert']:
+        # Mindestbestände einmal mengenbasiert für das ganze Lager prüfen statt je Zeile
+        warnungen_pruefen(lager.id)
+        # Zu viele Einzeländerungen für Deltas: offene Seiten laden einmal neu
+        melden(lager.id, 'neu_laden')
+    return ergebnis
+
+
+def _textzeilen(datei):
+    for nummer, zeile in enumerate(datei):
+        if nummer == 0 and zeile.startswith(codecs.BOM_UTF8):
+            zeile = zeile[len(codecs.BOM_UTF8):]
+        for kodierung in KODIERUNGEN:
+            try:
+                yield zeile.decode(kodierung)
+                break
+            except UnicodeDecodeError:
+                continue
+
+
+def _schub_speichern(lager, schub, ergebnis):
+    with transaction.atomic():
+        vorher = dict(
+            Artikel.objects.select_for_update().filter(lager=lager, name__in=schub).values_list('name', 'menge')
+        )
+        ergebnis['unveraendert'] += sum(1 for name, menge in schub.items() if vorher.get(name) == menge)
+        # Unveränderte Zeilen gar nicht erst schreiben; lager_id statt lager spart
+        # je Zeile den Umweg über den Relations-Deskriptor
+        artikel = [
+            Artikel(lager_id=lager.id, name=name, menge=menge)
+            for name, menge in schub.items() if vorher.get(name) != menge
+        ]
+        Artikel.objects.bulk_create(
+            artikel, update_conflicts=True, unique_fields=['lager', 'name'], update_fields=['menge'],
+        )
+        if artikel:
+            lager_geaendert(lager.id)
+
+        buchungen = []
+        neu = []
+        for a in artikel:
+            if a.name not in vorher:
+                ergebnis['angelegt'] += 1
+                if a.menge:
+                    neu.append(a.name)
+                continue
+            differenz = a.menge - vorher[a.name]
+            ergebnis['aktualisiert'] += 1
+            buchungen.append(Transaction(
+                article_id=a.pk, lager_id=lager.id, type='in' if differenz > 0 else 'out', quantity=abs(differenz),
+            ))
+        Transaction.objects.bulk_create(buchungen)
+        if neu:
+            _anfangsbestaende_buchen(lager, neu)
+
+
+def _anfangsbestaende_buchen(lager, namen):
+    """Bucht den Anfangsbestand neu angelegter Artikel mengenbasiert mit einem INSERT ... SELECT.
+
+    Beim Anlegen eines neuen Lagers ist das der Großteil der Buchungen; ohne
+    Modellinstanzen je Zeile halbiert sich die Importzeit in etwa.
+    """
+    qn = connection.ops.quote_name
+    platzhalter = ', '.join(['%s'] * len(namen))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {qn(Transaction._meta.db_table)} (article_id, lager_id, type, quantity, date) "
+            f"SELECT id, lager_id, 'in', menge, %s FROM {qn(Artikel._meta.db_table)} "
+            f"WHERE lager_id = %s AND menge > 0 AND name IN ({platzhalter})",
+            [connection.ops.adapt_datetimefield_value(timezone.now()), lager.id, *namen],
+        )
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Artikel, Lager, Transaction, Warnung
+
+# Die Zeitfenster (7/30 Tage) verschieben sich auch ohne Buchung, daher zusätzlich ein Ablauf
+CACHE_TIMEOUT = 300
+FELDER = [
+    'personen', 'artikel_anzahl', 'gesamtmenge', 'ohne_bestand', 'offene_warnungen',
+    'eingang_7', 'ausgang_7', 'eingang_30', 'ausgang_30',
+]
+
+
+def _cache_key(lager_id):
+    return f'lager:{lager_id}:kennzahlen'
+
+
+def _je_lager(queryset, aggregat):
+    """Korrelierte Unterabfrage: ``aggregat`` über ``queryset`` für das jeweilige Lager."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(lager_id=OuterRef('pk')).order_by().values('lager_id')
+            .annotate(wert=aggregat).values('wert'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def _berechnen(lager_ids):
+    """Alle Kennzahlen für ``lager_ids`` mit einer einzigen Abfrage."""
+    jetzt = timezone.now()
+    vor_7, vor_30 = jetzt - timedelta(days=7), jetzt - timedelta(days=30)
+    buchungen_30 = Transaction.objects.filter(date__gte=vor_30)
+
+    def volumen(typ, seit):
+        return _je_lager(buchungen_30, Sum('quantity', filter=Q(type=typ, date__gte=seit)))
+
+    # Das Ergebnis wird gecacht und darf nicht von einem nachhinkenden Lesereplikat stammen
+    zeilen = Lager.objects.using(DEFAULT_DB_ALIAS).filter(id__in=lager_ids).annotate(
+        personen=_je_lager(Lager.users.through.objects.all(), Count('*')),
+        artikel_anzahl=_je_lager(Artikel.objects.all(), Count('*')),
+        gesamtmenge=_je_lager(Artikel.objects.all(), Sum('menge')),
+        ohne_bestand=_je_lager(Artikel.objects.filter(menge=0), Count('*')),
+        offene_warnungen=_je_lager(Warnung.objects.filter(erledigt__isnull=True), Count('*')),
+        eingang_7=volumen('in', vor_7),
+        ausgang_7=volumen('out', vor_7),
+        eingang_30=volumen('in', vor_30),
+        ausgang_30=volumen('out', vor_30),
+    ).values('id', *FELDER)
+    return {zeile.pop('id'): zeile for zeile in zeilen}
+
+
+def kennzahlen(lager_ids):
+    """Kennzahlen je Lager (``{lager_id: {feld: wert}}``), aus dem Cache oder frisch berechnet.
+
+    Fehlende Einträge werden gemeinsam mit einer Abfrage nachgeladen.
+    """
+    lager_ids = list(lager_ids)
+    gecacht = cache.get_many([_cache_key(i) for i in lager_ids])
+    ergebnis = {i: gecacht[_cache_key(i)] for i in lager_ids if _cache_key(i) in gecacht}
+
+    fehlend = [i for i in lager_ids if i not in ergebnis]
+    if fehlend:
+        neu = _berechnen(fehlend)
+        cache.set_many({_cache_key(i): werte for i, werte in neu.items()}, CACHE_TIMEOUT)
+        ergebnis.update(neu)
+    return ergebnis
+
+
+def kennzahlen_verwerfen(lager_id):
+    """Verwirft die Kennzahlen eines Lagers, sobald die ändernde Transaktion committet ist."""
+    transaction.on_commit(lambda: cache.delete(_cache_key(lager_id)))
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Nachrichten, die ein langsamer Client höchstens zurückliegen darf; danach lädt er neu
+PUFFER = 100
+# Sekunden ohne Ereignis, nach denen ein Kommentar gesendet wird (hält Proxys offen, erkennt tote Verbindungen)
+HERZSCHLAG = 15
+
+
+class Kanal:
+    """Schnittstelle für die Verteilung von Live-Ereignissen je Lager.
+
+    ``veroeffentlichen`` wird synchron aus dem Buchungspfad aufgerufen,
+    ``abonnieren`` liefert einen async Iterator für die SSE-Verbindung mit
+    ``(ereignis, daten)`` bzw. ``None`` als Lebenszeichen, wenn länger nichts kam.
+    Andere Implementierungen (z. B. Redis Pub/Sub für mehrere Prozesse)
+    werden über ``settings.LIVE_BACKEND`` eingebunden.
+    """
+
+    def veroeffentlichen(self, lager_id, ereignis, daten):
+        raise NotImplementedError
+
+    def abonnieren(self, lager_id):
+        raise NotImplementedError
+
+
+class _Abo:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(PUFFER)
+        self.ueberlaufen = False
+
+    def zustellen(self, nachricht):
+        # Läuft in der Event-Loop des Abonnenten
+        try:
+            self.queue.put_nowait(nachricht)
+        except asyncio.QueueFull:
+            self.ueberlaufen = True
+
+
+class LokalerKanal(Kanal):
+    """Pub/Sub innerhalb eines Prozesses.
+
+    Jede offene Verbindung ist nur eine Queue in der Event-Loop, tausende
+    wartende Clients kosten also weder Threads noch Datenbankverbindungen.
+    Erreicht werden nur Clients, die am selben Prozess hängen.
+    """
+
+    def __init__(self):
+        self._abos = defaultdict(set)
+
+    def veroeffentlichen(self, lager_id, ereignis, daten):
+        for abo in list(self._abos.get(lager_id, ())):
+            try:
+                abo.loop.call_soon_threadsafe(abo.zustellen, (ereignis, daten))
+            except RuntimeError:  # Event-Loop bereits beendet
+                self._abos.get(lager_id, set()).discard(abo)
+
+    async def abonnieren(self, lager_id):
+        abo = _Abo(asyncio.get_running_loop())
+        self._abos[lager_id].add(abo)
+        try:
+            while not abo.ueberlaufen:
+                try:
+                    yield await asyncio.wait_for(abo.queue.get(), HERZSCHLAG)
+                except asyncio.TimeoutError:
+                    yield None
+            # Zu weit zurück: Der Client soll den Stand vollständig neu laden
+            yield ('neu_laden', {})
+        finally:
+            # Leere Mengen bleiben stehen (höchstens eine je Lager), so braucht es kein Lock gegen veroeffentlichen()
+            self._abos[lager_id].discard(abo)
+
+
+@lru_cache(maxsize=None)
+def kanal():
+    return import_string(getattr(settings, 'LIVE_BACKEND', 'myapp.live.LokalerKanal'))()
+
+
+def melden(lager_id, ereignis, daten=None):
+    """Verteilt ein Ereignis an die Live-Clients des Lagers, sobald die Transaktion committet ist."""
+    def senden():
+        try:
+            kanal().veroeffentlichen(lager_id, ereignis, daten or {})
+        except Exception:
+            # Live-Anzeige ist Komfort; eine Buchung darf daran nicht scheitern
+            logger.exception('Live-Ereignis für Lager %s konnte nicht verteilt werden', lager_id)
+    transaction.on_commit(senden)
+
+
+def bestand_melden(lager_id, deltas):
+    """Meldet Bestandsänderungen ``{artikel_id: differenz}``."""
+    deltas = {int(artikel_id): delta for artikel_id, delta in deltas.items() if delta}
+    if deltas:
+        melden(lager_id, 'bestand', {'artikel': [{'id': a, 'delta': d} for a, d in deltas.items()]})
+
+
+def sse(ereignis, daten):
+    return f'event: {ereignis}\ndata: {json.dumps(daten)}\n\n'
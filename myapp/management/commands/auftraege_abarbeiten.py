@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from myapp.auftraege import abarbeiten, haengende_freigeben, worker_name
+
+# So oft (Sekunden) werden auch im laufenden Betrieb hängende Aufträge anderer Worker freigegeben
+FREIGABE_INTERVALL = 60
+
+
+def _neuer_pool(prozesse):
+    # Kindprozesse dürfen die DB-Verbindung des Hauptprozesses nicht erben
+    connections.close_all()
+    return ProcessPoolExecutor(prozesse, initializer=django.setup)
+
+
+class Command(BaseCommand):
+    help = 'Arbeitet die Hintergrundaufträge (z. B. Bildverarbeitung) mit einem Prozesspool ab.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prozesse', type=int, default=2, help='Größe des Prozesspools')
+        parser.add_argument('--intervall', type=float, default=1.0, help='Wartezeit in Sekunden, wenn nichts zu tun ist')
+        parser.add_argument('--einmal', action='store_true', help='Nur bis die Warteschlange leer ist arbeiten')
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        schub = options['prozesse'] * 2
+        # Nach einem Absturz des Pools so viele Aufträge einzeln, damit der schuldige allein scheitert
+        einzeln = 0
+        naechste_freigabe = 0
+        pool = _neuer_pool(options['prozesse'])
+        try:
+            while True:
+                if time.monotonic() >= naechste_freigabe:
+                    freigegeben = haengende_freigeben()
+                    if freigegeben:
+                        self.stdout.write(f'{freigegeben} hängende Aufträge wieder freigegeben')
+                    naechste_freigabe = time.monotonic() + FREIGABE_INTERVALL
+
+                try:
+                    erledigt = abarbeiten(worker, anzahl=1 if einzeln else schub, pool=pool)
+                except BrokenProcessPool:
+                    self.stderr.write('Prozesspool abgestürzt, wird neu gestartet')
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = _neuer_pool(options['prozesse'])
+                    einzeln = einzeln - 1 if einzeln else schub
+                    continue
+
+                einzeln = max(einzeln - 1, 0)
+                if erledigt:
+                    self.stdout.write(f'{erledigt} Aufträge bearbeitet')
+                elif options['einmal']:
+                    break
+                else:
+                    time.sleep(options['intervall'])
+        finally:
+            pool.shutdown()
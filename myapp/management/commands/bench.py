@@ -0,0 +1,68 @@
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from myapp.benchmark import (
+    anmeldung_messen, buchungen_messen, daten_anlegen, eigener_cache, frische_datenbank, views_messen,
+)
+
+
+class Command(BaseCommand):
+    help = ('Benchmark der Kern-Abläufe: legt synthetische Daten an, misst lager_list, current_status, '
+            'artikel_management, den Anmelde-Aufwand je Request und parallele Buchungen und gibt Latenz-Perzentile, Abfragen je Request '
+            'und Durchsatz als JSON aus.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lager', type=int, default=5, help='Anzahl Lager')
+        parser.add_argument('--artikel', type=int, default=200, help='Artikel je Lager')
+        parser.add_argument('--buchungen', type=int, default=1000, help='Vorhandene Buchungen je Lager')
+        parser.add_argument('--benutzer', type=int, default=5, help='Mitglieder je Lager')
+        parser.add_argument('--anfragen', type=int, default=50, help='Requests je View')
+        parser.add_argument('--prozesse', type=int, default=4, help='Parallele Prozesse für Buchungen (0: keine)')
+        parser.add_argument('--je-prozess', type=int, default=50, help='Buchungen je Prozess')
+        parser.add_argument('--kalt', action='store_true', help='Cache vor jedem Request leeren')
+        parser.add_argument('--seed', type=int, default=0, help='Startwert für die Zufallsdaten')
+        parser.add_argument('--ausgabe', help='Zieldatei für das JSON; Standard: stdout')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Der Benchmark legt eine eigene SQLite-Datenbank an und ist nur dafür vorgesehen.')
+        for name in ('lager', 'artikel', 'benutzer', 'anfragen'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} muss mindestens 1 sein.')
+
+        konfiguration = {
+            name: options[name] for name in
+            ('lager', 'artikel', 'buchungen', 'benutzer', 'anfragen', 'prozesse', 'je_prozess', 'kalt', 'seed')
+        }
+        bericht = {'konfiguration': konfiguration, 'anlegen_s': None, 'ergebnisse': {}}
+        # Der Test-Client meldet sich als "testserver"
+        with tempfile.TemporaryDirectory() as verzeichnis, \
+                override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                frische_datenbank(Path(verzeichnis) / 'bench.sqlite3'), \
+                eigener_cache():
+            start = time.perf_counter()
+            daten = daten_anlegen(
+                options['lager'], options['artikel'], options['buchungen'], options['benutzer'], options['seed']
+            )
+            bericht['anlegen_s'] = round(time.perf_counter() - start, 2)
+
+            bericht['ergebnisse'] = views_messen(daten, options['anfragen'], options['kalt'], options['seed'])
+            bericht['ergebnisse']['anmeldung'] = anmeldung_messen(daten, options['anfragen'], options['seed'])
+            if options['prozesse'] > 0:
+                bericht['ergebnisse']['transaction'] = buchungen_messen(
+                    daten, options['prozesse'], options['je_prozess'], options['seed']
+                )
+
+        ausgabe = json.dumps(bericht, indent=2, ensure_ascii=False)
+        if options['ausgabe']:
+            Path(options['ausgabe']).write_text(ausgabe + '\n', encoding='utf-8')
+        else:
+            sys.stdout.write(ausgabe + '\n')
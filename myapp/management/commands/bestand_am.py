@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.bestand import bestand_am
+from myapp.models import Lager
+
+from .bestand_snapshot import stichtag_ende
+
+
+class Command(BaseCommand):
+    help = 'Gibt den Bestand eines Lagers zu einem Stichtag aus (z. B. für die Inventur).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('lager_id', type=int)
+        parser.add_argument('stichtag', help='Stichtag YYYY-MM-DD (Bestand am Tagesende)')
+
+    def handle(self, *args, **options):
+        try:
+            lager = Lager.objects.get(id=options['lager_id'])
+        except Lager.DoesNotExist:
+            raise CommandError(f'Lager {options["lager_id"]} existiert nicht.')
+
+        bestand = bestand_am(lager, stichtag_ende(options['stichtag']))
+        namen = dict(lager.artikel.filter(id__in=bestand).values_list('id', 'name'))
+        for artikel_id, menge in sorted(bestand.items(), key=lambda eintrag: namen.get(eintrag[0], '')):
+            self.stdout.write(f'{namen.get(artikel_id, artikel_id)};{menge}')
@@ -0,0 +1,38 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from myapp.bestand import erstelle_snapshot
+from myapp.models import Lager
+
+
+def stichtag_ende(datum):
+    """Wandelt ein Datum ``YYYY-MM-DD`` in das Ende dieses Tages (lokale Zeit) um."""
+    try:
+        tag = datetime.strptime(datum, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Ungültiges Datum: {datum!r} (erwartet YYYY-MM-DD)')
+    return timezone.make_aware(datetime.combine(tag + timedelta(days=1), time.min)) - timedelta(microseconds=1)
+
+
+class Command(BaseCommand):
+    help = 'Schreibt den Bestand aller (oder ausgewählter) Lager zu einem Stichtag fest.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lager', type=int, action='append', help='ID eines Lagers (mehrfach möglich)')
+        parser.add_argument('--stichtag', help='Stichtag YYYY-MM-DD (Tagesende); Standard: Ende des Vortags')
+
+    def handle(self, *args, **options):
+        if options['stichtag']:
+            stichtag = stichtag_ende(options['stichtag'])
+        else:
+            stichtag = timezone.make_aware(datetime.combine(timezone.localdate(), time.min)) - timedelta(microseconds=1)
+
+        lager_qs = Lager.objects.all()
+        if options['lager']:
+            lager_qs = lager_qs.filter(id__in=options['lager'])
+
+        for lager in lager_qs.iterator():
+            snapshots = erstelle_snapshot(lager, stichtag)
+            self.stdout.write(f'{lager.name}: {len(snapshots)} Artikel zum {stichtag:%d.%m.%Y} festgeschrieben')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.archiv import MIN_MONATE, SCHUB, archivgrenze, archivieren
+from myapp.models import Lager
+
+
+class Command(BaseCommand):
+    help = ('Verschiebt Buchungen, die älter als N Monate sind, schubweise ins Archiv und schreibt '
+            'den Bestand an der Archivgrenze als Snapshot fest.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--monate', type=int, default=12, help='Buchungen vor dem Beginn des Monats vor N Monaten archivieren')
+        parser.add_argument('--lager', type=int, action='append', help='ID eines Lagers (mehrfach möglich)')
+        parser.add_argument('--schub', type=int, default=SCHUB, help='Buchungen je Transaktion')
+
+    def handle(self, *args, **options):
+        # Kennzahlen und Prognosen sollen weiter aus dem Journal allein kommen
+        if options['monate'] < MIN_MONATE:
+            raise CommandError(f'--monate muss mindestens {MIN_MONATE} sein.')
+        if options['schub'] < 1:
+            raise CommandError('--schub muss mindestens 1 sein.')
+        grenze = archivgrenze(options['monate'])
+
+        lager_qs = Lager.objects.all()
+        if options['lager']:
+            lager_qs = lager_qs.filter(id__in=options['lager'])
+
+        for lager in lager_qs.iterator():
+            anzahl = archivieren(lager, grenze, options['schub'])
+            if anzahl:
+                self.stdout.write(f'{lager.name}: {anzahl} Buchungen vor dem {grenze:%d.%m.%Y} archiviert')
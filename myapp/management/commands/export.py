@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.export import bestand_zeilen, csv_stream, tagesgrenzen, transaktions_zeilen
+from myapp.models import Lager
+
+
+class Command(BaseCommand):
+    help = 'Exportiert Bestand oder Buchungen eines Lagers als CSV (gestreamt, konstanter Speicherbedarf).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('lager_id', type=int)
+        parser.add_argument('art', choices=['bestand', 'transaktionen'])
+        parser.add_argument('--von', help='Buchungen ab diesem Tag (YYYY-MM-DD)')
+        parser.add_argument('--bis', help='Buchungen bis einschließlich diesem Tag (YYYY-MM-DD)')
+        parser.add_argument('--ausgabe', help='Zieldatei; Standard: stdout')
+
+    def handle(self, *args, **options):
+        try:
+            lager = Lager.objects.get(id=options['lager_id'])
+        except Lager.DoesNotExist:
+            raise CommandError(f'Lager {options["lager_id"]} existiert nicht.')
+
+        if options['art'] == 'bestand':
+            zeilen = bestand_zeilen(lager)
+        else:
+            try:
+                von, bis = tagesgrenzen(options['von'], options['bis'])
+            except ValueError:
+                raise CommandError('Ungültiges Datum (erwartet YYYY-MM-DD).')
+            zeilen = transaktions_zeilen(lager, von, bis)
+
+        ziel = open(options['ausgabe'], 'w', encoding='utf-8', newline='') if options['ausgabe'] else sys.stdout
+        try:
+            for teil in csv_stream(zeilen):
+                ziel.write(teil)
+        finally:
+            if ziel is not sys.stdout:
+                ziel.close()
@@ -0,0 +1,44 @@
+import re
+
+from django.core.management.base import BaseCommand
+
+from myapp.bilder import erzeuge_thumbnails, foto_speicher
+from myapp.models import Artikel
+
+HASH_NAME = re.compile(r'^fotos/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+class Command(BaseCommand):
+    help = 'Legt vorhandene Artikelbilder nach Inhalt ab, entfernt Duplikate und erzeugt Vorschaubilder.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--behalten', action='store_true', help='Alte Dateien nicht löschen')
+
+    def handle(self, *args, **options):
+        speicher = foto_speicher()
+        umbenannt = []
+        alte_namen = set()
+
+        for artikel in Artikel.objects.exclude(foto='').exclude(foto__isnull=True).only('id', 'foto').iterator():
+            name = artikel.foto.name
+            if not HASH_NAME.match(name):
+                if not speicher.exists(name):
+                    self.stderr.write(f'Datei fehlt: {name} (Artikel {artikel.id})')
+                    continue
+                with speicher.open(name) as datei:
+                    artikel.foto.name = speicher.save(name, datei)
+                alte_namen.add(name)
+                umbenannt.append(artikel)
+            erzeuge_thumbnails(artikel.foto.name)
+
+        Artikel.objects.bulk_update(umbenannt, ['foto'], batch_size=500)
+
+        geloescht = 0
+        if not options['behalten']:
+            noch_genutzt = set(Artikel.objects.filter(foto__in=alte_namen).values_list('foto', flat=True))
+            for name in alte_namen - noch_genutzt:
+                speicher.delete(name)
+                geloescht += 1
+
+        eindeutig = len({a.foto.name for a in umbenannt})
+        self.stdout.write(f'{len(umbenannt)} Bilder umgezogen ({eindeutig} eindeutige Dateien), {geloescht} alte Dateien gelöscht')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.importer import importiere_artikel
+from myapp.models import Lager
+
+
+class Command(BaseCommand):
+    help = 'Importiert Artikel aus einer CSV-Datei (Spalten name, menge) und aktualisiert vorhandene per Name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('lager_id', type=int)
+        parser.add_argument('datei', help='Pfad zur CSV-Datei (UTF-8 oder cp1252)')
+
+    def handle(self, *args, **options):
+        try:
+            lager = Lager.objects.get(id=options['lager_id'])
+        except Lager.DoesNotExist:
+            raise CommandError(f'Lager {options["lager_id"]} existiert nicht.')
+
+        with open(options['datei'], 'rb') as datei:
+            ergebnis = importiere_artikel(lager, datei)
+
+        for zeile, fehler in ergebnis['fehler']:
+            self.stderr.write(f'Zeile {zeile}: {fehler}')
+        self.stdout.write(
+            f'{ergebnis["angelegt"]} angelegt, {ergebnis["aktualisiert"]} aktualisiert, '
+            f'{ergebnis["unveraendert"]} unverändert, {len(ergebnis["fehler"])} Fehler'
+        )
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.models import Lager
+from myapp.prognose import BESTELLZYKLUS, HISTORIE, LIEFERZEIT, prognosen_berechnen
+
+
+class Command(BaseCommand):
+    help = ('Berechnet aus den Abgängen der letzten Tage Verbrauch, Reichweite und Bestellvorschläge '
+            'aller (oder ausgewählter) Lager und speichert sie für die Nachbestellliste.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lager', type=int, action='append', help='ID eines Lagers (mehrfach möglich)')
+        parser.add_argument('--tage', type=int, default=HISTORIE, help='Betrachtete Tage')
+        parser.add_argument('--lieferzeit', type=int, default=LIEFERZEIT, help='Wiederbeschaffungszeit in Tagen')
+        parser.add_argument('--zyklus', type=int, default=BESTELLZYKLUS, help='Bestellrhythmus in Tagen')
+
+    def handle(self, *args, **options):
+        for name in ('tage', 'lieferzeit'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} muss mindestens 1 sein.')
+        if options['zyklus'] < 0:
+            raise CommandError('--zyklus darf nicht negativ sein.')
+
+        lager_qs = Lager.objects.all()
+        if options['lager']:
+            lager_qs = lager_qs.filter(id__in=options['lager'])
+
+        for lager in lager_qs.iterator():
+            start = time.perf_counter()
+            artikel, nachbestellen = prognosen_berechnen(
+                lager.id, tage=options['tage'], lieferzeit=options['lieferzeit'], zyklus=options['zyklus']
+            )
+            self.stdout.write(
+                f'{lager.name}: {artikel} Artikel, {nachbestellen} nachzubestellen '
+                f'({time.perf_counter() - start:.1f} s)'
+            )
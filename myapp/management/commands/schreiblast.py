@@ -0,0 +1,100 @@
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from myapp.benchmark import frische_datenbank
+from myapp.models import Artikel, Lager
+from myapp.services import buche_bewegung
+
+# Django-Vorgaben (Rollback-Journal, DEFERRED-Transaktionen) gegen das Profil aus den Settings:
+# Profil -> (Verbindungsoptionen, Journalmodus der Datei)
+PROFILE = {
+    'standard': ({}, 'DELETE'),
+    'optimiert': ({
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ';'.join(f'PRAGMA {name}={wert}' for name, wert in settings.SQLITE_PRAGMAS.items()),
+    }, 'WAL'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Lasttest für parallele Schreiber: misst Buchungen pro Sekunde und Sperrfehler '
+            'mit den SQLite-Standardeinstellungen und mit dem optimierten Profil.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schreiber', type=int, default=8, help='Parallele Threads, die buchen')
+        parser.add_argument('--leser', type=int, default=4, help='Parallele Threads, die den Bestand lesen')
+        parser.add_argument('--sekunden', type=float, default=5.0, help='Dauer je Profil')
+        parser.add_argument('--artikel', type=int, default=50, help='Anzahl Artikel, auf die verteilt gebucht wird')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Der Vergleich der Profile ist nur für SQLite vorgesehen.')
+
+        # Gemessen wird in einer frischen Datenbankdatei, die eigentliche Datenbank bleibt unberührt
+        with tempfile.TemporaryDirectory() as verzeichnis:
+            for profil, (optionen, journal) in PROFILE.items():
+                with frische_datenbank(Path(verzeichnis) / f'{profil}.sqlite3', optionen):
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'PRAGMA journal_mode={journal}')
+                    ergebnis = self._messen(options)
+                self.stdout.write(
+                    f"{profil:>10}: {ergebnis['buchungen'] / options['sekunden']:8.1f} Buchungen/s, "
+                    f"{ergebnis['lesezugriffe'] / options['sekunden']:8.1f} Lesezugriffe/s, "
+                    f"{ergebnis['gesperrt']} × \"database is locked\""
+                )
+
+    def _messen(self, options):
+        user = User.objects.create(username='schreiblast')
+        lager = Lager.objects.create(name='Schreiblast', owner=user)
+        artikel_ids = [
+            a.id for a in Artikel.objects.bulk_create(
+                Artikel(name=f'Artikel {i}', menge=0, lager=lager) for i in range(options['artikel'])
+            )
+        ]
+        connections.close_all()
+
+        zaehler = {'buchungen': 0, 'lesezugriffe': 0, 'gesperrt': 0}
+        sperre = threading.Lock()
+        ende = time.monotonic() + options['sekunden']
+
+        def zaehlen(name):
+            with sperre:
+                zaehler[name] += 1
+
+        def schreiben():
+            try:
+                while time.monotonic() < ende:
+                    try:
+                        buche_bewegung(lager, random.choice(artikel_ids), 'in', 1)
+                        zaehlen('buchungen')
+                    except OperationalError:
+                        zaehlen('gesperrt')
+            finally:
+                connection.close()
+
+        def lesen():
+            try:
+                while time.monotonic() < ende:
+                    try:
+                        list(lager.artikel.filter(menge__gt=0).order_by('name').values_list('name', 'menge')[:50])
+                        zaehlen('lesezugriffe')
+                    except OperationalError:
+                        zaehlen('gesperrt')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=schreiben) for _ in range(options['schreiber'])]
+        threads += [threading.Thread(target=lesen) for _ in range(options['leser'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return zaehler
@@ -0,0 +1,214 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+# Messungen je URL-Name, die für die Statistik behalten werden (je Prozess)
+RINGPUFFER = 500
+
+
+class Messung:
+    """Zahlen eines Requests: SQL-Abfragen, Zeit in der Datenbank und im Template-Rendering."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.abfragen = 0
+        self.db = 0.0
+        self.templates = 0.0
+        self.gesamt = None
+        self.budget = None
+
+    @property
+    def ueberschritten(self):
+        return self.budget is not None and self.abfragen > self.budget
+
+    def server_timing(self):
+        # Template-Zeit enthält Abfragen, die erst beim Rendern ausgewertet werden
+        return ', '.join([
+            f'db;dur={self.db * 1000:.1f};desc="{self.abfragen} Abfragen"',
+            f'tpl;dur={self.templates * 1000:.1f}',
+            f'total;dur={self.gesamt * 1000:.1f}',
+        ])
+
+
+class AbfragenBudgetUeberschritten(AssertionError):
+    """Ein View hat mehr SQL-Abfragen abgesetzt, als sein Budget erlaubt (siehe ``budget_pruefen``)."""
+
+
+_aktuelle = ContextVar('messung', default=None)
+
+_puffer = defaultdict(lambda: deque(maxlen=RINGPUFFER))
+_puffer_sperre = threading.Lock()
+
+
+def perzentil(werte, p):
+    """``p``-Perzentil (0–100) mit linearer Interpolation; ``werte`` müssen sortiert sein."""
+    if not werte:
+        return None
+    position = (len(werte) - 1) * p / 100
+    unten, oben = math.floor(position), math.ceil(position)
+    return werte[unten] + (werte[oben] - werte[unten]) * (position - unten)
+
+
+def abfragen_budget(anzahl):
+    """Decorator: Höchstzahl an SQL-Abfragen für einen View, unabhängig von der Datenmenge.
+
+    Wird das Budget überschritten, protokolliert die Middleware eine Warnung.
+    Der Request selbst scheitert nicht daran, seine Schreibzugriffe sind zu
+    dem Zeitpunkt schon committet. In Tests prüft ``budget_pruefen`` jede
+    Antwort, so fallen N+1-Abfragen auf, sobald ein Test den View aufruft.
+    """
+    def decorator(view):
+        view.abfragen_budget = anzahl
+        return view
+    return decorator
+
+
+def abfrage_messen(execute, sql, params, many, context):
+    """Execute-Wrapper für alle Verbindungen (siehe ``MyappConfig.ready``)."""
+    messung = _aktuelle.get()
+    if messung is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        messung.abfragen += 1
+        messung.db += time.perf_counter() - start
+
+
+def verbindung_instrumentieren(sender, connection, **kwargs):
+    if abfrage_messen not in connection.execute_wrappers:
+        connection.execute_wrappers.append(abfrage_messen)
+
+
+class _MessendesTemplate(Template):
+    def render(self, context=None, request=None):
+        messung = _aktuelle.get()
+        if messung is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            messung.templates += time.perf_counter() - start
+
+
+class MessendeTemplates(DjangoTemplates):
+    """Django-Template-Backend, das die Renderzeit in die laufende Messung schreibt.
+
+    Gemessen werden nur die äußeren Templates; ``{% include %}`` zählt zu
+    seinem umgebenden Template.
+    """
+
+    def from_string(self, template_code):
+        return _MessendesTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return _MessendesTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class MessungMiddleware:
+    """Misst Abfragen, Datenbank-, Template- und Gesamtzeit je Request.
+
+    Ergebnis: ``Server-Timing``-Header (bei ``DEBUG`` oder für Staff-Benutzer),
+    ``response.messung`` für Tests, der Ringpuffer je URL-Name für
+    ``statistik()`` und die Prüfung der Abfragen-Budgets. Bei Streaming-
+    Antworten endet die Messung mit dem Start der Übertragung.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        messung = Messung()
+        token = _aktuelle.set(messung)
+        try:
+            response = self.get_response(request)
+        finally:
+            _aktuelle.reset(token)
+        return self._abschliessen(request, response, messung)
+
+    async def __acall__(self, request):
+        messung = Messung()
+        token = _aktuelle.set(messung)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _aktuelle.reset(token)
+        return self._abschliessen(request, response, messung)
+
+    def _abschliessen(self, request, response, messung):
+        messung.gesamt = time.perf_counter() - messung.start
+        response.messung = messung
+        if settings.DEBUG or getattr(getattr(request, 'user', None), 'is_staff', False):
+            response['Server-Timing'] = messung.server_timing()
+
+        treffer = getattr(request, 'resolver_match', None)
+        if treffer is None or not treffer.url_name:
+            return response
+        budget = getattr(treffer.func, 'abfragen_budget', None)
+        with _puffer_sperre:
+            _puffer[treffer.url_name].append((messung.gesamt, messung.abfragen, messung.db, messung.templates, budget))
+
+        messung.budget = budget
+        if messung.ueberschritten:
+            logger.warning(_meldung(treffer.url_name, messung))
+        return response
+
+
+def _meldung(name, messung):
+    return f'{name}: {messung.abfragen} SQL-Abfragen, Budget {messung.budget}'
+
+
+def budget_pruefen(response):
+    """Für Tests: ``AbfragenBudgetUeberschritten``, wenn der Request sein Abfragen-Budget überschritten hat."""
+    messung = getattr(response, 'messung', None)
+    if messung is not None and messung.ueberschritten:
+        raise AbfragenBudgetUeberschritten(_meldung(response.resolver_match.url_name, messung))
+    return response
+
+
+def statistik():
+    """Kennzahlen je URL-Name aus dem Ringpuffer dieses Prozesses (Zeiten in Millisekunden)."""
+    with _puffer_sperre:
+        eintraege = {name: list(werte) for name, werte in _puffer.items()}
+    ergebnis = {}
+    for name, werte in sorted(eintraege.items()):
+        zeiten = sorted(w[0] * 1000 for w in werte)
+        anzahl = len(werte)
+        ergebnis[name] = {
+            'requests': anzahl,
+            'p50_ms': round(perzentil(zeiten, 50), 2),
+            'p95_ms': round(perzentil(zeiten, 95), 2),
+            'p99_ms': round(perzentil(zeiten, 99), 2),
+            'abfragen_mittel': round(sum(w[1] for w in werte) / anzahl, 2),
+            'abfragen_max': max(w[1] for w in werte),
+            'db_ms_mittel': round(sum(w[2] for w in werte) * 1000 / anzahl, 2),
+            'templates_ms_mittel': round(sum(w[3] for w in werte) * 1000 / anzahl, 2),
+            'budget': werte[-1][4],
+        }
+    return ergebnis
+
+
+def statistik_zuruecksetzen():
+    with _puffer_sperre:
+        _puffer.clear()
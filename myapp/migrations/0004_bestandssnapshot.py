@@ -0,0 +1,59 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, IntegerField, Sum, When, F
+
+
+def buche_anfangsbestaende(apps, schema_editor):
+    """Gleicht das Buchungsjournal an den bisherigen Artikelbestand an.
+
+    Bestände, die ohne Buchung angelegt oder bearbeitet wurden, bekommen eine
+    Ausgleichsbuchung, damit das Journal ab jetzt die Quelle der Wahrheit ist.
+    """
+    Artikel = apps.get_model('myapp', 'Artikel')
+    Transaction = apps.get_model('myapp', 'Transaction')
+
+    salden = dict(
+        Transaction.objects.values('article_id').annotate(
+            saldo=Sum(Case(
+                When(type='in', then=F('quantity')),
+                default=-F('quantity'),
+                output_field=IntegerField(),
+            ))
+        ).values_list('article_id', 'saldo')
+    )
+    ausgleich = []
+    for artikel_id, lager_id, menge in Artikel.objects.values_list('id', 'lager_id', 'menge').iterator():
+        differenz = menge - (salden.get(artikel_id) or 0)
+        if differenz:
+            ausgleich.append(Transaction(
+                article_id=artikel_id, lager_id=lager_id,
+                type='in' if differenz > 0 else 'out', quantity=abs(differenz),
+            ))
+    Transaction.objects.bulk_create(ausgleich, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_alter_artikel_foto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestandsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stichtag', models.DateTimeField()),
+                ('menge', models.IntegerField()),
+                ('artikel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='myapp.artikel')),
+                ('lager', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='myapp.lager')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lager', 'stichtag'], name='snapshot_lager_stichtag_idx')],
+                'constraints': [models.UniqueConstraint(fields=('artikel', 'stichtag'), name='unique_snapshot_artikel_stichtag')],
+            },
+        ),
+        migrations.RunPython(buche_anfangsbestaende, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_bestandssnapshot'),
+    ]
+
+    operations = [
+        # Erst die Verbundindizes anlegen, dann die überflüssigen FK-Einzelindizes entfernen
+        migrations.AddIndex(
+            model_name='artikel',
+            index=models.Index(condition=models.Q(('menge__gt', 0)), fields=['lager', 'name'], name='artikel_lager_bestand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['lager', 'date'], name='transaction_lager_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['article', 'date'], name='transaction_article_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='artikel',
+            constraint=models.UniqueConstraint(fields=('lager', 'name'), name='unique_artikel_lager_name'),
+        ),
+        migrations.AlterField(
+            model_name='artikel',
+            name='lager',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='artikel', to='myapp.lager'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='article',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='myapp.artikel'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='lager',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='myapp.lager'),
+        ),
+    ]
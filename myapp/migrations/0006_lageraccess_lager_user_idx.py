@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_artikel_transaction_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lageraccess',
+            index=models.Index(fields=['lager', 'user'], name='lageraccess_lager_user_idx'),
+        ),
+        migrations.AlterField(
+            model_name='lageraccess',
+            name='lager',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='myapp.lager'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from myapp.suche import suchindex_einrichten, suchindex_entfernen
+
+
+def einrichten(apps, schema_editor):
+    suchindex_einrichten(schema_editor.connection)
+
+
+def entfernen(apps, schema_editor):
+    suchindex_entfernen(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_lageraccess_lager_user_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(einrichten, entfernen),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:03
+
+import myapp.bilder
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_artikel_suchindex'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='artikel',
+            name='foto',
+            field=models.ImageField(blank=True, null=True, storage=myapp.bilder.foto_speicher, upload_to='fotos/'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_artikel_foto_inhaltsspeicher'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artikel',
+            name='foto_auftrag',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='Auftrag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aufgabe', models.CharField(max_length=50)),
+                ('parameter', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('offen', 'Offen'), ('laeuft', 'Läuft'), ('fertig', 'Fertig'), ('fehler', 'Fehler')], default='offen', max_length=10)),
+                ('versuche', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('fehler', models.TextField(blank=True)),
+                ('erstellt', models.DateTimeField(auto_now_add=True)),
+                ('gestartet', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='auftrag_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_auftrag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artikel',
+            name='mindestbestand',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Warnung',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('menge', models.IntegerField()),
+                ('mindestbestand', models.PositiveIntegerField()),
+                ('erstellt', models.DateTimeField(auto_now_add=True)),
+                ('erledigt', models.DateTimeField(blank=True, null=True)),
+                ('artikel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='warnungen', to='myapp.artikel')),
+                ('lager', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='warnungen', to='myapp.lager')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('erledigt__isnull', True)), fields=['lager', '-erstellt'], name='warnung_offen_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('erledigt__isnull', True)), fields=('artikel',), name='unique_offene_warnung_artikel')],
+            },
+        ),
+    ]
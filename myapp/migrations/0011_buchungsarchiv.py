@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_warnungen'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='article',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='myapp.artikel'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='lager',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='myapp.lager'),
+        ),
+        migrations.CreateModel(
+            name='ArchivBuchung',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('lager_id', models.BigIntegerField()),
+                ('article_id', models.BigIntegerField()),
+                ('type', models.CharField(choices=[('in', 'Eingang'), ('out', 'Ausgang')], max_length=3)),
+                ('quantity', models.PositiveIntegerField()),
+                ('date', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lager_id', 'date'], name='archivbuchung_lager_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_buchungsarchiv'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='anfrage_id',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('anfrage_id__isnull', False)), fields=('lager', 'anfrage_id'), name='unique_transaction_anfrage'),
+        ),
+    ]
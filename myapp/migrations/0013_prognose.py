@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_transaction_anfrage_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Prognose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('berechnet', models.DateTimeField()),
+                ('verbrauch_mittel', models.FloatField()),
+                ('verbrauch_geglaettet', models.FloatField()),
+                ('reichweite_tage', models.FloatField(blank=True, null=True)),
+                ('meldebestand', models.PositiveIntegerField()),
+                ('bestellmenge', models.PositiveIntegerField()),
+                ('artikel', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='prognose', to='myapp.artikel')),
+                ('lager', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='prognosen', to='myapp.lager')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lager', 'reichweite_tage'], name='prognose_lager_reichweite_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_prognose'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='umbuchung',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('umbuchung__isnull', False)), fields=['umbuchung'], name='transaction_umbuchung_idx'),
+        ),
+    ]
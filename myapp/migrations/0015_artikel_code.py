@@ -0,0 +1,22 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0014_transaction_umbuchung'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artikel',
+            name='code',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='artikel',
+            constraint=models.UniqueConstraint(condition=models.Q(('code__isnull', False)), fields=('lager', 'code'), name='unique_artikel_lager_code'),
+        ),
+    ]
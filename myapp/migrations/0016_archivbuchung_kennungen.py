@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_artikel_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivbuchung',
+            name='anfrage_id',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivbuchung',
+            name='umbuchung',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from .bilder import foto_speicher
+
 
 class Lager(models.Model):
     name = models.CharField(max_length=100)
@@ -12,9 +14,15 @@ class Lager(models.Model):
 
 
 class LagerAccess(models.Model):
-    lager = models.ForeignKey(Lager, on_delete=models.CASCADE)
+    lager = models.ForeignKey(Lager, on_delete=models.CASCADE, db_index=False)  # abgedeckt durch (lager, user)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Für die Zugriffsprüfung (EXISTS über lager und user)
+            models.Index(fields=['lager', 'user'], name='lageraccess_lager_user_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} -> {self.lager.name}"
 
@@ -23,8 +31,31 @@ class LagerAccess(models.Model):
 class Artikel(models.Model):
     name = models.CharField(max_length=100)
     menge = models.IntegerField()
-    lager = models.ForeignKey(Lager, on_delete=models.CASCADE, related_name='artikel')
-    foto = models.ImageField(upload_to='fotos/', blank=True, null=True)  # Optionales Bildfeld
+    lager = models.ForeignKey(Lager, on_delete=models.CASCADE, related_name='artikel', db_index=False)  # abgedeckt durch (lager, name)
+    # Optionales Bildfeld; Dateien werden nach Inhalt abgelegt, identische Bilder also nur einmal
+    foto = models.ImageField(upload_to='fotos/', storage=foto_speicher, blank=True, null=True)
+    # Noch nicht verarbeiteter Upload (siehe myapp.auftraege); leer, wenn kein Bild in Arbeit ist
+    foto_auftrag = models.CharField(max_length=100, blank=True, editable=False)
+    # Unterschreitet der Bestand diesen Wert, wird eine Warnung angelegt (0 = keine Überwachung)
+    mindestbestand = models.PositiveIntegerField(default=0)
+    # Barcode (EAN/GTIN) oder SKU für Scanner; ohne Code None statt '', damit der Teilindex ihn auslässt
+    code = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Ein Artikelname ist pro Lager eindeutig (ersetzt die exists()-Vorabprüfung)
+            models.UniqueConstraint(fields=['lager', 'name'], name='unique_artikel_lager_name'),
+            # Teilindex: ein Code ist pro Lager eindeutig; zugleich der Index für Scans (myapp.scanner)
+            models.UniqueConstraint(
+                fields=['lager', 'code'], condition=models.Q(code__isnull=False), name='unique_artikel_lager_code'
+            ),
+        ]
+        indexes = [
+            # Teilindex für den aktuellen Stand: nur Artikel mit Bestand
+            models.Index(
+                fields=['lager', 'name'], condition=models.Q(menge__gt=0), name='artikel_lager_bestand_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} (Menge: {self.menge})"
@@ -35,10 +66,159 @@ class Transaction(models.Model):
         ('in', 'Eingang'),
         ('out', 'Ausgang'),
     ]
-    article = models.ForeignKey(Artikel, on_delete=models.CASCADE)
-    lager = models.ForeignKey(Lager, on_delete=models.CASCADE)
+    # Einzelindizes entfallen, die Verbundindizes mit date decken sie ab
+    # Kein Kaskaden-Löschen: Buchungen gelöschter Artikel/Lager entfernt ein
+    # Hintergrundauftrag schubweise (myapp.archiv), statt eines riesigen DELETE
+    article = models.ForeignKey(Artikel, on_delete=models.DO_NOTHING, db_index=False, db_constraint=False)
+    lager = models.ForeignKey(Lager, on_delete=models.DO_NOTHING, db_index=False, db_constraint=False)
     type = models.CharField(max_length=3, choices=TRANSACTION_TYPES)
     quantity = models.PositiveIntegerField()
     date = models.DateTimeField(auto_now_add=True)
+    # Vom Client vergebene Kennung der Anfrage; eine Wiederholung bucht nicht erneut (siehe services)
+    anfrage_id = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # Gemeinsame Kennung von Abgang und Zugang einer Umbuchung zwischen zwei Lagern (siehe services)
+    umbuchung = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # Teilindex: nur Buchungen mit Kennung, je Lager eindeutig
+            models.UniqueConstraint(
+                fields=['lager', 'anfrage_id'], condition=models.Q(anfrage_id__isnull=False),
+                name='unique_transaction_anfrage',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['lager', 'date'], name='transaction_lager_date_idx'),
+            models.Index(fields=['article', 'date'], name='transaction_article_date_idx'),
+            # Teilindex: nur Umbuchungen, für das Gegenstück einer Buchung
+            models.Index(
+                fields=['umbuchung'], condition=models.Q(umbuchung__isnull=False), name='transaction_umbuchung_idx'
+            ),
+        ]
+
+
+class ArchivBuchung(models.Model):
+    """Ins Archiv verschobene Buchung (siehe ``manage.py buchungen_archivieren``).
+
+    Gleiche Spalten wie ``Transaction`` und dieselbe ID, aber ohne
+    Fremdschlüssel und Eindeutigkeitsregel und mit nur einem Index.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    lager_id = models.BigIntegerField()
+    article_id = models.BigIntegerField()
+    type = models.CharField(max_length=3, choices=Transaction.TRANSACTION_TYPES)
+    quantity = models.PositiveIntegerField()
+    date = models.DateTimeField()
+    anfrage_id = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    umbuchung = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['lager_id', 'date'], name='archivbuchung_lager_date_idx'),
+        ]
+
+
+
+
+class BestandsSnapshot(models.Model):
+    """Periodisch festgeschriebener Bestand eines Artikels zu einem Stichtag.
+
+    Grundlage für Stichtagsbestände: Snapshot plus die Buchungen seit dem Stichtag.
+    """
+    lager = models.ForeignKey(Lager, on_delete=models.CASCADE, related_name='snapshots')
+    artikel = models.ForeignKey(Artikel, on_delete=models.CASCADE, related_name='snapshots')
+    stichtag = models.DateTimeField()
+    menge = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['artikel', 'stichtag'], name='unique_snapshot_artikel_stichtag'),
+        ]
+        indexes = [
+            models.Index(fields=['lager', 'stichtag'], name='snapshot_lager_stichtag_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.artikel.name} am {self.stichtag:%d.%m.%Y}: {self.menge}"
+
+
+class Warnung(models.Model):
+    """Meldung, dass der Bestand eines Artikels unter seinen Mindestbestand gefallen ist.
+
+    Je Artikel ist höchstens eine Warnung offen; sie wird erledigt, sobald der
+    Bestand wieder reicht (siehe myapp.warnungen).
+    """
+    lager = models.ForeignKey(Lager, on_delete=models.CASCADE, related_name='warnungen')
+    artikel = models.ForeignKey(Artikel, on_delete=models.CASCADE, related_name='warnungen')
+    menge = models.IntegerField()  # Bestand beim Auslösen
+    mindestbestand = models.PositiveIntegerField()
+    erstellt = models.DateTimeField(auto_now_add=True)
+    erledigt = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['artikel'], condition=models.Q(erledigt__isnull=True), name='unique_offene_warnung_artikel'
+            ),
+        ]
+        indexes = [
+            # Offene Warnungen eines Lagers, neueste zuerst
+            models.Index(
+                fields=['lager', '-erstellt'], condition=models.Q(erledigt__isnull=True), name='warnung_offen_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.artikel.name}: {self.menge} < {self.mindestbestand}"
+
+
+class Prognose(models.Model):
+    """Vorberechneter Verbrauch, Reichweite und Bestellvorschlag eines Artikels.
 
+    Wird von ``manage.py prognose_berechnen`` je Lager komplett ersetzt (siehe
+    myapp.prognose); die Views lesen nur diese Tabelle.
+    """
+    lager = models.ForeignKey(Lager, on_delete=models.CASCADE, related_name='prognosen', db_index=False)  # abgedeckt durch (lager, reichweite)
+    artikel = models.OneToOneField(Artikel, on_delete=models.CASCADE, related_name='prognose')
+    berechnet = models.DateTimeField()
+    # Abgang je Tag: gleitender Mittelwert und exponentiell geglättet
+    verbrauch_mittel = models.FloatField()
+    verbrauch_geglaettet = models.FloatField()
+    reichweite_tage = models.FloatField(null=True, blank=True)  # None: kein Verbrauch
+    meldebestand = models.PositiveIntegerField()
+    bestellmenge = models.PositiveIntegerField()
 
+    class Meta:
+        indexes = [
+            # Nachbestellliste: knappste Artikel zuerst
+            models.Index(fields=['lager', 'reichweite_tage'], name='prognose_lager_reichweite_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.artikel.name}: {self.bestellmenge} bestellen"
+
+
+class Auftrag(models.Model):
+    """Hintergrundauftrag der lokalen Warteschlange (abgearbeitet von ``manage.py auftraege_abarbeiten``)."""
+    STATUS = [
+        ('offen', 'Offen'),
+        ('laeuft', 'Läuft'),
+        ('fertig', 'Fertig'),
+        ('fehler', 'Fehler'),
+    ]
+    aufgabe = models.CharField(max_length=50)
+    parameter = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS, default='offen')
+    versuche = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)  # Wer den Auftrag gerade bearbeitet
+    fehler = models.TextField(blank=True)
+    erstellt = models.DateTimeField(auto_now_add=True)
+    gestartet = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='auftrag_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.aufgabe} #{self.id} ({self.status})"
@@ -0,0 +1,140 @@
+import math
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import CharField, Sum
+from django.db.models.functions import Cast, Substr
+from django.utils import timezone
+
+from .models import Artikel, Prognose, Transaction
+
+# Betrachtete Abgänge in Tagen und Fenster des gleitenden Mittelwerts
+HISTORIE = 90
+FENSTER = 28
+# Gewicht des jüngsten Tages bei der exponentiellen Glättung
+ALPHA = 0.2
+# Wiederbeschaffungszeit und Bestellrhythmus in Tagen
+LIEFERZEIT = 7
+BESTELLZYKLUS = 14
+# Vielfaches der Streuung als Sicherheitsbestand (etwa 95 % Lieferbereitschaft)
+SICHERHEIT = 1.65
+# Zeilen je INSERT
+SCHUB = 2000
+
+
+def abgangsreihen(lager_id, artikel_ids, tage=HISTORIE, jetzt=None):
+    """Tägliche Abgänge je Artikel als Matrix ``(len(artikel_ids), tage)``, letzte Spalte ist heute.
+
+    Eine einzige Abfrage, die in der Datenbank schon je Artikel und Tag
+    summiert. Der Tag ist der Datumsteil des gespeicherten Zeitpunkts (UTC),
+    so braucht die Datenbank keine Datumsfunktion je Buchung. Zeilen und
+    Spalten werden mit NumPy zugeordnet, ohne Schleife je Artikel.
+    ``artikel_ids`` muss aufsteigend sortiert sein; Buchungen gelöschter,
+    noch nicht bereinigter Artikel fallen heraus.
+    """
+    artikel_ids = np.asarray(artikel_ids, dtype=np.int64)
+    heute = (jetzt or timezone.now()).astimezone(dt_timezone.utc).date()
+    erster = heute - timedelta(days=tage - 1)
+    abgaenge = list(
+        Transaction.objects.filter(
+            lager_id=lager_id, type='out',
+            date__gte=datetime.combine(erster, time.min, dt_timezone.utc),
+            date__lt=datetime.combine(heute + timedelta(days=1), time.min, dt_timezone.utc),
+        )
+        .annotate(tag=Substr(Cast('date', CharField()), 1, 10)).order_by()
+        .values('article_id', 'tag').annotate(menge=Sum('quantity'))
+        .values_list('article_id', 'tag', 'menge')
+    )
+    reihen = np.zeros((len(artikel_ids), tage))
+    if not abgaenge or not len(artikel_ids):
+        return reihen
+
+    ids, tagesdaten, mengen = zip(*abgaenge)
+    ids = np.array(ids, dtype=np.int64)
+    spalten = (np.array(tagesdaten, dtype='datetime64[D]') - np.datetime64(erster, 'D')).astype(np.int64)
+    zeilen = np.searchsorted(artikel_ids, ids)
+    gueltig = zeilen < len(artikel_ids)
+    gueltig[gueltig] &= artikel_ids[zeilen[gueltig]] == ids[gueltig]
+    # Je Artikel und Tag gibt es genau eine Zeile, Zuweisen genügt
+    reihen[zeilen[gueltig], spalten[gueltig]] = np.array(mengen, dtype=np.float64)[gueltig]
+    return reihen
+
+
+def _aufrunden(werte):
+    # Rundungsreste der Glättung (2.0000000001) sollen kein ganzes Stück mehr ergeben
+    return np.ceil(np.round(werte, 6))
+
+
+def berechnen(bestand, reihen, mindestbestand=None, fenster=FENSTER, alpha=ALPHA,
+              lieferzeit=LIEFERZEIT, zyklus=BESTELLZYKLUS, sicherheit=SICHERHEIT):
+    """Verbrauch, Reichweite und Bestellvorschlag für alle Artikel auf einmal.
+
+    ``bestand`` und ``mindestbestand`` sind Vektoren je Artikel, ``reihen`` die
+    Matrix aus ``abgangsreihen``. Die Prognose ist der exponentiell geglättete
+    Tagesverbrauch; nachbestellt wird, sobald der Bestand den Meldebestand
+    (Verbrauch während der Lieferzeit plus Sicherheitsbestand, mindestens der
+    Mindestbestand) erreicht, und zwar bis auf den Bedarf für Lieferzeit und
+    Bestellrhythmus. Liefert ein Dict aus Vektoren; die Reichweite ist ``nan``,
+    wenn nichts verbraucht wird.
+    """
+    bestand = np.asarray(bestand, dtype=np.float64)
+    tage = reihen.shape[1]
+    juengste = reihen[:, -min(fenster, tage):]
+    mittel = juengste.mean(axis=1)
+    streuung = juengste.std(axis=1)
+
+    # s_t = alpha * x_t + (1 - alpha) * s_t-1 mit s_0 = x_0, aufgelöst als ein Matrixprodukt
+    gewichte = alpha * (1 - alpha) ** np.arange(tage - 1, -1, -1, dtype=np.float64)
+    gewichte[0] = (1 - alpha) ** (tage - 1)
+    verbrauch = reihen @ gewichte
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reichweite = np.where(verbrauch > 0, bestand / verbrauch, np.nan)
+    sicherheitsbestand = sicherheit * streuung * np.sqrt(lieferzeit)
+    meldebestand = _aufrunden(verbrauch * lieferzeit + sicherheitsbestand)
+    if mindestbestand is not None:
+        meldebestand = np.maximum(meldebestand, np.asarray(mindestbestand, dtype=np.float64))
+    zielbestand = np.maximum(_aufrunden(verbrauch * (lieferzeit + zyklus) + sicherheitsbestand), meldebestand)
+    bestellmenge = np.where(bestand <= meldebestand, np.maximum(zielbestand - bestand, 0), 0)
+
+    return {
+        'verbrauch_mittel': mittel,
+        'verbrauch_geglaettet': verbrauch,
+        'reichweite_tage': reichweite,
+        'meldebestand': meldebestand.astype(np.int64),
+        'bestellmenge': bestellmenge.astype(np.int64),
+    }
+
+
+def prognosen_berechnen(lager_id, jetzt=None, tage=HISTORIE, **parameter):
+    """Berechnet die Prognosen eines Lagers und ersetzt die gespeicherten.
+
+    Zwei lesende Abfragen (Artikel, Abgänge) unabhängig von der Artikelzahl;
+    ``parameter`` geht an ``berechnen``. Liefert ``(artikel, nachzubestellen)``.
+    """
+    jetzt = jetzt or timezone.now()
+    artikel = list(Artikel.objects.filter(lager_id=lager_id).order_by('id').values_list('id', 'menge', 'mindestbestand'))
+    if not artikel:
+        Prognose.objects.filter(lager_id=lager_id).delete()
+        return 0, 0
+    ids, bestand, mindestbestand = (np.array(spalte, dtype=np.int64) for spalte in zip(*artikel))
+    ergebnis = berechnen(bestand, abgangsreihen(lager_id, ids, tage, jetzt), mindestbestand, **parameter)
+
+    # Ein vorbereitetes INSERT für alle Zeilen statt Modellinstanzen (bulk_create bereitet jedes Feld einzeln auf)
+    qn = connection.ops.quote_name
+    spalten = ['verbrauch_mittel', 'verbrauch_geglaettet', 'reichweite_tage', 'meldebestand', 'bestellmenge']
+    berechnet = connection.ops.adapt_datetimefield_value(jetzt)
+    werte = [ergebnis[feld].tolist() for feld in spalten]
+    werte[2] = [None if math.isnan(reichweite) else reichweite for reichweite in werte[2]]
+    zeilen = [(lager_id, artikel_id, berechnet, *rest) for artikel_id, *rest in zip(ids.tolist(), *werte)]
+    with transaction.atomic():
+        Prognose.objects.filter(lager_id=lager_id).delete()
+        with connection.cursor() as cursor:
+            for start in range(0, len(zeilen), SCHUB):
+                cursor.executemany(
+                    f"INSERT INTO {qn(Prognose._meta.db_table)} (lager_id, artikel_id, berechnet, {', '.join(spalten)}) "
+                    f"VALUES ({', '.join(['%s'] * (len(spalten) + 3))})",
+                    zeilen[start:start + SCHUB],
+                )
+    return len(artikel), int(np.count_nonzero(ergebnis['bestellmenge']))
@@ -0,0 +1,148 @@
+"""Lesereplikate: lesende Views fragen ein Replikat ab, alles andere das Primärsystem.
+
+Ein View kommt nur mit ``@nur_lesend`` und nur bei GET/HEAD auf ein Replikat
+(``settings.DATABASE_REPLIKATE``). Views, die bei POST schreiben, tragen den
+Decorator nicht selbst, sondern auf ihrer lesenden Hilfsfunktion. Damit niemand veraltete Daten sieht, die
+er gerade selbst geschrieben hat, bleibt es beim Primärsystem
+
+- für den Rest des Requests, sobald er geschrieben hat,
+- für den Benutzer ``REPLIKAT_KLEBEZEIT`` Sekunden lang nach einem
+  schreibenden Request (Cookie, kostet keine Abfrage),
+- für ein Lager ebenso lange nach seiner letzten Änderung (Lager-Version,
+  siehe myapp.seitencache), damit keine Fragmente oder ETags aus einem noch
+  nicht nachgezogenen Replikat entstehen.
+
+Die Klebezeit muss also länger sein als die übliche Verzögerung der Replikate.
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .seitencache import lager_version
+
+# Solange das Cookie besteht, liest der Benutzer vom Primärsystem
+KLEBE_COOKIE = 'primaer'
+
+
+class _Zustand:
+    """Routing-Zustand eines Requests (vom Router verändert, daher ein Objekt statt Einzelwerten)."""
+
+    def __init__(self):
+        self.replikat = False
+        self.geschrieben = False
+        self.alias = None
+
+
+_zustand = ContextVar('replikat_zustand', default=None)
+
+
+def nur_lesend(view):
+    """Decorator: der View ändert nichts, seine Abfragen dürfen an ein Lesereplikat gehen.
+
+    Auf einem View entscheidet ``ReplikatMiddleware`` schon vor dem Aufruf,
+    damit auch die Zugriffsprüfung vom Replikat liest. Auf einer Funktion
+    ``(request, ..., lager_id=...)`` innerhalb eines Views gilt das erst ab
+    ihrem Aufruf.
+    """
+    @wraps(view)
+    def lesend(request, *args, **kwargs):
+        zustand = _zustand.get()
+        if zustand is not None and not zustand.replikat:
+            zustand.replikat = _replikat_erlaubt(request, kwargs.get('lager_id'))
+        return view(request, *args, **kwargs)
+    lesend.nur_lesend = True
+    return lesend
+
+
+def lesedatenbank():
+    """Alias, von dem im laufenden Request gelesen wird.
+
+    Ein Request bleibt bei einem (zufällig gewählten) Replikat, damit seine
+    Abfragen einen zusammenhängenden Stand sehen. Außerhalb von Requests
+    (Befehle, Hintergrundaufträge) immer das Primärsystem.
+    """
+    zustand = _zustand.get()
+    replikate = getattr(settings, 'DATABASE_REPLIKATE', [])
+    if zustand is None or not zustand.replikat or zustand.geschrieben or not replikate:
+        return DEFAULT_DB_ALIAS
+    if zustand.alias is None:
+        zustand.alias = random.choice(replikate)
+    return zustand.alias
+
+
+class ReplikatRouter:
+    def db_for_read(self, model, **hints):
+        return lesedatenbank()
+
+    def db_for_write(self, model, **hints):
+        zustand = _zustand.get()
+        if zustand is not None:
+            zustand.geschrieben = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replikate enthalten dieselben Daten wie das Primärsystem
+        datenbanken = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLIKATE', [])}
+        if obj1._state.db in datenbanken and obj2._state.db in datenbanken:
+            return True
+        return None
+
+
+def _kuerzlich_geaendert(request, lager_id):
+    return lager_id is not None and time.time_ns() - lager_version(request, lager_id) < settings.REPLIKAT_KLEBEZEIT * 10**9
+
+
+def _replikat_erlaubt(request, lager_id):
+    return bool(
+        getattr(settings, 'DATABASE_REPLIKATE', [])
+        and request.method in ('GET', 'HEAD')
+        and KLEBE_COOKIE not in request.COOKIES
+        and not _kuerzlich_geaendert(request, lager_id)
+    )
+
+
+class ReplikatMiddleware:
+    """Entscheidet je Request, ob gelesen werden darf, und setzt nach Schreibzugriffen das Klebe-Cookie."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        zustand = _Zustand()
+        token = _zustand.set(zustand)
+        try:
+            response = self.get_response(request)
+        finally:
+            _zustand.reset(token)
+        return self._abschliessen(response, zustand)
+
+    async def __acall__(self, request):
+        zustand = _Zustand()
+        token = _zustand.set(zustand)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _zustand.reset(token)
+        return self._abschliessen(response, zustand)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        zustand = _zustand.get()
+        if zustand is not None and getattr(view_func, 'nur_lesend', False):
+            zustand.replikat = _replikat_erlaubt(request, view_kwargs.get('lager_id'))
+        return None
+
+    def _abschliessen(self, response, zustand):
+        if zustand.geschrieben and settings.REPLIKAT_KLEBEZEIT > 0 and getattr(settings, 'DATABASE_REPLIKATE', []):
+            response.set_cookie(KLEBE_COOKIE, '1', max_age=settings.REPLIKAT_KLEBEZEIT, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,80 @@
+"""Scans: Barcode/SKU eines Artikels auflösen und direkt buchen.
+
+Ein Code ist je Lager eindeutig (Teilindex ``unique_artikel_lager_code``),
+das Auflösen ist also ein Indexzugriff. Die zuletzt gescannten Codes hält
+jeder Prozess zusätzlich im Speicher (LRU), Folgescans buchen ohne
+Nachschlagen. Die Einträge werden nicht invalidiert, sondern beim Buchen
+geprüft: das UPDATE verlangt zusätzlich den Code. Trifft es keinen Artikel
+mehr (Code geändert oder an einen anderen Artikel vergeben, Artikel
+gelöscht), wird der Eintrag verworfen und einmal frisch nachgeschlagen.
+"""
+import threading
+from collections import OrderedDict
+
+from .models import Artikel
+from .services import buche_bewegung
+
+# Gemerkte Codes je Prozess
+LRU_GROESSE = 4096
+
+_lru = OrderedDict()
+_sperre = threading.Lock()
+
+
+def code_normalisieren(code):
+    """Code ohne umgebende Leerzeichen (Scanner hängen oft Zeilenumbrüche an); None, wenn leer."""
+    code = (code or '').strip()
+    return code or None
+
+
+def artikel_zum_code(lager_id, code):
+    """ID des Artikels mit ``code`` in einem Lager, mit einer Abfrage über den Index.
+
+    Löst ``Artikel.DoesNotExist`` aus, wenn kein Artikel den Code trägt.
+    """
+    return Artikel.objects.filter(lager_id=lager_id, code=code).values_list('id', flat=True).get()
+
+
+def _gemerkt(lager_id, code):
+    with _sperre:
+        artikel_id = _lru.get((lager_id, code))
+        if artikel_id is not None:
+            _lru.move_to_end((lager_id, code))
+        return artikel_id
+
+
+def _merken(lager_id, code, artikel_id):
+    with _sperre:
+        _lru[(lager_id, code)] = artikel_id
+        _lru.move_to_end((lager_id, code))
+        while len(_lru) > LRU_GROESSE:
+            _lru.popitem(last=False)
+
+
+def _vergessen(lager_id, code):
+    with _sperre:
+        _lru.pop((lager_id, code), None)
+
+
+def lru_leeren():
+    with _sperre:
+        _lru.clear()
+
+
+def buche_scan(lager, code, transaction_type, quantity=1, anfrage_id=None):
+    """Bucht den Artikel mit ``code`` wie ``buche_bewegung``; liefert die ``Transaction``.
+
+    Löst ``Artikel.DoesNotExist`` aus, wenn es im Lager keinen Artikel mit
+    dem Code gibt, sonst dieselben Fehler wie ``buche_bewegung``.
+    """
+    artikel_id = _gemerkt(lager.id, code)
+    if artikel_id is not None:
+        try:
+            return buche_bewegung(lager, artikel_id, transaction_type, quantity, anfrage_id, code=code)
+        except Artikel.DoesNotExist:
+            # Zuordnung veraltet: frisch nachschlagen
+            _vergessen(lager.id, code)
+
+    artikel_id = artikel_zum_code(lager.id, code)
+    _merken(lager.id, code, artikel_id)
+    return buche_bewegung(lager, artikel_id, transaction_type, quantity, anfrage_id, code=code)
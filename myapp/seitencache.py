@@ -0,0 +1,110 @@
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition
+
+from .kennzahlen import kennzahlen_verwerfen
+
+# Gerenderte Fragmente; der Schlüssel enthält die Version, alte Einträge laufen einfach ab
+FRAGMENT_TIMEOUT = 300
+
+# Versionszähler je Lager. Jede Änderung setzt ihn neu, daraus werden ETag,
+# Last-Modified und die Schlüssel des Fragment-Caches gebildet. Er liegt im
+# Django-Cache; bei mehreren Worker-Prozessen muss das ein gemeinsamer Cache
+# (Redis, Memcached, Datenbank) sein, sonst sehen die Prozesse verschiedene Stände.
+
+
+def _version_key(lager_id):
+    return f'lager:{lager_id}:version'
+
+
+def lager_version(request, lager_id):
+    """Aktuelle Version eines Lagers (Nanosekunden-Zeitstempel der letzten Änderung).
+
+    Fehlt der Zähler (neu oder aus dem Cache verdrängt), beginnt er bei der
+    aktuellen Zeit, damit alte ETags nicht wieder gültig werden. Pro Request
+    wird höchstens einmal nachgeschlagen.
+    """
+    versionen = request.__dict__.setdefault('_lager_versionen', {})
+    if lager_id not in versionen:
+        version = cache.get(_version_key(lager_id))
+        if version is None:
+            cache.add(_version_key(lager_id), time.time_ns(), None)
+            version = cache.get(_version_key(lager_id))
+        versionen[lager_id] = version
+    return versionen[lager_id]
+
+
+def lager_geaendert(lager_id):
+    """Markiert ein Lager als geändert, sobald die laufende Transaktion committet ist.
+
+    Setzt den Versionszähler neu und verwirft die Kennzahlen; alle ETags und
+    Fragmente des Lagers sind damit veraltet.
+    """
+    kennzahlen_verwerfen(lager_id)
+    transaction.on_commit(lambda: cache.set(_version_key(lager_id), time.time_ns(), None))
+
+
+def bedingte_anfrage(zeitraster=None):
+    """Decorator für Lager-Views: ETag/Last-Modified aus der Lager-Version, sonst ``304``.
+
+    Der ETag gilt je Benutzer, weil die Seiten benutzerabhängige Teile haben.
+    ``zeitraster`` (Sekunden) lässt ihn zusätzlich ablaufen, für Inhalte, die
+    sich ohne Änderung verschieben (z. B. Kennzahlen über die letzten 7 Tage).
+    Stehen noch Meldungen aus, wird immer vollständig ausgeliefert.
+    """
+    def stand(request, lager_id):
+        if len(messages.get_messages(request)):
+            return None
+        zeitpunkt = lager_version(request, lager_id)
+        if zeitraster:
+            zeitpunkt = max(zeitpunkt, int(time.time() // zeitraster * zeitraster) * 10**9)
+        return zeitpunkt
+
+    def etag(request, lager_id, *args, **kwargs):
+        zeitpunkt = stand(request, lager_id)
+        if zeitpunkt is not None:
+            return f'{lager_id}-{zeitpunkt}-{request.user.id}'
+
+    def last_modified(request, lager_id, *args, **kwargs):
+        zeitpunkt = stand(request, lager_id)
+        if zeitpunkt is not None:
+            return datetime.fromtimestamp(zeitpunkt / 10**9, tz=dt_timezone.utc)
+
+    def decorator(view):
+        bedingt = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = bedingt(request, *args, **kwargs)
+            # Der Browser darf die Seite behalten, muss sie aber jedes Mal prüfen lassen
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def fragment(request, lager, template, kontext, schluessel=()):
+    """Gerendertes Teil-Template aus dem Cache (Schlüssel: Lager, Version, Template, Query).
+
+    ``kontext`` ist eine Funktion und wird nur bei einem Fehlschlag aufgerufen,
+    die Abfragen für den Inhalt entfallen bei einem Treffer also ganz.
+    ``schluessel`` nimmt weitere Bestandteile auf, von denen das Fragment abhängt.
+    """
+    teile = [template, *map(str, schluessel), *sorted(request.GET.lists())]
+    digest = hashlib.md5(repr(teile).encode()).hexdigest()
+    key = f'lager:{lager.id}:fragment:{lager_version(request, lager.id)}:{digest}'
+
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(template, {'lager': lager, **kontext()}, request=request)
+        cache.set(key, str(html), FRAGMENT_TIMEOUT)
+    return mark_safe(html)
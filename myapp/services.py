@@ -0,0 +1,306 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .live import bestand_melden
+from .models import Artikel, Transaction
+from .seitencache import lager_geaendert
+from .warnungen import warnungen_oeffnen, warnungen_schliessen
+
+# So lange merkt sich der Cache eine Anfrage-Kennung; danach hilft der Unique-Index
+ANFRAGE_TIMEOUT = 600
+ANFRAGE_MAX_LAENGE = Transaction._meta.get_field('anfrage_id').max_length
+# Größte Menge je Buchung: Bereich von PositiveIntegerField auf allen Datenbanken
+MAX_MENGE = 2**31 - 1
+MENGE_ZU_GROSS = f'Die Menge darf höchstens {MAX_MENGE} sein.'
+
+
+class NichtGenugBestand(Exception):
+    """Wird ausgelöst, wenn ein Abgang den vorhandenen Bestand übersteigt."""
+
+
+class AnfrageKonflikt(Exception):
+    """Die Anfrage-Kennung wurde schon für eine Buchung mit anderem Inhalt benutzt."""
+
+
+def ganzzahl(wert):
+    """``int(wert)``, aber ohne stilles Abschneiden: 2.7 und ``True`` lösen ``ValueError`` aus."""
+    if isinstance(wert, bool) or (isinstance(wert, float) and not wert.is_integer()):
+        raise ValueError(f'{wert!r} ist keine ganze Zahl.')
+    return int(wert)
+
+
+def _anfrage_key(lager_id, anfrage_id):
+    return f'lager:{lager_id}:anfrage:{hashlib.md5(anfrage_id.encode()).hexdigest()}'
+
+
+def gebuchte_anfrage(lager_id, anfrage_id):
+    """Die ``Transaction`` einer bereits gebuchten Anfrage oder None.
+
+    Erst der Cache, dann eine Abfrage über den Unique-Index (lager, anfrage_id).
+    """
+    buchung = cache.get(_anfrage_key(lager_id, anfrage_id))
+    if buchung is None:
+        buchung = Transaction.objects.filter(lager_id=lager_id, anfrage_id=anfrage_id).first()
+    return buchung
+
+
+def buche_bewegung(lager, article_id, transaction_type, quantity, anfrage_id=None, code=None):
+    """Bucht einen Wareneingang oder -ausgang atomar und ohne Lese-Schreib-Zyklus.
+
+    Der Bestand wird mit einem einzigen bedingten UPDATE
+    (``menge = menge ± n WHERE menge >= n``) geändert, sodass parallele
+    Buchungen auf denselben Artikel weder verloren gehen noch überbuchen.
+    Die zugehörige ``Transaction`` wird in derselben DB-Transaktion angelegt.
+
+    Mit ``anfrage_id`` ist die Buchung idempotent: Wiederholt ein Gerät die
+    Anfrage, kommt die ursprüngliche ``Transaction`` zurück (``wiederholt``
+    ist dann True), ohne dass der Artikel angefasst wird. Überholen sich zwei
+    Wiederholungen, verhindert der Unique-Index die zweite Buchung. Als
+    Fingerabdruck der Anfrage dient die gespeicherte Buchung selbst: weicht
+    Artikel, Typ oder Menge ab, ist es keine Wiederholung, sondern eine
+    wiederverwendete Kennung (``AnfrageKonflikt``).
+
+    Mit ``code`` bucht das UPDATE nur, wenn der Artikel diesen Code noch hat
+    (sonst ``Artikel.DoesNotExist``); so prüft myapp.scanner seine Zuordnungen.
+    """
+    if transaction_type not in ('in', 'out'):
+        raise ValueError(f'Unbekannter Transaktionstyp: {transaction_type!r}')
+    if quantity <= 0:
+        raise ValueError('Die Menge muss größer als 0 sein.')
+    if quantity > MAX_MENGE:
+        raise ValueError(MENGE_ZU_GROSS)
+    if anfrage_id is None:
+        return _buchen(lager, article_id, transaction_type, quantity, code=code)
+    if not isinstance(anfrage_id, str) or len(anfrage_id) > ANFRAGE_MAX_LAENGE:
+        raise ValueError(f'Die Anfrage-Kennung muss ein Text mit höchstens {ANFRAGE_MAX_LAENGE} Zeichen sein.')
+
+    buchung = gebuchte_anfrage(lager.id, anfrage_id)
+    if buchung is not None:
+        return _wiederholung(buchung, article_id, transaction_type, quantity)
+    try:
+        buchung = _buchen(lager, article_id, transaction_type, quantity, anfrage_id, code)
+    except IntegrityError:
+        # Eine parallele Wiederholung war schneller; deren Buchung gilt
+        buchung = Transaction.objects.get(lager_id=lager.id, anfrage_id=anfrage_id)
+        return _wiederholung(buchung, article_id, transaction_type, quantity)
+    buchung.wiederholt = False
+    transaction.on_commit(lambda: cache.set(_anfrage_key(lager.id, anfrage_id), buchung, ANFRAGE_TIMEOUT))
+    return buchung
+
+
+def _wiederholung(buchung, article_id, transaction_type, quantity):
+    # article_id kann aus einem Formular als Text kommen
+    if (str(buchung.article_id), buchung.type, buchung.quantity) != (str(article_id), transaction_type, quantity):
+        raise AnfrageKonflikt
+    buchung.wiederholt = True
+    return buchung
+
+
+def _buchen(lager, article_id, transaction_type, quantity, anfrage_id=None, code=None):
+    with transaction.atomic():
+        artikel = Artikel.objects.filter(id=article_id, lager=lager)
+        if code is not None:
+            artikel = artikel.filter(code=code)
+        if transaction_type == 'in':
+            updated = artikel.update(menge=F('menge') + quantity)
+        else:
+            updated = artikel.filter(menge__gte=quantity).update(menge=F('menge') - quantity)
+
+        if not updated:
+            # Nur im Fehlerfall unterscheiden, ob der Artikel fehlt oder der Bestand nicht reicht
+            if not artikel.exists():
+                raise Artikel.DoesNotExist
+            raise NichtGenugBestand
+
+        # Nur der gebuchte Artikel wird geprüft: Abgänge können eine Warnung auslösen, Zugänge eine erledigen
+        if transaction_type == 'out':
+            warnungen_oeffnen(lager.id, [article_id])
+        else:
+            warnungen_schliessen(lager.id, [article_id])
+        lager_geaendert(lager.id)
+        bestand_melden(lager.id, {article_id: quantity if transaction_type == 'in' else -quantity})
+        return Transaction.objects.create(
+            article_id=article_id, lager=lager, type=transaction_type, quantity=quantity, anfrage_id=anfrage_id
+        )
+
+
+def buche_bewegungen(lager, positionen):
+    """Bucht viele Positionen (article, type, quantity) in einer DB-Transaktion.
+
+    Alle betroffenen Artikel werden mit einer Abfrage geladen und gesperrt,
+    die Positionen der Reihe nach gegen den laufenden Bestand geprüft und die
+    gültigen mit ``bulk_update``/``bulk_create`` geschrieben. Fehlerhafte
+    Positionen werden übersprungen und einzeln im Ergebnis gemeldet.
+
+    ``bulk_update`` schreibt die in Python gerechneten Bestände absolut; das
+    ist nur sicher, weil bis zum Commit niemand anderes die Artikel ändern
+    kann. PostgreSQL hält dafür die Zeilensperren aus ``select_for_update``.
+    SQLite kennt keine Zeilensperren, dort nimmt ``transaction_mode=IMMEDIATE``
+    (siehe settings) die Schreibsperre der Datenbank schon beim Beginn der
+    Transaktion. Ohne diese Einstellung verliert SQLite ebenfalls keine
+    Buchung, ein paralleler Schreiber scheitert dann aber mit "database is
+    locked".
+    """
+    ergebnisse = [None] * len(positionen)
+    gueltig = []
+    for i, position in enumerate(positionen):
+        try:
+            article_id = ganzzahl(position['article'])
+            transaction_type = position['type']
+            quantity = ganzzahl(position['quantity'])
+        except (KeyError, TypeError, ValueError):
+            ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Ungültige Position.'}
+            continue
+        if transaction_type not in ('in', 'out'):
+            ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Unbekannter Transaktionstyp.'}
+        elif quantity <= 0:
+            ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Die Menge muss größer als 0 sein.'}
+        elif quantity > MAX_MENGE:
+            ergebnisse[i] = {'line': i, 'ok': False, 'error': MENGE_ZU_GROSS}
+        else:
+            gueltig.append((i, article_id, transaction_type, quantity))
+
+    with transaction.atomic():
+        # Sperren in fester Reihenfolge (nach id), damit parallele Batches nicht verklemmen
+        artikel = {
+            a.id: a for a in Artikel.objects.select_for_update()
+            .filter(lager=lager, id__in={article_id for _, article_id, _, _ in gueltig})
+            .only('id', 'menge').order_by('id')
+        }
+        geaendert = {}
+        deltas = {}
+        zugaenge, abgaenge = set(), set()
+        neue_transaktionen = []
+        for i, article_id, transaction_type, quantity in gueltig:
+            a = artikel.get(article_id)
+            if a is None:
+                ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Artikel nicht gefunden.'}
+                continue
+            if transaction_type == 'out' and a.menge < quantity:
+                ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Nicht genügend Artikel für den Abgang verfügbar!'}
+                continue
+            a.menge += quantity if transaction_type == 'in' else -quantity
+            geaendert[article_id] = a
+            (zugaenge if transaction_type == 'in' else abgaenge).add(article_id)
+            deltas[article_id] = deltas.get(article_id, 0) + (quantity if transaction_type == 'in' else -quantity)
+            neue_transaktionen.append(
+                Transaction(article_id=article_id, lager=lager, type=transaction_type, quantity=quantity)
+            )
+            ergebnisse[i] = {'line': i, 'ok': True, 'menge': a.menge}
+
+        Artikel.objects.bulk_update(geaendert.values(), ['menge'])
+        Transaction.objects.bulk_create(neue_transaktionen)
+        if neue_transaktionen:
+            warnungen_oeffnen(lager.id, sorted(abgaenge))
+            warnungen_schliessen(lager.id, sorted(zugaenge))
+            lager_geaendert(lager.id)
+            bestand_melden(lager.id, deltas)
+
+    return ergebnisse
+
+
+def umbuchen(von_lager, nach_lager, positionen):
+    """Bucht Positionen (article, quantity) von einem Lager in ein anderes, atomar je Aufruf.
+
+    ``article`` ist die ID im Quelllager; das Gegenstück im Ziellager wird
+    über den Namen gefunden und, falls es fehlt, mit Bestand 0 angelegt. Alle
+    beteiligten Artikel beider Lager werden mit einer Abfrage in fester
+    Reihenfolge (nach id) gesperrt, sodass sich gegenläufige Umbuchungen
+    nicht verklemmen. Beide Seiten ändert ein einziges bedingtes UPDATE
+    (``menge = menge + delta WHERE menge + delta >= 0``); greift es nicht für
+    alle Artikel, wird alles zurückgerollt (``NichtGenugBestand``). Abgang und
+    Zugang tragen dieselbe ``umbuchung``-Kennung. Ungültige Positionen werden
+    wie bei ``buche_bewegungen`` übersprungen und einzeln gemeldet.
+    Liefert ``(umbuchung, ergebnisse)``.
+    """
+    if von_lager.id == nach_lager.id:
+        raise ValueError('Quell- und Ziellager müssen verschieden sein.')
+
+    ergebnisse = [None] * len(positionen)
+    gueltig = []
+    for i, position in enumerate(positionen):
+        try:
+            article_id = ganzzahl(position['article'])
+            quantity = ganzzahl(position['quantity'])
+        except (KeyError, TypeError, ValueError):
+            ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Ungültige Position.'}
+            continue
+        if quantity <= 0:
+            ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Die Menge muss größer als 0 sein.'}
+        elif quantity > MAX_MENGE:
+            ergebnisse[i] = {'line': i, 'ok': False, 'error': MENGE_ZU_GROSS}
+        else:
+            gueltig.append((i, article_id, quantity))
+
+    kennung = uuid.uuid4()
+    with transaction.atomic():
+        quellen = {
+            article_id: (name, menge) for article_id, name, menge in
+            Artikel.objects.filter(lager=von_lager, id__in={article_id for _, article_id, _ in gueltig})
+            .values_list('id', 'name', 'menge')
+        }
+        namen = {name for name, _ in quellen.values()}
+        # Fehlende Gegenstücke anlegen (nur für Positionen, die der Bestand voraussichtlich deckt);
+        # ein parallel angelegtes gewinnt über den Unique-Index
+        Artikel.objects.bulk_create(
+            [
+                Artikel(lager=nach_lager, name=name, menge=0) for name in sorted({
+                    quellen[article_id][0] for _, article_id, quantity in gueltig
+                    if article_id in quellen and quellen[article_id][1] >= quantity
+                })
+            ],
+            ignore_conflicts=True,
+        )
+        artikel = {
+            a.id: a for a in Artikel.objects.select_for_update()
+            .filter(Q(lager=von_lager, id__in=quellen) | Q(lager=nach_lager, name__in=namen))
+            .only('id', 'lager_id', 'name', 'menge').order_by('id')
+        }
+        ziele = {a.name: a for a in artikel.values() if a.lager_id == nach_lager.id}
+
+        deltas = {}
+        neue_transaktionen = []
+        for i, article_id, quantity in gueltig:
+            quelle = artikel.get(article_id)
+            if quelle is None or quelle.lager_id != von_lager.id:
+                ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Artikel nicht gefunden.'}
+                continue
+            if quelle.menge < quantity:
+                ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Nicht genügend Artikel für den Abgang verfügbar!'}
+                continue
+            ziel = ziele.get(quelle.name)
+            if ziel is None:
+                # Beim ersten Lesen reichte der Bestand nicht, das Gegenstück wurde nicht angelegt
+                ergebnisse[i] = {'line': i, 'ok': False, 'error': 'Nicht genügend Artikel für den Abgang verfügbar!'}
+                continue
+            quelle.menge -= quantity
+            ziel.menge += quantity
+            deltas[quelle.id] = deltas.get(quelle.id, 0) - quantity
+            deltas[ziel.id] = deltas.get(ziel.id, 0) + quantity
+            neue_transaktionen += [
+                Transaction(article_id=quelle.id, lager=von_lager, type='out', quantity=quantity, umbuchung=kennung),
+                Transaction(article_id=ziel.id, lager=nach_lager, type='in', quantity=quantity, umbuchung=kennung),
+            ]
+            ergebnisse[i] = {'line': i, 'ok': True, 'menge': quelle.menge, 'target': ziel.id, 'target_menge': ziel.menge}
+
+        if neue_transaktionen:
+            delta = Case(*[When(id=a, then=Value(d)) for a, d in deltas.items()], output_field=IntegerField())
+            geaendert = Artikel.objects.filter(id__in=deltas, menge__gte=-delta).update(menge=F('menge') + delta)
+            if geaendert != len(deltas):
+                # Ohne Zeilensperren (SQLite) kann ein paralleler Abgang dazwischengekommen sein
+                raise NichtGenugBestand
+            Transaction.objects.bulk_create(neue_transaktionen)
+
+            abgaenge = sorted(a for a, d in deltas.items() if artikel[a].lager_id == von_lager.id)
+            zugaenge = sorted(a for a, d in deltas.items() if artikel[a].lager_id == nach_lager.id)
+            warnungen_oeffnen(von_lager.id, abgaenge)
+            warnungen_schliessen(nach_lager.id, zugaenge)
+            for lager in (von_lager, nach_lager):
+                lager_geaendert(lager.id)
+                bestand_melden(lager.id, {a: d for a, d in deltas.items() if artikel[a].lager_id == lager.id})
+
+    return kennung, ergebnisse
@@ -0,0 +1,101 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+SEITENGROESSE = 50
+
+STEUERZEICHEN = re.compile(r'[\x00-\x1f\x7f]')
+
+# Volltextindex über Artikel.name. SQLite: FTS5 mit Trigramm-Tokenizer als
+# External-Content-Tabelle, gepflegt über Trigger. PostgreSQL: pg_trgm-GIN-Index,
+# den ``name__icontains`` (UPPER(name) LIKE ...) direkt nutzt.
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS myapp_artikel_fts USING fts5(
+        name, content='myapp_artikel', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS myapp_artikel_fts_ai AFTER INSERT ON myapp_artikel BEGIN
+        INSERT INTO myapp_artikel_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS myapp_artikel_fts_ad AFTER DELETE ON myapp_artikel BEGIN
+        INSERT INTO myapp_artikel_fts(myapp_artikel_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS myapp_artikel_fts_au AFTER UPDATE OF name ON myapp_artikel BEGIN
+        INSERT INTO myapp_artikel_fts(myapp_artikel_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO myapp_artikel_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+]
+POSTGRES_TRGM = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS artikel_name_trgm_idx ON myapp_artikel USING gin (UPPER(name) gin_trgm_ops)',
+]
+
+
+def suchindex_einrichten(conn):
+    """Legt den Suchindex samt Triggern an (idempotent).
+
+    Wird aus der Migration und nach jedem ``migrate`` aufgerufen, weil SQLite
+    beim Umbau von ``myapp_artikel`` durch spätere Migrationen die Trigger verwirft.
+    """
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'myapp_artikel_fts'")
+            neu = cursor.fetchone() is None
+            for sql in SQLITE_FTS:
+                cursor.execute(sql)
+            if neu:
+                cursor.execute("INSERT INTO myapp_artikel_fts(myapp_artikel_fts) VALUES ('rebuild')")
+        elif conn.vendor == 'postgresql':
+            for sql in POSTGRES_TRGM:
+                cursor.execute(sql)
+
+
+def suchindex_entfernen(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            for trigger in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS myapp_artikel_fts_{trigger}')
+            cursor.execute('DROP TABLE IF EXISTS myapp_artikel_fts')
+        elif conn.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS artikel_name_trgm_idx')
+
+
+def suche_artikel(queryset, begriff):
+    """Filtert ``queryset`` auf Artikel, deren Name ``begriff`` enthält.
+
+    Unter SQLite wird ab drei Zeichen der FTS5-Trigrammindex genutzt statt
+    eines vollständigen ``LIKE``-Scans; kürzere Begriffe fallen auf
+    ``icontains`` innerhalb des (bereits eingeschränkten) Querysets zurück.
+    Steuerzeichen werden entfernt; ein NUL-Byte beendet sonst die FTS5-Phrase
+    vorzeitig (Syntaxfehler statt Treffer).
+    """
+    begriff = STEUERZEICHEN.sub('', begriff or '')
+    if not begriff:
+        return queryset
+    if connection.vendor == 'sqlite' and len(begriff) >= 3:
+        phrase = '"' + begriff.replace('"', '""') + '"'
+        return queryset.filter(id__in=RawSQL(
+            'SELECT rowid FROM myapp_artikel_fts WHERE myapp_artikel_fts MATCH %s', [phrase]
+        ))
+    return queryset.filter(name__icontains=begriff)
+
+
+def keyset_seite(queryset, nach=None, groesse=SEITENGROESSE):
+    """Liefert eine Seite nach Name sortiert ab dem Cursor ``nach`` (exklusiv).
+
+    Da der Name pro Lager eindeutig ist, genügt er als Cursor; die Abfrage
+    läuft über den (lager, name)-Index und kostet unabhängig von der
+    Seitenzahl gleich viel. Rückgabe: ``(einträge, nächster_cursor)``.
+    """
+    queryset = queryset.order_by('name')
+    if nach:
+        queryset = queryset.filter(name__gt=nach)
+    eintraege = list(queryset[:groesse + 1])
+    if len(eintraege) > groesse:
+        eintraege = eintraege[:groesse]
+        return eintraege, _name(eintraege[-1])
+    return eintraege, None
+
+
+def _name(eintrag):
+    return eintrag['name'] if isinstance(eintrag, dict) else eintrag.name
@@ -0,0 +1,11 @@
+from django import template
+
+from myapp.bilder import THUMBNAIL_GROESSEN, thumbnail_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail(foto, groesse=THUMBNAIL_GROESSEN[0]):
+    """URL des Vorschaubilds zu einem ``ImageField``-Wert: ``{% thumbnail artikel.foto 160 %}``."""
+    return thumbnail_url(foto.name if foto else None, groesse) or ''
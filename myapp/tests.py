@@ -1,3 +1,1571 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import io
+import json
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import StreamingHttpResponse
+from django.db import connection, connections, IntegrityError, OperationalError, transaction as db_transaction
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+
+from .models import Lager, LagerAccess, Artikel, Transaction, ArchivBuchung, Auftrag, BestandsSnapshot, Prognose, Warnung
+from .archiv import MIN_MONATE, archivgrenze, archivieren, buchungen_bereinigen
+from .auftraege import abarbeiten, MAX_VERSUCHE
+from .bilder import foto_speicher, thumbnail_name
+from .benchmark import anmeldung_messen, auswerten, cache_verwerfen, daten_anlegen, eigener_cache, perzentil
+from .bestand import bestand_am, erstelle_snapshot
+from .suche import keyset_seite, suche_artikel, SEITENGROESSE
+from .export import transaktions_zeilen
+from .kennzahlen import kennzahlen
+from .live import LokalerKanal, PUFFER
+from .messung import AbfragenBudgetUeberschritten, budget_pruefen, statistik_zuruecksetzen
+from .prognose import HISTORIE, abgangsreihen, berechnen, prognosen_berechnen
+from .replikate import KLEBE_COOKIE
+from .importer import importiere_artikel
+from .scanner import artikel_zum_code, buche_scan, lru_leeren
+from .services import buche_bewegung, umbuchen, AnfrageKonflikt, NichtGenugBestand
+from .views import BUCHUNG_MAX_POSITIONEN
+from .warnungen import warnungen_pruefen
+
+
+
+class BudgetClient(Client):
+    """Test-Client, der jede Antwort gegen das Abfragen-Budget ihres Views prüft."""
+
+    def request(self, **request):
+        return budget_pruefen(super().request(**request))
+
+
+class AsyncBudgetClient(AsyncClient):
+    async def request(self, **request):
+        return budget_pruefen(await super().request(**request))
+
+
+class BudgetTestCase(TestCase):
+    client_class = BudgetClient
+    async_client_class = AsyncBudgetClient
+
+
+class BudgetTransactionTestCase(TransactionTestCase):
+    client_class = BudgetClient
+    async_client_class = AsyncBudgetClient
+
+
+class BuchungTests(BudgetTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=5, lager=self.lager)
+
+    def test_eingang_und_ausgang(self):
+        buche_bewegung(self.lager, self.artikel.id, 'in', 3)
+        buche_bewegung(self.lager, self.artikel.id, 'out', 8)
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 0)
+        self.assertEqual(Transaction.objects.filter(article=self.artikel).count(), 2)
+
+    def test_ausgang_ohne_bestand_bucht_nichts(self):
+        with self.assertRaises(NichtGenugBestand):
+            buche_bewegung(self.lager, self.artikel.id, 'out', 6)
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 5)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_buchung_ist_ein_update_und_ein_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            buche_bewegung(self.lager, self.artikel.id, 'out', 1)
+        statements = [q['sql'].split()[0] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        # Bestand, Mindestbestandsprüfung nur für diesen Artikel, Journal
+        self.assertEqual(statements, ['UPDATE', 'INSERT', 'INSERT'])
+
+    def test_view_bucht_ausgang(self):
+        self.client.force_login(self.user)
+        response = self.client.post(f'/lager/{self.lager.id}/transaction/', {
+            'transaction_type': 'out', 'article': self.artikel.id, 'quantity': 2,
+        })
+        self.assertRedirects(response, f'/lager/{self.lager.id}/')
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 3)
+
+    def test_sammelbuchung_meldet_fehler_je_position(self):
+        mutter = Artikel.objects.create(name='Mutter', menge=0, lager=self.lager)
+        self.client.force_login(self.user)
+        lines = [
+            {'article': self.artikel.id, 'type': 'out', 'quantity': 4},
+            {'article': self.artikel.id, 'type': 'out', 'quantity': 4},
+            {'article': mutter.id, 'type': 'in', 'quantity': 10},
+            {'article': 999999, 'type': 'in', 'quantity': 1},
+            {'article': mutter.id, 'type': 'weg', 'quantity': 1},
+        ]
+        # Die Session kommt aus dem Cache, der Benutzer einmal aus der Datenbank
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                f'/lager/{self.lager.id}/transaction/bulk/',
+                data={'lines': lines * 20}, content_type='application/json',
+            )
+        data = response.json()
+        self.assertEqual(data['booked'], 21)
+        self.assertEqual(data['failed'], 79)
+        self.assertEqual(data['results'][1]['error'], 'Nicht genügend Artikel für den Abgang verfügbar!')
+        self.artikel.refresh_from_db()
+        mutter.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 1)
+        self.assertEqual(mutter.menge, 200)
+        self.assertEqual(Transaction.objects.count(), 21)
+
+
+    def test_sammelbuchung_prueft_umfang_und_mengen(self):
+        self.client.force_login(self.user)
+        url = f'/lager/{self.lager.id}/transaction/bulk/'
+        zeile = {'article': self.artikel.id, 'type': 'in', 'quantity': 1}
+        for lines in ([zeile] * (BUCHUNG_MAX_POSITIONEN + 1), [zeile, {**zeile, 'quantity': 2.7}]):
+            response = self.client.post(url, data={'lines': lines}, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+        # Nicht abschneiden: als Text ist 2.7 eine ungültige Position, 2.0 ist 2
+        data = self.client.post(url, data={'lines': [{**zeile, 'quantity': '2.7'}, {**zeile, 'quantity': 2.0}]},
+                                content_type='application/json').json()
+        self.assertEqual((data['booked'], data['results'][0]['error']), (1, 'Ungültige Position.'))
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 7)
+
+    def test_zu_grosse_mengen_werden_gemeldet(self):
+        self.client.force_login(self.user)
+        data = self.client.post(
+            f'/lager/{self.lager.id}/transaction/bulk/',
+            data={'lines': [{'article': self.artikel.id, 'type': 'in', 'quantity': 10**30}]}, content_type='application/json',
+        ).json()
+        self.assertEqual(data['results'][0]['error'], f'Die Menge darf höchstens {2**31 - 1} sein.')
+        response = self.client.post(f'/lager/{self.lager.id}/transaction/', {
+            'transaction_type': 'in', 'article': self.artikel.id, 'quantity': 10**30,
+        }, follow=True)
+        self.assertContains(response, 'Die Menge darf höchstens')
+        response = self.client.post(f'/lager/{self.lager.id}/artikel_management/artikel_create/', {
+            'name': 'Mutter', 'menge': 2**40,
+        })
+        self.assertFalse(response.context['form'].is_valid())
+        self.assertFalse(Transaction.objects.exists())
+
+
+class UmbuchungTests(BudgetTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.ziel = Lager.objects.create(name='Außenlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.ziel.users.add(self.user)
+        self.schraube = Artikel.objects.create(name='Schraube', menge=10, lager=self.lager)
+        self.mutter = Artikel.objects.create(name='Mutter', menge=2, lager=self.lager)
+        self.ziel_schraube = Artikel.objects.create(name='Schraube', menge=1, mindestbestand=3, lager=self.ziel)
+        Warnung.objects.create(lager=self.ziel, artikel=self.ziel_schraube, menge=1, mindestbestand=3)
+
+    def test_beide_seiten_mit_gemeinsamer_kennung(self):
+        kennung, ergebnisse = umbuchen(self.lager, self.ziel, [
+            {'article': self.schraube.id, 'quantity': 4},
+            {'article': self.mutter.id, 'quantity': 2},
+        ])
+        self.assertTrue(all(e['ok'] for e in ergebnisse))
+        ziel_mutter = Artikel.objects.get(lager=self.ziel, name='Mutter')  # neu angelegt
+        self.assertEqual(
+            dict(Artikel.objects.values_list('id', 'menge')),
+            {self.schraube.id: 6, self.mutter.id: 0, self.ziel_schraube.id: 5, ziel_mutter.id: 2},
+        )
+        buchungen = Transaction.objects.filter(umbuchung=kennung)
+        self.assertEqual(
+            sorted(buchungen.values_list('lager_id', 'type', 'quantity')),
+            sorted([(self.lager.id, 'out', 4), (self.lager.id, 'out', 2), (self.ziel.id, 'in', 4), (self.ziel.id, 'in', 2)]),
+        )
+        # Der Zugang erledigt die Warnung im Ziellager
+        self.assertFalse(Warnung.objects.filter(erledigt__isnull=True).exists())
+
+    def test_fehlerhafte_positionen_werden_uebersprungen(self):
+        kennung, ergebnisse = umbuchen(self.lager, self.ziel, [
+            {'article': self.mutter.id, 'quantity': 3},
+            {'article': self.ziel_schraube.id, 'quantity': 1},  # gehört zum Ziellager
+            {'article': self.schraube.id, 'quantity': 0},
+            {'article': self.schraube.id, 'quantity': 6},
+            {'article': self.schraube.id, 'quantity': 6},
+        ])
+        self.assertEqual([e['ok'] for e in ergebnisse], [False, False, False, True, False])
+        self.assertEqual((ergebnisse[3]['menge'], ergebnisse[3]['target_menge']), (4, 7))
+        self.assertEqual(Transaction.objects.filter(umbuchung=kennung).count(), 2)
+        # Für die nicht gedeckte Mutter wird im Ziellager nichts angelegt
+        self.assertFalse(Artikel.objects.filter(lager=self.ziel, name='Mutter').exists())
+
+    def test_gleiches_lager_ist_ein_fehler(self):
+        with self.assertRaises(ValueError):
+            umbuchen(self.lager, self.lager, [{'article': self.schraube.id, 'quantity': 1}])
+
+    def test_endpunkt(self):
+        self.client.force_login(self.user)
+        url = f'/lager/{self.lager.id}/umbuchung/'
+        lines = [{'article': self.schraube.id, 'quantity': 1}, {'article': self.mutter.id, 'quantity': 1}]
+        # Unabhängig von der Zahl der Positionen: je ein Lesen, Anlegen, Sperren, UPDATE und INSERT
+        with self.assertNumQueries(12):
+            response = self.client.post(
+                url, data={'target': self.ziel.id, 'lines': lines * 100}, content_type='application/json'
+            )
+        data = response.json()
+        # Der Bestand reicht für 10 Schrauben und 2 Muttern
+        self.assertEqual((data['booked'], data['failed']), (12, 188))
+        self.assertEqual(Transaction.objects.filter(umbuchung=data['umbuchung']).count(), 24)
+
+        fremdes = Lager.objects.create(name='Fremd', owner=User.objects.create_user('fremder', password='geheim123'))
+        for ziel, status in [(fremdes.id, 403), (999999, 404), (self.lager.id, 400)]:
+            response = self.client.post(url, data={'target': ziel, 'lines': lines}, content_type='application/json')
+            self.assertEqual(response.status_code, status)
+
+
+class ScanTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        lru_leeren()
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=5, lager=self.lager, code='4006381333931')
+        self.mutter = Artikel.objects.create(name='Mutter', menge=5, lager=self.lager)
+        self.client.force_login(self.user)
+        self.url = f'/lager/{self.lager.id}/scan/'
+
+    def _scan(self, **daten):
+        return self.client.post(self.url, data={'type': 'out', **daten}, content_type='application/json')
+
+    def test_code_je_lager_eindeutig(self):
+        anderes = Lager.objects.create(name='Außenlager', owner=self.user)
+        Artikel.objects.create(name='Schraube', menge=0, lager=anderes, code='4006381333931')
+        # Ohne Code beliebig viele
+        Artikel.objects.create(name='Scheibe', menge=0, lager=self.lager)
+        with self.assertRaises(IntegrityError), db_transaction.atomic():
+            Artikel.objects.create(name='Dübel', menge=0, lager=self.lager, code='4006381333931')
+
+    def test_scan_bucht_ein_stueck(self):
+        response = self._scan(code=' 4006381333931\n')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['article'], self.artikel.id)
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 4)
+
+    def test_folgescans_ohne_nachschlagen(self):
+        with mock.patch('myapp.scanner.artikel_zum_code', wraps=artikel_zum_code) as nachschlagen:
+            for _ in range(3):
+                buche_scan(self.lager, '4006381333931', 'in')
+        self.assertEqual(nachschlagen.call_count, 1)
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 8)
+
+    def test_veraltete_zuordnung_wird_erneuert(self):
+        buche_scan(self.lager, '4006381333931', 'in')
+        # Der Code wandert zur Mutter; der gemerkte Eintrag zeigt noch auf die Schraube
+        Artikel.objects.filter(id=self.artikel.id).update(code=None)
+        Artikel.objects.filter(id=self.mutter.id).update(code='4006381333931')
+        buchung = buche_scan(self.lager, '4006381333931', 'in', 2)
+        self.assertEqual(buchung.article_id, self.mutter.id)
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 6)
+        Artikel.objects.filter(id=self.mutter.id).delete()
+        with self.assertRaises(Artikel.DoesNotExist):
+            buche_scan(self.lager, '4006381333931', 'in')
+
+    def test_fehler(self):
+        self.assertEqual(self._scan(code='unbekannt').status_code, 404)
+        self.assertEqual(self._scan(code='4006381333931', quantity=6).status_code, 409)
+        self.assertEqual(self._scan(code='  ').status_code, 400)
+        self.assertEqual(self._scan(code='4006381333931', type='weg').status_code, 400)
+        self.assertEqual(self._scan(code='4006381333931', anfrage_id=5).status_code, 400)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_wiederholter_scan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            erste = self.client.post(
+                self.url, data={'code': '4006381333931', 'type': 'out'}, content_type='application/json',
+                headers={'Idempotency-Key': 'scan-1'},
+            )
+        zweite = self.client.post(
+            self.url, data={'code': '4006381333931', 'type': 'out'}, content_type='application/json',
+            headers={'Idempotency-Key': 'scan-1'},
+        )
+        self.assertEqual(zweite['Idempotent-Replayed'], 'true')
+        self.assertEqual(zweite.json()['id'], erste.json()['id'])
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 4)
+
+    def test_code_nachschlagen(self):
+        response = self.client.get(self.url, {'code': '4006381333931'})
+        self.assertEqual(response.json(), {'id': self.artikel.id, 'name': 'Schraube', 'menge': 5, 'code': '4006381333931'})
+        self.assertEqual(self.client.get(self.url, {'code': 'unbekannt'}).status_code, 404)
+
+    def test_formular_ohne_katalog_und_mit_code(self):
+        url = f'/lager/{self.lager.id}/transaction/'
+        self.assertNotContains(self.client.get(url), 'Mutter')
+        response = self.client.post(url, {'transaction_type': 'in', 'code': '4006381333931', 'quantity': 3})
+        self.assertRedirects(response, f'/lager/{self.lager.id}/')
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 8)
+        response = self.client.post(url, {'transaction_type': 'in', 'code': 'unbekannt', 'quantity': 1}, follow=True)
+        self.assertContains(response, 'Kein Artikel mit dem Code unbekannt')
+
+    def test_doppelter_code_beim_bearbeiten(self):
+        response = self.client.post(
+            f'/lager/{self.lager.id}/artikel_management/{self.mutter.id}/edit/',
+            {'name': 'Mutter', 'code': '4006381333931', 'menge': 5, 'mindestbestand': 0}, follow=True,
+        )
+        self.assertContains(response, 'Der Code 4006381333931 ist bereits einem anderen Artikel zugeordnet!')
+        self.client.post(
+            f'/lager/{self.lager.id}/artikel_management/{self.mutter.id}/edit/',
+            {'name': 'Mutter', 'code': ' M8 ', 'menge': 5, 'mindestbestand': 0},
+        )
+        self.mutter.refresh_from_db()
+        self.assertEqual(self.mutter.code, 'M8')
+
+
+class ZugriffTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('besitzer', password='geheim123')
+        self.fremder = User.objects.create_user('fremder', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.owner)
+        self.lager.users.add(self.owner)
+
+    def test_nicht_mitglieder_werden_abgewiesen(self):
+        self.client.force_login(self.fremder)
+        for url in ['', 'current_status/', 'transaction/', 'artikel_management/', 'artikel_management/artikel_create/']:
+            response = self.client.get(f'/lager/{self.lager.id}/{url}')
+            self.assertRedirects(response, '/lager/', fetch_redirect_response=False)
+        response = self.client.post(
+            f'/lager/{self.lager.id}/transaction/bulk/', data={'lines': []}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_freigabe_ueber_lageraccess_genuegt(self):
+        LagerAccess.objects.create(lager=self.lager, user=self.fremder)
+        self.client.force_login(self.fremder)
+        self.assertEqual(self.client.get(f'/lager/{self.lager.id}/current_status/').status_code, 200)
+
+    def test_unbekanntes_lager_liefert_404(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get('/lager/999999/').status_code, 404)
+
+    def test_abfragen_unabhaengig_von_der_mitgliederzahl(self):
+        self.client.force_login(self.owner)
+        url = f'/lager/{self.lager.id}/artikel_management/'
+        cache.clear()
+        with CaptureQueriesContext(connection) as wenige:
+            self.client.get(url)
+        self.lager.users.add(*[User.objects.create(username=f'user{i}') for i in range(50)])
+        cache.clear()
+        with CaptureQueriesContext(connection) as viele:
+            self.client.get(url)
+        self.assertEqual(len(wenige), len(viele))
+
+
+class SucheTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        Artikel.objects.bulk_create([
+            Artikel(name=f'Schraube M{i:03d}', menge=i % 2, lager=self.lager) for i in range(120)
+        ] + [Artikel(name='Mutter M8', menge=3, lager=self.lager)])
+
+    def test_keyset_seiten_ueberlappen_nicht(self):
+        seite1, nach = keyset_seite(self.lager.artikel.all())
+        seite2, nach = keyset_seite(self.lager.artikel.all(), nach)
+        seite3, nach = keyset_seite(self.lager.artikel.all(), nach)
+        namen = [a.name for a in seite1 + seite2 + seite3]
+        self.assertEqual(len(namen), 121)
+        self.assertEqual(namen, sorted(set(namen)))
+        self.assertIsNone(nach)
+
+    def test_volltextsuche_findet_teilwort(self):
+        namen = set(suche_artikel(self.lager.artikel.all(), 'utte').values_list('name', flat=True))
+        self.assertEqual(namen, {'Mutter M8'})
+        # Der Index folgt Umbenennungen über die Trigger
+        Artikel.objects.filter(name='Mutter M8').update(name='Flügelmutter')
+        self.assertEqual(suche_artikel(self.lager.artikel.all(), 'utte').get().name, 'Flügelmutter')
+        self.assertFalse(suche_artikel(self.lager.artikel.all(), 'M8').exists())
+
+    def test_steuerzeichen_im_suchbegriff(self):
+        self.assertEqual(suche_artikel(self.lager.artikel.all(), 'Mut\x00ter').get().name, 'Mutter M8')
+        self.assertEqual(suche_artikel(self.lager.artikel.all(), '\x00\x01').count(), 121)
+        self.client.force_login(self.user)
+        for url in (f'/lager/{self.lager.id}/artikel/suche/', f'/lager/{self.lager.id}/current_status/'):
+            self.assertEqual(self.client.get(url, {'q': 'abc\x00"def'}).status_code, 200)
+
+    def test_json_suche_liefert_nur_bestand(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f'/lager/{self.lager.id}/artikel/suche/', {'q': 'M00', 'bestand': 1})
+        data = response.json()
+        self.assertEqual([a['name'] for a in data['results']], [f'Schraube M00{i}' for i in (1, 3, 5, 7, 9)])
+        self.assertIsNone(data['next'])
+
+    def test_aktueller_stand_ist_seitenweise(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f'/lager/{self.lager.id}/current_status/')
+        self.assertEqual(len(response.context['articles']), SEITENGROESSE)
+        self.assertEqual(response.context['naechste_seite'], response.context['articles'][-1].name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BilderTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.client.force_login(self.user)
+
+    def _bild(self, name, farbe='orange'):
+        puffer = BytesIO()
+        Image.new('RGB', (1200, 800), farbe).save(puffer, 'PNG')
+        return SimpleUploadedFile(name, puffer.getvalue(), content_type='image/png')
+
+    def test_gleiche_bilder_werden_nur_einmal_gespeichert(self):
+        for name in ('Schraube', 'Mutter'):
+            self.client.post(f'/lager/{self.lager.id}/artikel_management/artikel_create/', {
+                'name': name, 'menge': 1, 'foto': self._bild(f'{name}.png'),
+            })
+        abarbeiten('test')
+        fotos = set(Artikel.objects.values_list('foto', flat=True))
+        self.assertEqual(len(fotos), 1)
+        self.assertRegex(fotos.pop(), r'^fotos/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+
+    def test_vorschaubild_ist_klein(self):
+        self.client.post(f'/lager/{self.lager.id}/artikel_management/artikel_create/', {
+            'name': 'Schraube', 'menge': 1, 'foto': self._bild('schraube.png'),
+        })
+        abarbeiten('test')
+        foto = Artikel.objects.get().foto.name
+        with default_storage.open(thumbnail_name(foto, 160)) as datei:
+            self.assertEqual(max(Image.open(datei).size), 160)
+        response = self.client.get(f'/lager/{self.lager.id}/current_status/')
+        self.assertContains(response, thumbnail_name(foto, 160))
+
+    def test_upload_wird_erst_im_worker_verarbeitet(self):
+        self.client.post(f'/lager/{self.lager.id}/artikel_management/artikel_create/', {
+            'name': 'Schraube', 'menge': 1, 'foto': self._bild('schraube.png'),
+        })
+        artikel = Artikel.objects.get()
+        self.assertFalse(artikel.foto)
+        self.assertTrue(artikel.foto_auftrag)
+        self.assertEqual(abarbeiten('test'), 1)
+        artikel.refresh_from_db()
+        self.assertTrue(artikel.foto)
+        self.assertEqual(artikel.foto_auftrag, '')
+        self.assertFalse(default_storage.exists(Auftrag.objects.get().parameter['upload']))
+
+    def test_kaputtes_bild_scheitert_im_worker(self):
+        self.client.post(f'/lager/{self.lager.id}/artikel_management/artikel_create/', {
+            'name': 'Schraube', 'menge': 1,
+            'foto': SimpleUploadedFile('kaputt.png', b'kein bild', content_type='image/png'),
+        })
+        for _ in range(MAX_VERSUCHE):
+            abarbeiten('test')
+        auftrag = Auftrag.objects.get()
+        self.assertEqual(auftrag.status, 'fehler')
+        self.assertEqual(Artikel.objects.get().foto_auftrag, '')
+
+    def test_ohne_vorschaubild_wird_das_original_gezeigt(self):
+        foto = foto_speicher().save('fotos/bild.png', self._bild('bild.png', 'teal'))
+        Artikel.objects.create(name='Schraube', menge=1, lager=self.lager, foto=foto)
+        response = self.client.get(f'/lager/{self.lager.id}/current_status/')
+        self.assertContains(response, foto_speicher().url(foto))
+        # Im Request wird nichts gerechnet
+        self.assertFalse(default_storage.exists(thumbnail_name(foto, 160)))
+
+    def test_bearbeiten_ohne_upload_behaelt_das_bild(self):
+        foto = foto_speicher().save('fotos/bild.png', self._bild('bild.png', 'navy'))
+        artikel = Artikel.objects.create(name='Schraube', menge=1, lager=self.lager, foto=foto)
+        url = f'/lager/{self.lager.id}/artikel_management/{artikel.id}/edit/'
+        response = self.client.post(url, {'name': 'Schraube M4', 'menge': 1})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Auftrag.objects.exists())
+        artikel.refresh_from_db()
+        self.assertEqual((artikel.name, artikel.foto.name, artikel.foto_auftrag), ('Schraube M4', foto, ''))
+        # Auch wenn die Datei fehlt, wird sie nicht angefasst
+        foto_speicher().delete(foto)
+        self.assertEqual(self.client.post(url, {'name': 'Schraube M5', 'menge': 1}).status_code, 302)
+        self.assertFalse(Auftrag.objects.exists())
+
+    def test_dekompressionsbombe_scheitert_im_worker(self):
+        self.client.post(f'/lager/{self.lager.id}/artikel_management/artikel_create/', {
+            'name': 'Schraube', 'menge': 1, 'foto': self._bild('schraube.png'),
+        })
+        # 1200 x 800 Pixel liegen zwischen Warn- und Abbruchgrenze
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 600_000):
+            abarbeiten('test')
+        auftrag = Auftrag.objects.get()
+        self.assertIn('DecompressionBombWarning', auftrag.fehler)
+        self.assertFalse(Artikel.objects.get().foto)
+
+    def test_abgestuerzter_pool_kostet_keinen_versuch(self):
+        for i in range(2):
+            Auftrag.objects.create(aufgabe='bild_verarbeiten', parameter={'artikel_id': 0, 'upload': f'uploads/{i}.png'})
+        pool = mock.Mock()
+        pool.submit.side_effect = BrokenProcessPool('Prozess beendet')
+        with self.assertRaises(BrokenProcessPool):
+            abarbeiten('test', pool=pool)
+        self.assertEqual(list(Auftrag.objects.order_by('id').values_list('status', 'versuche')), [('offen', 0)] * 2)
+        # Einzeln ist der Auftrag selbst schuld, der Versuch zählt
+        with self.assertRaises(BrokenProcessPool):
+            abarbeiten('test', anzahl=1, pool=pool)
+        self.assertEqual(list(Auftrag.objects.order_by('id').values_list('status', 'versuche')), [('offen', 1), ('offen', 0)])
+
+
+class ExportTests(BudgetTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.artikel = Artikel.objects.create(name='Schraube; M8', menge=0, lager=self.lager)
+        buche_bewegung(self.lager, self.artikel.id, 'in', 5)
+        alt = buche_bewegung(self.lager, self.artikel.id, 'out', 2)
+        Transaction.objects.filter(id=alt.id).update(date=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+        self.client.force_login(self.user)
+
+    def _csv(self, response):
+        self.assertIsInstance(response, StreamingHttpResponse)
+        inhalt = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(inhalt.splitlines(), delimiter=';'))
+
+    def test_bestand(self):
+        zeilen = self._csv(self.client.get(f'/lager/{self.lager.id}/export/bestand.csv'))
+        self.assertEqual(zeilen, [['Artikel-ID', 'Artikel', 'Menge'], [str(self.artikel.id), 'Schraube; M8', '3']])
+
+    def test_formeln_werden_entschaerft(self):
+        Artikel.objects.filter(id=self.artikel.id).update(name='=HYPERLINK("http://x")')
+        for url in ['bestand.csv', 'transaktionen.csv']:
+            zeilen = self._csv(self.client.get(f'/lager/{self.lager.id}/export/{url}'))
+            self.assertIn('\'=HYPERLINK("http://x")', zeilen[1])
+
+    def test_transaktionen_im_zeitraum(self):
+        zeilen = self._csv(self.client.get(
+            f'/lager/{self.lager.id}/export/transaktionen.csv', {'von': '2019-12-31', 'bis': '2020-01-01'}
+        ))
+        self.assertEqual(len(zeilen), 2)
+        self.assertEqual(zeilen[1][3:], ['out', '2'])
+        response = self.client.get(f'/lager/{self.lager.id}/export/transaktionen.csv', {'von': 'gestern'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchivTests(BudgetTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=0, lager=self.lager)
+        for monat, typ, menge in [(1, 'in', 10), (2, 'out', 3), (3, 'in', 4), (6, 'out', 1)]:
+            buchung = buche_bewegung(self.lager, self.artikel.id, typ, menge)
+            Transaction.objects.filter(id=buchung.id).update(date=datetime(2024, monat, 10, tzinfo=dt_timezone.utc))
+        self.grenze = datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+
+    def test_archivgrenze(self):
+        jetzt = datetime(2025, 2, 14, 12, tzinfo=dt_timezone.utc)
+        self.assertEqual(archivgrenze(3, jetzt), timezone.make_aware(datetime(2024, 11, 1)))
+        self.assertEqual(archivgrenze(14, jetzt), timezone.make_aware(datetime(2023, 12, 1)))
+
+    def test_verschieben_in_schueben(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(archivieren(self.lager, self.grenze, schub=2), 3)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(sorted(ArchivBuchung.objects.values_list('quantity', flat=True)), [3, 4, 10])
+        # Schübe zu höchstens zwei Buchungen: zwei volle, ein leerer
+        self.assertEqual(sum(1 for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "myapp_archivbuchung"')), 2)
+        # Snapshot an der Grenze; Stichtagsbestände vorher und nachher bleiben gleich
+        self.assertEqual(
+            list(BestandsSnapshot.objects.values_list('stichtag', 'menge')),
+            [(self.grenze - timedelta(microseconds=1), 11)],
+        )
+        self.assertEqual(bestand_am(self.lager, datetime(2024, 2, 20, tzinfo=dt_timezone.utc)), {self.artikel.id: 7})
+        self.assertEqual(bestand_am(self.lager, timezone.now()), {self.artikel.id: 10})
+
+    def test_archiv_behaelt_anfrage_und_umbuchung(self):
+        kennung = uuid.uuid4()
+        buchung = Transaction.objects.filter(lager=self.lager, date__lt=self.grenze).earliest('date')
+        Transaction.objects.filter(id=buchung.id).update(anfrage_id='anfrage-1', umbuchung=kennung)
+        archivieren(self.lager, self.grenze)
+        archiviert = ArchivBuchung.objects.get(id=buchung.id)
+        self.assertEqual((archiviert.anfrage_id, archiviert.umbuchung), ('anfrage-1', kennung))
+
+    def test_archiv_laesst_die_prognosehistorie_im_journal(self):
+        with self.assertRaisesMessage(CommandError, '--monate muss mindestens 4 sein.'):
+            call_command('buchungen_archivieren', monate=3)
+        # Auch am ungünstigsten Tag (1. März) reicht das Journal HISTORIE Tage zurück
+        grenze = archivgrenze(MIN_MONATE, datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc))
+        self.assertLessEqual(grenze, datetime(2025, 3, 1, tzinfo=dt_timezone.utc) - timedelta(days=HISTORIE))
+
+    def test_export_enthaelt_archiv(self):
+        archivieren(self.lager, self.grenze)
+        zeilen = list(transaktions_zeilen(self.lager))
+        self.assertEqual([zeile[3:] for zeile in zeilen[1:]], [['in', 10], ['out', 3], ['in', 4], ['out', 1]])
+        self.assertEqual({zeile[2] for zeile in zeilen[1:]}, {'Schraube'})
+
+    def test_loeschen_ueber_hintergrundauftrag(self):
+        archivieren(self.lager, self.grenze)
+        andere = Artikel.objects.create(name='Mutter', menge=0, lager=self.lager)
+        buche_bewegung(self.lager, andere.id, 'in', 2)
+        andere_id, lager_id = andere.id, self.lager.id
+
+        self.client.force_login(User.objects.create_superuser('admin', password='geheim123'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/admin/myapp/artikel/{andere_id}/delete/', {'post': 'yes'})
+        self.assertFalse(Artikel.objects.filter(id=andere_id).exists())
+        # Das Löschen selbst lässt das Journal stehen
+        self.assertEqual(Transaction.objects.filter(article_id=andere_id).count(), 1)
+        abarbeiten('test')
+        self.assertFalse(Transaction.objects.filter(article_id=andere_id).exists())
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lager.delete()
+        self.assertEqual(list(Auftrag.objects.filter(status='offen').values_list('parameter', flat=True)),
+                         [{'lager_id': lager_id}])
+        abarbeiten('test')
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(ArchivBuchung.objects.exists())
+
+    def test_geloeschter_artikel_vor_dem_bereinigen(self):
+        andere = Artikel.objects.create(name='Mutter', menge=0, lager=self.lager)
+        buchung = buche_bewegung(self.lager, andere.id, 'in', 2)
+        Transaction.objects.filter(id=buchung.id).update(date=datetime(2024, 2, 10, tzinfo=dt_timezone.utc))
+        andere.delete()
+        # Das Journal der Mutter steht noch, zählt aber nicht mehr zum Bestand
+        self.assertEqual(bestand_am(self.lager, timezone.now()), {self.artikel.id: 10})
+        erstelle_snapshot(self.lager)
+        self.assertEqual(archivieren(self.lager, self.grenze), 4)
+        self.assertEqual(set(BestandsSnapshot.objects.values_list('artikel_id', flat=True)), {self.artikel.id})
+
+    def test_bereinigen_verschont_vorhandene_daten(self):
+        self.assertEqual(buchungen_bereinigen(self.lager.id), 0)
+        self.assertEqual(buchungen_bereinigen(self.lager.id, [self.artikel.id]), 0)
+        self.assertEqual(Transaction.objects.count(), 4)
+
+
+class ImportTests(BudgetTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.schraube = Artikel.objects.create(name='Schraube', menge=0, lager=self.lager)
+        buche_bewegung(self.lager, self.schraube.id, 'in', 10)
+
+    def test_upsert_mit_fehlern_je_zeile(self):
+        inhalt = 'name;menge\nSchraube;4\nMutter;7\n;3\nScheibe;-1\nBolzen;viele\nMutter;8\n'
+        self.client.force_login(self.user)
+        response = self.client.post(f'/lager/{self.lager.id}/artikel_management/artikel_import/', {
+            'datei': SimpleUploadedFile('artikel.csv', inhalt.encode('utf-8-sig')),
+        })
+        ergebnis = response.context['ergebnis']
+        self.assertEqual((ergebnis['angelegt'], ergebnis['aktualisiert']), (1, 1))
+        self.assertEqual([zeile for zeile, _ in ergebnis['fehler']], [4, 5, 6])
+        self.assertEqual(
+            dict(self.lager.artikel.values_list('name', 'menge')), {'Schraube': 4, 'Mutter': 8}
+        )
+        # Das Journal folgt dem importierten Bestand
+        self.assertEqual(bestand_am(self.lager, timezone.now()), {self.schraube.id: 4, self.lager.artikel.get(name='Mutter').id: 8})
+
+    def test_datei_aus_excel_in_cp1252(self):
+        inhalt = 'name;menge\r\nMöhre;3\r\nStraßenschild;2\r\n'
+        self.client.force_login(self.user)
+        response = self.client.post(f'/lager/{self.lager.id}/artikel_management/artikel_import/', {
+            'datei': SimpleUploadedFile('artikel.csv', inhalt.encode('cp1252')),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['ergebnis']['fehler'], [])
+        self.assertEqual(
+            dict(self.lager.artikel.values_list('name', 'menge')), {'Schraube': 10, 'Möhre': 3, 'Straßenschild': 2}
+        )
+
+    def test_abfragen_je_schub_konstant(self):
+        zeilen = '\n'.join(f'Artikel {i},{i}' for i in range(300))
+        # je Schub: Savepoint, Lesen, Upsert, Journal, Release; am Ende die Mindestbestandsprüfung
+        with self.assertNumQueries(3 * 5 + 2):
+            ergebnis = importiere_artikel(self.lager, io.StringIO('name,menge\n' + zeilen), chunk_size=100)
+        self.assertEqual(ergebnis['angelegt'], 300)
+
+
+class KennzahlenTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = []
+        for i in range(3):
+            lager = Lager.objects.create(name=f'Lager {i}', owner=self.user)
+            lager.users.add(self.user)
+            self.lager.append(lager)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=0, lager=self.lager[0])
+        Artikel.objects.create(name='Mutter', menge=0, lager=self.lager[0])
+        self.client.force_login(self.user)
+
+    def test_eine_abfrage_fuer_alle_lager(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            buche_bewegung(self.lager[0], self.artikel.id, 'in', 7)
+            buche_bewegung(self.lager[0], self.artikel.id, 'out', 2)
+        with self.assertNumQueries(1):
+            werte = kennzahlen([l.id for l in self.lager])
+        self.assertEqual(werte[self.lager[0].id], {
+            'personen': 1, 'artikel_anzahl': 2, 'gesamtmenge': 5, 'ohne_bestand': 1, 'offene_warnungen': 0,
+            'eingang_7': 7, 'ausgang_7': 2, 'eingang_30': 7, 'ausgang_30': 2,
+        })
+        self.assertEqual(werte[self.lager[2].id]['artikel_anzahl'], 0)
+        with self.assertNumQueries(0):
+            kennzahlen([l.id for l in self.lager])
+
+    def test_buchung_verwirft_nur_das_betroffene_lager(self):
+        kennzahlen([l.id for l in self.lager])
+        with self.captureOnCommitCallbacks(execute=True):
+            buche_bewegung(self.lager[0], self.artikel.id, 'in', 3)
+        self.assertEqual(kennzahlen([self.lager[0].id])[self.lager[0].id]['gesamtmenge'], 3)
+        self.assertIsNotNone(cache.get(f'lager:{self.lager[1].id}:kennzahlen'))
+
+    def test_lagerliste(self):
+        response = self.client.get('/lager/')
+        self.assertEqual(response.context['lager'][0].kennzahlen['artikel_anzahl'], 2)
+
+    def test_lagerliste_mit_freigabe(self):
+        kollege = User.objects.create_user('kollege', password='geheim123')
+        LagerAccess.objects.create(lager=self.lager[1], user=kollege)
+        self.lager[1].users.add(kollege)
+        fremdes = Lager.objects.create(name='Fremdlager', owner=kollege)
+        LagerAccess.objects.create(lager=self.lager[2], user=kollege)
+        self.client.force_login(kollege)
+        response = self.client.get('/lager/')
+        # Besitzer, Mitglied mit Freigabe und reine Freigabe, jedes Lager einmal
+        self.assertEqual([l.id for l in response.context['lager']], [self.lager[1].id, self.lager[2].id, fremdes.id])
+
+
+class SeitencacheTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.kollege = User.objects.create_user('kollege', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=5, lager=self.lager)
+        self.client.force_login(self.user)
+
+    def test_unveraenderte_seite_liefert_304(self):
+        for url in ['', 'current_status/', 'artikel_management/']:
+            response = self.client.get(f'/lager/{self.lager.id}/{url}')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            response = self.client.get(f'/lager/{self.lager.id}/{url}', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_buchung_macht_etag_ungueltig(self):
+        url = f'/lager/{self.lager.id}/current_status/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            buche_bewegung(self.lager, self.artikel.id, 'in', 3)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Menge: 8')
+
+    def test_freigabe_macht_etag_ungueltig(self):
+        url = f'/lager/{self.lager.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/lager/{self.lager.id}/grant_access/', {'user_id': self.kollege.id})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'kollege')
+
+    def test_fragment_kommt_aus_dem_cache(self):
+        url = f'/lager/{self.lager.id}/artikel_management/'
+        with CaptureQueriesContext(connection) as erster:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as zweiter:
+            response = self.client.get(url)
+        self.assertContains(response, 'Schraube')
+        self.assertFalse(any('myapp_artikel' in q['sql'] for q in zweiter))
+        self.assertLess(len(zweiter), len(erster))
+
+
+class WarnungTests(BudgetTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.schraube = Artikel.objects.create(name='Schraube', menge=10, mindestbestand=5, lager=self.lager)
+        self.mutter = Artikel.objects.create(name='Mutter', menge=1, mindestbestand=5, lager=self.lager)
+
+    def test_warnung_wird_einmal_ausgeloest_und_erledigt(self):
+        buche_bewegung(self.lager, self.schraube.id, 'out', 6)
+        buche_bewegung(self.lager, self.schraube.id, 'out', 1)
+        warnung = Warnung.objects.get(artikel=self.schraube)
+        self.assertEqual((warnung.menge, warnung.mindestbestand), (4, 5))
+
+        buche_bewegung(self.lager, self.schraube.id, 'in', 4)
+        warnung.refresh_from_db()
+        self.assertIsNotNone(warnung.erledigt)
+
+        buche_bewegung(self.lager, self.schraube.id, 'out', 5)
+        self.assertEqual(Warnung.objects.filter(artikel=self.schraube, erledigt__isnull=True).count(), 1)
+
+    def test_nur_gebuchte_artikel_werden_geprueft(self):
+        buche_bewegung(self.lager, self.schraube.id, 'out', 1)
+        # Die Mutter liegt schon unter dem Mindestbestand, wurde aber nicht gebucht
+        self.assertFalse(Warnung.objects.exists())
+
+    def test_import_prueft_das_lager_mengenbasiert(self):
+        importiere_artikel(self.lager, io.StringIO('name,menge\nSchraube,2\nNeu,0\n'))
+        self.assertEqual(
+            set(Warnung.objects.values_list('artikel__name', flat=True)), {'Schraube', 'Mutter'}
+        )
+
+    def test_endpunkt(self):
+        buche_bewegung(self.lager, self.schraube.id, 'out', 8)
+        self.client.force_login(self.user)
+        data = self.client.get(f'/lager/{self.lager.id}/warnungen/').json()
+        self.assertEqual([(w['artikel_name'], w['bestand']) for w in data['results']], [('Schraube', 2)])
+
+        fremder = User.objects.create_user('fremder', password='geheim123')
+        self.client.force_login(fremder)
+        self.assertEqual(self.client.get(f'/lager/{self.lager.id}/warnungen/').status_code, 403)
+
+
+class PrognoseTests(BudgetTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.schraube = Artikel.objects.create(name='Schraube', menge=10, lager=self.lager)
+        self.mutter = Artikel.objects.create(name='Mutter', menge=3, mindestbestand=5, lager=self.lager)
+        self.jetzt = timezone.now()
+
+    def _abgang(self, artikel, menge, vor_tagen, typ='out'):
+        buchung = Transaction.objects.create(article=artikel, lager=self.lager, type=typ, quantity=menge)
+        Transaction.objects.filter(id=buchung.id).update(date=self.jetzt - timedelta(days=vor_tagen))
+
+    def test_gleichmaessiger_verbrauch(self):
+        reihen = np.vstack([np.full(90, 2.0), np.zeros(90)])
+        ergebnis = berechnen([10, 3], reihen, mindestbestand=[0, 5], lieferzeit=7, zyklus=14)
+        self.assertAlmostEqual(ergebnis['verbrauch_geglaettet'][0], 2.0)
+        self.assertAlmostEqual(ergebnis['reichweite_tage'][0], 5.0)
+        # Meldebestand 7 * 2 = 14 unterschritten: auffüllen auf 21 * 2 = 42
+        self.assertEqual(ergebnis['meldebestand'].tolist(), [14, 5])
+        self.assertEqual(ergebnis['bestellmenge'].tolist(), [32, 2])
+        # Ohne Verbrauch keine Reichweite, aufgefüllt wird nur bis zum Mindestbestand
+        self.assertTrue(np.isnan(ergebnis['reichweite_tage'][1]))
+
+    def test_glaettung_entspricht_der_rekursion(self):
+        reihen = np.random.default_rng(0).poisson(3, size=(5, 30)).astype(float)
+        erwartet = reihen[:, 0].copy()
+        for tag in range(1, 30):
+            erwartet = 0.3 * reihen[:, tag] + 0.7 * erwartet
+        ergebnis = berechnen(np.zeros(5), reihen, alpha=0.3)
+        np.testing.assert_allclose(ergebnis['verbrauch_geglaettet'], erwartet)
+        np.testing.assert_allclose(ergebnis['verbrauch_mittel'], reihen[:, -28:].mean(axis=1))
+
+    def test_abgangsreihen_mit_einer_abfrage(self):
+        self._abgang(self.schraube, 2, 0)
+        self._abgang(self.schraube, 3, 0)
+        self._abgang(self.schraube, 4, 5)
+        self._abgang(self.schraube, 9, 1, typ='in')
+        self._abgang(self.mutter, 1, 100)  # außerhalb des Zeitraums
+        with self.assertNumQueries(1):
+            reihen = abgangsreihen(self.lager.id, sorted([self.schraube.id, self.mutter.id]), tage=30, jetzt=self.jetzt)
+        zeile = 0 if self.schraube.id < self.mutter.id else 1
+        self.assertEqual(reihen.shape, (2, 30))
+        self.assertEqual((reihen[zeile, -1], reihen[zeile, -6], reihen.sum()), (5, 4, 9))
+
+    def test_speichern_und_endpunkt(self):
+        for tag in range(28):
+            self._abgang(self.schraube, 2, tag)
+        self.assertEqual(prognosen_berechnen(self.lager.id, jetzt=self.jetzt), (2, 2))
+        self.assertEqual(Prognose.objects.filter(lager=self.lager).count(), 2)
+        # Erneutes Berechnen ersetzt die Prognosen
+        self.assertEqual(prognosen_berechnen(self.lager.id, jetzt=self.jetzt), (2, 2))
+        self.assertEqual(Prognose.objects.count(), 2)
+
+        self.client.force_login(self.user)
+        data = self.client.get(f'/lager/{self.lager.id}/nachbestellung/').json()
+        # Schraube reicht noch etwa 5 Tage, die Mutter ohne Verbrauch steht hinten
+        self.assertEqual([v['artikel_name'] for v in data['results']], ['Schraube', 'Mutter'])
+        self.assertIsNone(data['results'][1]['reichweite_tage'])
+        self.assertEqual(data['results'][1]['bestellmenge'], 2)
+
+        fremder = User.objects.create_user('fremder', password='geheim123')
+        self.client.force_login(fremder)
+        self.assertEqual(self.client.get(f'/lager/{self.lager.id}/nachbestellung/').status_code, 403)
+
+
+class LiveTests(BudgetTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=5, lager=self.lager)
+
+    def _buchen(self, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            buche_bewegung(self.lager, *args)
+
+    async def test_buchung_wird_gepusht(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(f'/lager/{self.lager.id}/live/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        ereignisse = aiter(response.streaming_content)
+        self.assertEqual(await anext(ereignisse), b'retry: 5000\n\n')
+
+        naechstes = asyncio.ensure_future(anext(ereignisse))
+        await asyncio.sleep(0.01)  # Abonnement steht
+        await sync_to_async(self._buchen)(self.artikel.id, 'out', 2)
+        self.assertEqual(
+            await asyncio.wait_for(naechstes, 1),
+            f'event: bestand\ndata: {{"artikel": [{{"id": {self.artikel.id}, "delta": -2}}]}}\n\n'.encode(),
+        )
+        await ereignisse.aclose()
+
+    async def test_langsamer_client_soll_neu_laden(self):
+        abonnement = LokalerKanal().abonnieren(self.lager.id)
+        kanal = abonnement.ag_frame.f_locals['self']
+        naechstes = asyncio.ensure_future(anext(abonnement))
+        await asyncio.sleep(0)
+        for i in range(2 * PUFFER):
+            await sync_to_async(kanal.veroeffentlichen, thread_sensitive=False)(self.lager.id, 'bestand', {'i': i})
+        self.assertEqual(await naechstes, ('bestand', {'i': 0}))
+
+        async def rest():
+            return [n async for n in abonnement]
+        nachrichten = await asyncio.wait_for(rest(), 1)
+        self.assertEqual(nachrichten[-1], ('neu_laden', {}))
+        self.assertLessEqual(len(nachrichten), PUFFER + 1)
+        # Nach dem Ende ist das Abonnement abgemeldet
+        self.assertFalse(kanal._abos[self.lager.id])
+
+    def test_ohne_asgi_kein_stream(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(f'/lager/{self.lager.id}/live/').status_code, 204)
+
+    def test_nicht_mitglieder_werden_abgewiesen(self):
+        self.client.force_login(User.objects.create_user('fremder', password='geheim123'))
+        self.assertEqual(self.client.get(f'/lager/{self.lager.id}/live/').status_code, 403)
+
+
+class AnmeldungTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('lagerist', password='geheim123', email='lager@example.com')
+        self.client.force_login(self.user)
+
+    def test_session_und_benutzer_aus_dem_cache(self):
+        self.client.get('/statistik/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/statistik/').status_code, 403)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signierte_cookies(self):
+        self.client.force_login(self.user)
+        Session.objects.all().delete()
+        self.client.get('/statistik/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/statistik/').status_code, 403)
+
+    def test_aenderungen_am_benutzer_wirken_sofort(self):
+        self.client.get('/statistik/')
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get('/statistik/').status_code, 200)
+        # Neues Passwort: die Session passt nicht mehr zum Hash und ist abgemeldet
+        self.user.set_password('anders456')
+        self.user.save()
+        self.assertEqual(self.client.get('/statistik/').status_code, 302)
+
+    def test_alte_sessions_bleiben_angemeldet(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get('/statistik/').status_code, 403)
+
+    def test_deaktivierter_benutzer_ist_abgemeldet(self):
+        self.client.get('/statistik/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/statistik/').status_code, 302)
+
+    def test_registrierung_prueft_name_und_email_mit_einer_abfrage(self):
+        self.client.logout()
+        daten = {
+            'username': 'neu', 'first_name': 'Nina', 'last_name': 'Neu', 'email': 'LAGER@example.com',
+            'password1': 'sehr-sicher-987', 'password2': 'sehr-sicher-987',
+        }
+        with CaptureQueriesContext(connection) as abfragen:
+            response = self.client.post('/register/', daten, follow=True)
+        self.assertContains(response, 'Diese E-Mail-Adresse ist bereits registriert')
+        self.assertEqual(sum('auth_user' in q['sql'] for q in abfragen.captured_queries), 1)
+
+        response = self.client.post('/register/', {**daten, 'username': 'LAGERIST', 'email': 'neu@example.com'}, follow=True)
+        self.assertContains(response, 'Dieser Benutzername ist bereits vergeben')
+
+        response = self.client.post('/register/', {**daten, 'email': 'neu@example.com'})
+        self.assertRedirects(response, '/lager/', fetch_redirect_response=False)
+        self.assertTrue(User.objects.filter(username='neu', email='neu@example.com').exists())
+
+
+class BenchmarkTests(BudgetTestCase):
+    def test_perzentile(self):
+        werte = list(range(1, 101))
+        self.assertEqual(perzentil(werte, 50), 50.5)
+        self.assertAlmostEqual(perzentil(werte, 99), 99.01)
+        self.assertEqual(perzentil([7], 95), 7)
+        self.assertIsNone(perzentil([], 50))
+
+    def test_auswertung(self):
+        ergebnis = auswerten([(0.010, 3, 200), (0.020, 5, 200), (0.030, 4, 302)], dauer=0.5)
+        self.assertEqual(ergebnis['p50_ms'], 20.0)
+        self.assertEqual(ergebnis['abfragen_je_request'], 4.0)
+        self.assertEqual(ergebnis['requests_je_sekunde'], 6.0)
+        self.assertEqual(ergebnis['status'], {'200': 2, '302': 1})
+
+    def test_synthetische_daten_sind_stimmig(self):
+        daten = daten_anlegen(lager=2, artikel=10, buchungen=40, benutzer=3)
+        self.assertEqual(len(daten), 2)
+        for lager_id, benutzer, artikel_ids in daten:
+            self.assertEqual(Lager.objects.get(id=lager_id).users.count(), 3)
+            self.assertEqual(len(artikel_ids), 10)
+            self.assertEqual(Transaction.objects.filter(lager_id=lager_id).count(), 40)
+            # Bestand = Summe der Buchungen
+            journal = bestand_am(Lager.objects.get(id=lager_id), timezone.now())
+            for artikel_id, menge in Artikel.objects.filter(lager_id=lager_id).values_list('id', 'menge'):
+                self.assertEqual(menge, journal.get(artikel_id, 0))
+
+    def test_anmeldung_vorher_nachher(self):
+        ergebnis = anmeldung_messen(daten_anlegen(lager=1, artikel=2, buchungen=2, benutzer=2), anfragen=10)
+        self.assertEqual(ergebnis['vorher']['abfragen_je_request'], 2.0)
+        self.assertLess(ergebnis['nachher']['abfragen_je_request'], 1.0)
+        self.assertEqual(ergebnis['nachher']['status'], {'200': 10})
+
+
+    def test_eigener_cache_laesst_den_betrieb_unberuehrt(self):
+        cache.set('kennzahlen:1', 'betrieb')
+        with eigener_cache():
+            self.assertIsNone(cache.get('kennzahlen:1'))
+            cache.set('kennzahlen:1', 'messung')
+            cache_verwerfen()
+            self.assertIsNone(cache.get('kennzahlen:1'))
+        self.assertEqual(cache.get('kennzahlen:1'), 'betrieb')
+
+
+class MessungTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        statistik_zuruecksetzen()
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        Artikel.objects.create(name='Schraube', menge=5, lager=self.lager)
+        self.client.force_login(self.user)
+
+    def test_messung_zaehlt_alle_abfragen(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/lager/{self.lager.id}/current_status/')
+        self.assertEqual(response.messung.abfragen, len(ctx))
+        self.assertGreater(response.messung.templates, 0)
+        self.assertGreaterEqual(response.messung.gesamt, response.messung.templates)
+        # Ohne DEBUG nur für Staff
+        self.assertNotIn('Server-Timing', response)
+
+    def test_server_timing_fuer_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(f'/lager/{self.lager.id}/current_status/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ Abfragen", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_budget_ueberschritten(self):
+        url = f'/lager/{self.lager.id}/current_status/'
+        client = Client()
+        client.force_login(self.user)
+        with mock.patch.object(resolve(url).func, 'abfragen_budget', 0):
+            # Der Request geht durch (Schreibzugriffe wären schon committet), die Middleware warnt nur
+            with self.assertLogs('myapp.messung', 'WARNING'):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            with self.assertRaises(AbfragenBudgetUeberschritten):
+                budget_pruefen(response)
+            # Der Test-Client dieser Tests prüft jede Antwort
+            with self.assertRaises(AbfragenBudgetUeberschritten), self.assertLogs('myapp.messung', 'WARNING'):
+                self.client.get(url)
+
+    def test_budgets_halten_bei_vielen_daten(self):
+        for i in range(20):
+            lager = Lager.objects.create(name=f'Lager {i}', owner=self.user)
+            lager.users.add(self.user, *[User.objects.create(username=f'u{i}-{j}') for j in range(3)])
+        Artikel.objects.bulk_create(
+            Artikel(name=f'Artikel {i}', menge=i % 3, mindestbestand=2, lager=self.lager) for i in range(50)
+        )
+        warnungen_pruefen(self.lager.id)
+        for url in ['/lager/', f'/lager/{self.lager.id}/', f'/lager/{self.lager.id}/current_status/',
+                    f'/lager/{self.lager.id}/artikel_management/', f'/lager/{self.lager.id}/warnungen/',
+                    f'/lager/{self.lager.id}/artikel/suche/?q=Artikel']:
+            cache.clear()
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    def test_statistik_je_url_name(self):
+        for _ in range(3):
+            self.client.get(f'/lager/{self.lager.id}/current_status/')
+        self.assertEqual(self.client.get('/statistik/').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        werte = self.client.get('/statistik/').json()['views']
+        self.assertEqual(werte['current_status']['requests'], 3)
+        self.assertEqual(werte['current_status']['budget'], 5)
+        self.assertLessEqual(werte['current_status']['abfragen_max'], 5)
+
+
+@override_settings(DATABASE_REPLIKATE=['replikat'], REPLIKAT_KLEBEZEIT=5)
+class ReplikatTests(BudgetTestCase):
+    """Ein zweites SQLite-Alias steht für das Replikat; der Artikel heißt dort zur Unterscheidung anders."""
+
+    # '__all__' wird erst in setUpClass aufgelöst, nachdem das Alias angelegt ist
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        verzeichnis = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(verzeichnis.cleanup)
+        connections.settings['replikat'] = {
+            **connections.settings['default'], 'NAME': str(Path(verzeichnis.name) / 'replikat.sqlite3'),
+        }
+        cls.addClassCleanup(cls._replikat_entfernen)
+        call_command('migrate', database='replikat', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def _replikat_entfernen(cls):
+        connections['replikat'].close()
+        del connections['replikat']
+        del connections.settings['replikat']
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=5, lager=self.lager)
+        self.client.force_login(self.user)
+        for objekt in [User.objects.get(), Session.objects.get(), Lager.objects.get(), Lager.users.through.objects.get()]:
+            objekt.save(using='replikat', force_insert=True)
+        Artikel(id=self.artikel.id, name='Schraube (Replikat)', menge=5, lager=self.lager).save(using='replikat', force_insert=True)
+        self._lager_unveraendert()
+
+    def _lager_unveraendert(self):
+        cache.set(f'lager:{self.lager.id}:version', time.time_ns() - 60 * 10**9, None)
+
+    def _artikelname(self):
+        return self.client.get(f'/api/lager/{self.lager.id}/artikel/').json()['results'][0]['name']
+
+    def test_lesende_views_fragen_das_replikat(self):
+        self.assertContains(self.client.get(f'/lager/{self.lager.id}/current_status/'), 'Schraube (Replikat)')
+        self.assertEqual(self._artikelname(), 'Schraube (Replikat)')
+        # Ohne @nur_lesend bleibt es beim Primärsystem
+        self.assertNotContains(self.client.get(f'/lager/{self.lager.id}/transaction/'), 'Replikat')
+        # Außerhalb eines Requests ebenso
+        self.assertEqual(Artikel.objects.get(id=self.artikel.id).name, 'Schraube')
+
+    def test_nach_dem_buchen_vom_primaersystem(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/lager/{self.lager.id}/transaction/', {
+                'transaction_type': 'in', 'article': self.artikel.id, 'quantity': 1,
+            })
+        self.assertEqual(response.cookies[KLEBE_COOKIE]['max-age'], 5)
+        self.assertEqual(self._artikelname(), 'Schraube')
+
+        # Ohne Cookie (anderer Benutzer) schützt die frische Lager-Version
+        del self.client.cookies[KLEBE_COOKIE]
+        self.assertEqual(self._artikelname(), 'Schraube')
+        self._lager_unveraendert()
+        self.assertEqual(self._artikelname(), 'Schraube (Replikat)')
+
+    def test_gemischte_views_lesen_nur_bei_get_vom_replikat(self):
+        for alias in ('default', 'replikat'):
+            Artikel.objects.using(alias).filter(id=self.artikel.id).update(code='4006381333931')
+        Transaction.objects.create(article=self.artikel, lager=self.lager, type='in', quantity=5)
+        response = self.client.get(f'/lager/{self.lager.id}/scan/', {'code': '4006381333931'})
+        self.assertEqual(response.json()['name'], 'Schraube (Replikat)')
+        self.assertEqual(self.client.get(f'/api/lager/{self.lager.id}/buchungen/').json()['results'], [])
+
+        response = self.client.post(
+            f'/api/lager/{self.lager.id}/buchungen/', {'article': self.artikel.id, 'type': 'out', 'quantity': 1},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(KLEBE_COOKIE, response.cookies)
+        self.assertEqual(len(self.client.get(f'/api/lager/{self.lager.id}/buchungen/').json()['results']), 2)
+
+    @override_settings(DATABASE_REPLIKATE=[])
+    def test_ohne_replikate_alles_vom_primaersystem(self):
+        self.assertEqual(self._artikelname(), 'Schraube')
+        response = self.client.post(f'/lager/{self.lager.id}/transaction/', {
+            'transaction_type': 'in', 'article': self.artikel.id, 'quantity': 1,
+        })
+        self.assertNotIn(KLEBE_COOKIE, response.cookies)
+
+
+class IdempotenzTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=5, lager=self.lager)
+
+    def _buchen(self, anfrage_id='scan-1'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return buche_bewegung(self.lager, self.artikel.id, 'out', 2, anfrage_id)
+
+    def test_kennung_muss_text_sein(self):
+        for kennung in (5, ['scan-1'], 'x' * 65):
+            with self.assertRaisesMessage(ValueError, 'Die Anfrage-Kennung muss ein Text'):
+                self._buchen(kennung)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_wiederholung_bucht_nicht_erneut(self):
+        self.client.force_login(self.user)
+        url = f'/lager/{self.lager.id}/transaction/'
+        daten = {'transaction_type': 'out', 'article': self.artikel.id, 'quantity': 2}
+        with self.captureOnCommitCallbacks(execute=True):
+            erste = self.client.post(url, daten, headers={'Idempotency-Key': 'scan-1'})
+        zweite = self.client.post(url, daten, headers={'Idempotency-Key': 'scan-1'})
+        self.assertEqual(zweite.status_code, erste.status_code)
+        self.assertEqual(zweite['Location'], erste['Location'])
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 3)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_wiederholung_aus_dem_cache_ohne_abfrage(self):
+        erste = self._buchen()
+        with self.assertNumQueries(0):
+            zweite = self._buchen()
+        self.assertEqual((zweite.id, zweite.wiederholt, erste.wiederholt), (erste.id, True, False))
+
+    def test_ohne_cache_eine_indexabfrage(self):
+        erste = self._buchen()
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            zweite = self._buchen()
+        self.assertEqual(len(ctx), 1)
+        self.assertTrue(ctx.captured_queries[0]['sql'].startswith('SELECT'))
+        self.assertEqual(zweite.id, erste.id)
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 3)
+
+    def test_parallele_wiederholung_scheitert_am_unique_index(self):
+        erste = self._buchen()
+        # Beide Wiederholungen haben die Kennung noch nicht gesehen
+        with mock.patch('myapp.services.gebuchte_anfrage', return_value=None):
+            zweite = self._buchen()
+        self.assertEqual((zweite.id, zweite.wiederholt), (erste.id, True))
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 3)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_wiederverwendete_kennung_mit_anderem_inhalt(self):
+        self._buchen()
+        for artikel_id, typ, menge in [(self.artikel.id, 'out', 3), (self.artikel.id, 'in', 2)]:
+            with self.assertRaises(AnfrageKonflikt):
+                buche_bewegung(self.lager, artikel_id, typ, menge, 'scan-1')
+        # Aus dem Formular kommt die ID als Text
+        self.assertTrue(buche_bewegung(self.lager, str(self.artikel.id), 'out', 2, 'scan-1').wiederholt)
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 3)
+
+    def test_api_und_formular_melden_den_konflikt(self):
+        self.client.force_login(self.user)
+        url = f'/lager/{self.lager.id}/transaction/'
+        daten = {'transaction_type': 'out', 'article': self.artikel.id, 'quantity': 2, 'anfrage_id': 'form-1'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, daten)
+        # Dasselbe Formular noch einmal, dann nach "Zurück" mit anderer Menge
+        self.assertContains(self.client.post(url, daten, follow=True), 'wurde bereits gebucht')
+        response = self.client.post(url, {**daten, 'quantity': 3}, follow=True)
+        self.assertRedirects(response, url)
+        self.assertContains(response, 'die Änderung nicht')
+
+        response = self.client.post(
+            f'/api/lager/{self.lager.id}/buchungen/', data={'article': self.artikel.id, 'type': 'in', 'quantity': 2},
+            content_type='application/json', headers={'Idempotency-Key': 'form-1'},
+        )
+        self.assertEqual(response.status_code, 422)
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 3)
+
+    def test_kennung_gilt_je_lager_und_formular_bringt_eine_mit(self):
+        self._buchen()
+        anderes = Lager.objects.create(name='Nebenlager', owner=self.user)
+        schraube = Artikel.objects.create(name='Schraube', menge=5, lager=anderes)
+        buche_bewegung(anderes, schraube.id, 'out', 1, 'scan-1')
+        self.assertEqual(Transaction.objects.count(), 2)
+
+        self.client.force_login(self.user)
+        self.assertRegex(
+            self.client.get(f'/lager/{self.lager.id}/transaction/').content.decode(),
+            r'name="anfrage_id" value="[0-9a-f]{32}"',
+        )
+
+
+class ApiTests(BudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=self.user)
+        self.lager.users.add(self.user)
+        Artikel.objects.bulk_create(Artikel(name=f'Artikel {i:02d}', menge=i, lager=self.lager) for i in range(5))
+        self.artikel = self.lager.artikel.get(name='Artikel 03')
+        self.client.force_login(self.user)
+
+    def _alle_seiten(self, url, **parameter):
+        zeilen, cursor = [], None
+        while True:
+            daten = self.client.get(url, {**parameter, **({'cursor': cursor} if cursor else {})}).json()
+            zeilen += daten['results']
+            cursor = daten['next']
+            if not cursor:
+                return zeilen
+
+    def test_zugriffsregeln(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/lager/').status_code, 401)
+        self.client.force_login(User.objects.create_user('fremder', password='geheim123'))
+        self.assertEqual(self.client.get('/api/lager/').json(), {'results': [], 'next': None})
+        self.assertEqual(self.client.get(f'/api/lager/{self.lager.id}/artikel/').status_code, 403)
+        LagerAccess.objects.create(lager=self.lager, user=User.objects.get(username='fremder'))
+        self.assertEqual(self.client.get('/api/lager/', {'fields': 'id'}).json()['results'], [{'id': self.lager.id}])
+
+    def test_artikel_seitenweise_mit_feldauswahl(self):
+        url = f'/api/lager/{self.lager.id}/artikel/'
+        zeilen = self._alle_seiten(url, limit=2, fields='id,menge')
+        self.assertEqual([z['menge'] for z in zeilen], [0, 1, 2, 3, 4])
+        self.assertEqual(set(zeilen[0]), {'id', 'menge'})
+        self.assertEqual(len(self._alle_seiten(url, limit=2, bestand=1)), 4)
+
+        response = self.client.get(url, {'fields': 'name,preis'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('preis', response.json()['error'])
+        self.assertEqual(self.client.get(url, {'cursor': 'kaputt'}).status_code, 400)
+        # Gültiges JSON, aber nicht die Form des Cursors
+        for werte in (['abc'], [1], ['a', 'b'], [], {'name': 'a'}):
+            cursor = base64.urlsafe_b64encode(json.dumps(werte).encode()).decode()
+            self.assertEqual(self.client.get('/api/lager/' if werte == ['abc'] else url, {'cursor': cursor}).status_code, 400)
+        buchungen = f'/api/lager/{self.lager.id}/buchungen/'
+        for werte in (['2025-01-01T00:00:00+00:00', '7'], ['gestern', 7], [7]):
+            cursor = base64.urlsafe_b64encode(json.dumps(werte).encode()).decode()
+            self.assertEqual(self.client.get(buchungen, {'cursor': cursor}).status_code, 400)
+        # Kompakt serialisiert
+        self.assertNotIn(b', ', self.client.get(url).content)
+
+    def test_artikel_einzeln_und_if_none_match(self):
+        url = f'/api/lager/{self.lager.id}/artikel/{self.artikel.id}/'
+        erste = self.client.get(url)
+        self.assertEqual(erste.json(), {'id': self.artikel.id, 'name': 'Artikel 03', 'menge': 3, 'mindestbestand': 0})
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': erste['ETag']}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            buche_bewegung(self.lager, self.artikel.id, 'in', 1)
+        zweite = self.client.get(url, headers={'If-None-Match': erste['ETag']})
+        self.assertEqual((zweite.status_code, zweite.json()['menge']), (200, 4))
+        self.assertEqual(self.client.get(f'/api/lager/{self.lager.id}/artikel/999999/').status_code, 404)
+
+    def test_buchen_idempotent(self):
+        url = f'/api/lager/{self.lager.id}/buchungen/'
+        daten = {'article': self.artikel.id, 'type': 'out', 'quantity': 2}
+        with self.captureOnCommitCallbacks(execute=True):
+            erste = self.client.post(url, daten, content_type='application/json', headers={'Idempotency-Key': 'k1'})
+        zweite = self.client.post(url, daten, content_type='application/json', headers={'Idempotency-Key': 'k1'})
+        self.assertEqual((erste.status_code, zweite.status_code), (201, 201))
+        self.assertEqual(zweite.json(), erste.json())
+        self.assertEqual(zweite['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', erste)
+
+        daten['quantity'] = 50
+        self.assertEqual(self.client.post(url, daten, content_type='application/json').status_code, 409)
+        self.assertEqual(self.client.post(url, {'article': 'x'}, content_type='application/json').status_code, 400)
+        response = self.client.post(url, {**daten, 'quantity': 1, 'anfrage_id': 5}, content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['error']), (400, '"anfrage_id" muss ein Text sein.'))
+        self.artikel.refresh_from_db()
+        self.assertEqual(self.artikel.menge, 1)
+
+    def test_buchungen_seitenweise_bei_gleichem_zeitpunkt(self):
+        for _ in range(5):
+            buche_bewegung(self.lager, self.artikel.id, 'in', 1)
+        Transaction.objects.update(date=datetime(2024, 5, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc))
+        zeilen = self._alle_seiten(f'/api/lager/{self.lager.id}/buchungen/', limit=2, fields='id')
+        self.assertEqual([z['id'] for z in zeilen], sorted(Transaction.objects.values_list('id', flat=True), reverse=True))
+        response = self.client.get(f'/api/lager/{self.lager.id}/buchungen/', {'von': '2024-05-02T00:00:00+00:00'})
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(self.client.get(f'/api/lager/{self.lager.id}/buchungen/', {'von': 'gestern'}).status_code, 400)
+
+    def test_viele_artikel_konstante_abfragen(self):
+        Artikel.objects.bulk_create(Artikel(name=f'Massenartikel {i:04d}', menge=1, lager=self.lager) for i in range(2000))
+        url = f'/api/lager/{self.lager.id}/artikel/'
+        with CaptureQueriesContext(connection) as ctx:
+            daten = self.client.get(url, {'limit': 1000}).json()
+        self.assertEqual(len(daten['results']), 1000)
+        self.assertLessEqual(len(ctx), 4)
+
+
+class StichtagsbestandTests(BudgetTestCase):
+    def setUp(self):
+        user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=user)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=0, lager=self.lager)
+
+    def _buche(self, transaction_type, quantity, tag):
+        buchung = buche_bewegung(self.lager, self.artikel.id, transaction_type, quantity)
+        Transaction.objects.filter(id=buchung.id).update(date=datetime(2024, 12, tag, 12, tzinfo=dt_timezone.utc))
+
+    def test_bestand_aus_snapshot_und_delta(self):
+        self._buche('in', 10, 1)
+        self._buche('out', 3, 10)
+        erstelle_snapshot(self.lager, datetime(2024, 12, 15, tzinfo=dt_timezone.utc))
+        self._buche('in', 5, 20)
+        self._buche('out', 1, 31)
+
+        self.assertEqual(bestand_am(self.lager, datetime(2024, 12, 5, tzinfo=dt_timezone.utc)), {self.artikel.id: 10})
+        # Stichtag, Snapshot, Journal und Archiv seit dem Snapshot
+        with self.assertNumQueries(4):
+            bestand = bestand_am(self.lager, datetime(2024, 12, 25, tzinfo=dt_timezone.utc))
+        self.assertEqual(bestand, {self.artikel.id: 12})
+        self.assertEqual(bestand_am(self.lager, datetime(2025, 1, 1, tzinfo=dt_timezone.utc)), {self.artikel.id: 11})
+
+    def test_snapshot_nutzt_nur_buchungen_nach_stichtag(self):
+        self._buche('in', 10, 1)
+        erstelle_snapshot(self.lager, datetime(2024, 12, 15, tzinfo=dt_timezone.utc))
+        # Eine nachträgliche Änderung vor dem Stichtag wirkt sich nicht mehr aus
+        Transaction.objects.update(quantity=99)
+        self.assertEqual(bestand_am(self.lager, datetime(2024, 12, 20, tzinfo=dt_timezone.utc)), {self.artikel.id: 10})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Abfragepläne werden nur für SQLite geprüft')
+class IndexNutzungTests(BudgetTestCase):
+    """Regressionstest: die heißen Abfragen müssen ihre Indizes nutzen."""
+
+    def setUp(self):
+        user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=user)
+
+    def assertNutztIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertNotIn('SCAN', plan)
+
+    def test_artikel_nach_lager_und_name(self):
+        plan = Artikel.objects.filter(lager=self.lager, name='Schraube').explain()
+        self.assertIn('(lager_id=? AND name=?)', plan)
+        self.assertNotIn('SCAN', plan)
+
+    def test_artikel_mit_bestand(self):
+        self.assertNutztIndex(self.lager.artikel.filter(menge__gt=0), 'artikel_lager_bestand_idx')
+
+    def test_transaktionen_nach_lager_und_datum(self):
+        self.assertNutztIndex(
+            Transaction.objects.filter(lager=self.lager, date__gte=timezone.now()), 'transaction_lager_date_idx'
+        )
+
+    def test_transaktionen_nach_artikel_und_datum(self):
+        self.assertNutztIndex(
+            Transaction.objects.filter(article_id=1, date__gte=timezone.now()), 'transaction_article_date_idx'
+        )
+
+    def test_artikel_nach_code(self):
+        plan = Artikel.objects.filter(lager_id=self.lager.id, code='4006381333931').values_list('id', flat=True).explain()
+        # Die ID steht im Index, die Tabelle wird gar nicht gelesen
+        self.assertIn('USING COVERING INDEX unique_artikel_lager_code', plan)
+
+    def test_doppelter_name_wird_von_der_datenbank_abgelehnt(self):
+        Artikel.objects.create(name='Schraube', menge=1, lager=self.lager)
+        with self.assertRaises(IntegrityError), db_transaction.atomic():
+            Artikel.objects.create(name='Schraube', menge=2, lager=self.lager)
+
+
+class ParalleleBuchungTests(BudgetTransactionTestCase):
+    """Viele parallele Buchungen auf einen Artikel dürfen keine Updates verlieren."""
+
+    WORKER = 16
+    BUCHUNGEN_PRO_WORKER = 10
+
+    def setUp(self):
+        user = User.objects.create_user('lagerist', password='geheim123')
+        self.lager = Lager.objects.create(name='Hauptlager', owner=user)
+        self.artikel = Artikel.objects.create(name='Schraube', menge=0, lager=self.lager)
+
+    def _worker(self, transaction_type):
+        erfolgreich = 0
+        try:
+            for _ in range(self.BUCHUNGEN_PRO_WORKER):
+                while True:
+                    try:
+                        buche_bewegung(self.lager, self.artikel.id, transaction_type, 1)
+                        erfolgreich += 1
+                        break
+                    except NichtGenugBestand:
+                        break
+                    except OperationalError:
+                        # SQLite sperrt bei parallelen Schreibern kurz die Datenbank
+                        time.sleep(0.001)
+        finally:
+            connection.close()
+        return erfolgreich
+
+    def test_keine_verlorenen_updates(self):
+        with ThreadPoolExecutor(self.WORKER) as pool:
+            eingaenge = sum(pool.map(self._worker, ['in'] * self.WORKER))
+        self.assertEqual(eingaenge, self.WORKER * self.BUCHUNGEN_PRO_WORKER)
+
+        with ThreadPoolExecutor(self.WORKER) as pool:
+            ausgaenge = sum(pool.map(self._worker, ['out'] * (self.WORKER + 4)))
+
+        self.artikel.refresh_from_db()
+        self.assertEqual(ausgaenge, eingaenge)
+        self.assertEqual(self.artikel.menge, 0)
+        self.assertEqual(Transaction.objects.filter(type='out').count(), ausgaenge)
+
+    def test_gegenlaeufige_umbuchungen(self):
+        ziel = Lager.objects.create(name='Außenlager', owner=self.lager.owner)
+        Artikel.objects.filter(id=self.artikel.id).update(menge=1000)
+        gegenstueck = Artikel.objects.create(name='Schraube', menge=1000, lager=ziel)
+
+        def umbuchen_hin_und_her(richtung):
+            von, nach, artikel_id = (self.lager, ziel, self.artikel.id) if richtung else (ziel, self.lager, gegenstueck.id)
+            erfolgreich = 0
+            try:
+                for _ in range(self.BUCHUNGEN_PRO_WORKER):
+                    while True:
+                        try:
+                            _, ergebnisse = umbuchen(von, nach, [{'article': artikel_id, 'quantity': 3}])
+                            erfolgreich += ergebnisse[0]['ok']
+                            break
+                        except (NichtGenugBestand, OperationalError):
+                            time.sleep(0.001)
+            finally:
+                connection.close()
+            return erfolgreich
+
+        with ThreadPoolExecutor(self.WORKER) as pool:
+            gebucht = sum(pool.map(umbuchen_hin_und_her, [True, False] * (self.WORKER // 2)))
+
+        # Nichts geht verloren, und jede Umbuchung hat genau zwei Buchungen
+        self.assertEqual(gebucht, self.WORKER * self.BUCHUNGEN_PRO_WORKER)
+        self.assertEqual(sum(Artikel.objects.values_list('menge', flat=True)), 2000)
+        self.assertEqual(Transaction.objects.count(), 2 * gebucht)
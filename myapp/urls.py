@@ -1,7 +1,7 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
-from django.contrib.auth.decorators import login_required
+from . import api, views
+from .zugriff import lager_mitglied_erforderlich
 
 urlpatterns = [
     # Login
@@ -16,34 +16,72 @@ urlpatterns = [
     # Registrierung
     path('register/', views.register, name='register'),
 
+    # Messwerte je View (nur Staff)
+    path('statistik/', views.statistik, name='statistik'),
+
     # Lager-Übersicht (geschützt)
-    path('lager/', login_required(views.lager_list), name='lager_list'),
+    path('lager/', views.lager_list, name='lager_list'),
 
     # Detailansicht eines Lagers (geschützt)
-    path('lager/<int:lager_id>/', login_required(views.lager_detail), name='lager_detail'),
+    path('lager/<int:lager_id>/', lager_mitglied_erforderlich(views.lager_detail), name='lager_detail'),
 
     # Benutzer aus Lager entfernen (geschützt)
-    path('lager/<int:lager_id>/remove_user/<int:user_id>/', login_required(views.remove_user_from_lager), name='remove_user_from_lager'),
+    path('lager/<int:lager_id>/remove_user/<int:user_id>/', lager_mitglied_erforderlich(views.remove_user_from_lager), name='remove_user_from_lager'),
 
     # Aktueller Stand eines Lagers (geschützt)
-    path('lager/<int:lager_id>/current_status/', login_required(views.current_status), name='current_status'),
+    path('lager/<int:lager_id>/current_status/', lager_mitglied_erforderlich(views.current_status), name='current_status'),
+
+    # Live-Bestandsänderungen als Server-Sent Events (geschützt)
+    path('lager/<int:lager_id>/live/', lager_mitglied_erforderlich(views.live, json_antwort=True), name='live'),
+
+    # Artikelsuche als JSON (geschützt)
+    path('lager/<int:lager_id>/artikel/suche/', lager_mitglied_erforderlich(views.artikel_suche, json_antwort=True), name='artikel_suche'),
+
+    # Offene Mindestbestand-Warnungen als JSON (geschützt)
+    path('lager/<int:lager_id>/warnungen/', lager_mitglied_erforderlich(views.warnungen, json_antwort=True), name='warnungen'),
+
+    # Bestellvorschläge aus der Bedarfsprognose als JSON (geschützt)
+    path('lager/<int:lager_id>/nachbestellung/', lager_mitglied_erforderlich(views.nachbestellung, json_antwort=True), name='nachbestellung'),
 
     # Wareneingang oder -ausgang (geschützt)
-    path('lager/<int:lager_id>/transaction/', login_required(views.transaction), name='transaction'),
+    path('lager/<int:lager_id>/transaction/', lager_mitglied_erforderlich(views.transaction), name='transaction'),
+
+    # Sammelbuchung von Warenein- und -ausgängen (geschützt)
+    path('lager/<int:lager_id>/transaction/bulk/', lager_mitglied_erforderlich(views.transaction_bulk, json_antwort=True), name='transaction_bulk'),
+
+    # Barcode/SKU nachschlagen bzw. direkt buchen (geschützt)
+    path('lager/<int:lager_id>/scan/', lager_mitglied_erforderlich(views.scan, json_antwort=True), name='scan'),
+
+    # Umbuchung in ein anderes Lager (geschützt)
+    path('lager/<int:lager_id>/umbuchung/', lager_mitglied_erforderlich(views.umbuchung, json_antwort=True), name='umbuchung'),
+
+    # Export als CSV (geschützt)
+    path('lager/<int:lager_id>/export/bestand.csv', lager_mitglied_erforderlich(views.export_bestand), name='export_bestand'),
+    path('lager/<int:lager_id>/export/transaktionen.csv', lager_mitglied_erforderlich(views.export_transaktionen), name='export_transaktionen'),
 
     # Benutzer Berechtigungen (geschützt)
-    path('lager/<int:lager_id>/grant_access/', login_required(views.grant_access), name='grant_access'),
+    path('lager/<int:lager_id>/grant_access/', lager_mitglied_erforderlich(views.grant_access), name='grant_access'),
 
     # Lager erstellen (geschützt)
-    path('lager/create/', login_required(views.lager_create), name='lager_create'),
+    path('lager/create/', views.lager_create, name='lager_create'),
 
     # Artikelmanagement (geschützt)
-    path('lager/<int:lager_id>/artikel_management/', login_required(views.artikel_management), name='artikel_management'),
+    path('lager/<int:lager_id>/artikel_management/', lager_mitglied_erforderlich(views.artikel_management), name='artikel_management'),
 
     # Artikel erstellen (geschützt)
-    path('lager/<int:lager_id>/artikel_management/artikel_create/', login_required(views.artikel_create), name='artikel_create'),
+    path('lager/<int:lager_id>/artikel_management/artikel_create/', lager_mitglied_erforderlich(views.artikel_create), name='artikel_create'),
+
+    # Artikel aus CSV importieren (geschützt)
+    path('lager/<int:lager_id>/artikel_management/artikel_import/', lager_mitglied_erforderlich(views.artikel_import), name='artikel_import'),
 
     # Artikel bearbeiten (geschützt)
-    path('lager/<int:lager_id>/artikel_management/<int:id>/edit/', login_required(views.artikel_edit), name='artikel_edit'),
+    path('lager/<int:lager_id>/artikel_management/<int:id>/edit/', lager_mitglied_erforderlich(views.artikel_edit), name='artikel_edit'),
+
+    # JSON-API (Zugriffsregeln in myapp.api)
+    path('api/lager/', api.lager_liste, name='api_lager_liste'),
+    path('api/lager/<int:lager_id>/', api.lager_einzeln, name='api_lager'),
+    path('api/lager/<int:lager_id>/artikel/', api.artikel_liste, name='api_artikel_liste'),
+    path('api/lager/<int:lager_id>/artikel/<int:artikel_id>/', api.artikel_einzeln, name='api_artikel'),
+    path('api/lager/<int:lager_id>/buchungen/', api.buchungen, name='api_buchungen'),
 ]
 
@@ -2,10 +2,40 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
-from .forms import LagerForm, ArtikelForm, CustomUserCreationForm
-from .models import Lager, LagerAccess, Artikel, Transaction
+from .forms import LagerForm, ArtikelForm, ArtikelImportForm, CustomUserCreationForm
+from .models import Lager, LagerAccess, Artikel
+from .zugriff import lade_lager, zugaengliche_lager
+from .bilder import thumbnail_url
+from .auftraege import bild_einreihen
+from .importer import importiere_artikel
+from .kennzahlen import kennzahlen, CACHE_TIMEOUT as KENNZAHLEN_TIMEOUT
+from .live import kanal, sse
+from .messung import abfragen_budget, statistik as messwerte
+from .replikate import lesedatenbank, nur_lesend
+from .seitencache import bedingte_anfrage, fragment, lager_geaendert
+from .export import bestand_zeilen, csv_stream, tagesgrenzen, transaktions_zeilen
+from .suche import keyset_seite, suche_artikel, SEITENGROESSE
+from .scanner import buche_scan, code_normalisieren
+from .services import buche_bewegung, buche_bewegungen, ganzzahl, umbuchen, AnfrageKonflikt, NichtGenugBestand
+from .warnungen import warnungen_pruefen
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import F
+import json
+import uuid
+from django.core.files.uploadedfile import UploadedFile
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods, require_POST
+
+# Höchstens so viele offene Warnungen bzw. Bestellvorschläge liefern die Endpunkte
+WARNUNGEN_LIMIT = 200
+NACHBESTELLUNG_LIMIT = 200
+# Höchstzahl an Positionen je Umbuchung (ein UPDATE über alle beteiligten Artikel)
+UMBUCHUNG_MAX_POSITIONEN = 1000
+# Höchstzahl an Positionen je Sammelbuchung (alle Artikel in einer gesperrten Abfrage)
+BUCHUNG_MAX_POSITIONEN = 1000
 
 
 def register(request):
@@ -14,20 +44,22 @@ def register(request):
         form = CustomUserCreationForm(request.POST)
 
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            email = form.cleaned_data.get('email')
-
-            if User.objects.filter(username=username).exists():
+            try:
+                with db_transaction.atomic():
+                    user = form.save()
+            except IntegrityError:
+                # Derselbe Benutzername wurde gleichzeitig registriert
                 messages.error(request, 'Dieser Benutzername ist bereits vergeben. Bitte wähle einen anderen.')
-            elif User.objects.filter(email=email).exists():
-                messages.error(request, 'Diese E-Mail-Adresse ist bereits registriert. Bitte benutze eine andere.')
             else:
-                user = form.save()
-                login(request, user)
+                login(request, user, backend='myapp.anmeldung.BenutzerCacheBackend')
                 messages.success(request, 'Du hast dich erfolgreich registriert und bist nun eingeloggt!')
                 return redirect('lager_list')
         else:
-            messages.error(request, 'Bitte korrigiere die Fehler im Formular.')
+            vergeben = [feld for feld in ('username', 'email') if form.has_error(feld, 'vergeben')]
+            if vergeben:
+                messages.error(request, form.errors[vergeben[0]][0])
+            else:
+                messages.error(request, 'Bitte korrigiere die Fehler im Formular.')
     else:
         form = CustomUserCreationForm()
 
@@ -53,70 +85,121 @@ def lager_create(request):
     return render(request, 'lager_form.html', {'form': form})
 
 
+@abfragen_budget(5)
+@nur_lesend
 @login_required
 def lager_list(request):
     """Zeigt die Liste der Lager des angemeldeten Benutzers."""
-    lager = Lager.objects.filter(users=request.user)
-    if not lager.exists():
+    lager = list(zugaengliche_lager(request.user).order_by('id'))
+    if not lager:
         messages.info(request, 'Du hast noch keine Lager angelegt.')
+
+    # Kennzahlen aller Lager aus dem Cache bzw. mit einer gemeinsamen Abfrage
+    werte = kennzahlen(l.id for l in lager)
+    for l in lager:
+        l.kennzahlen = werte.get(l.id, {})
     return render(request, 'lager_list.html', {'lager': lager})
 
 
-@login_required
 def remove_user_from_lager(request, lager_id, user_id):
     """Entfernt einen Benutzer aus einem Lager."""
-    lager = get_object_or_404(Lager, id=lager_id)
+    lager = lade_lager(request, lager_id)
 
-    if lager.owner != request.user:
+    if lager.owner_id != request.user.id:
         messages.error(request, 'Du hast keine Berechtigung, diesen Benutzer zu entfernen.')
         return redirect('lager_list')
 
     user = get_object_or_404(User, id=user_id)
     lager.users.remove(user)
     LagerAccess.objects.filter(lager=lager, user=user).delete()
+    lager_geaendert(lager.id)
 
     messages.success(request, f'Benutzer {user.username} wurde erfolgreich aus dem Lager entfernt.')
     return redirect('lager_detail', lager_id=lager.id)
 
 
 # View zum Bearbeiten eines Artikels
-@login_required
 def artikel_edit(request, lager_id, id):
     """Bearbeitet einen Artikel im Lager."""
-    lager = get_object_or_404(Lager, id=lager_id)
+    lager = lade_lager(request, lager_id)
     artikel = get_object_or_404(Artikel, id=id, lager=lager)
 
     if request.method == 'POST':
-        form = ArtikelForm(request.POST, request.FILES, instance=artikel)
+        alte_menge = artikel.menge
+        form = ArtikelForm(request.POST, request.FILES, instance=artikel, initial={'foto': artikel.foto})
         if form.is_valid():
-            form.save()
+            artikel = form.save(commit=False)
+            differenz = artikel.menge - alte_menge
+            foto = form.cleaned_data['foto']
+            if foto is False:  # "Löschen" im Bildfeld angehakt
+                artikel.foto = None
+            try:
+                with db_transaction.atomic():
+                    # Menge nicht überschreiben, sondern die Differenz buchen,
+                    # damit parallele Buchungen erhalten bleiben und das Journal stimmt
+                    artikel.save(update_fields=['name', 'code', 'foto', 'mindestbestand'])
+                    lager_geaendert(lager.id)
+                    if differenz:
+                        buche_bewegung(lager, artikel.id, 'in' if differenz > 0 else 'out', abs(differenz))
+                    if 'mindestbestand' in form.changed_data:
+                        warnungen_pruefen(lager.id, [artikel.id])
+            except NichtGenugBestand:
+                messages.error(request, 'Nicht genügend Artikel für die Korrektur der Menge verfügbar!')
+                return redirect('artikel_edit', lager_id=lager.id, id=artikel.id)
+            except IntegrityError:
+                messages.error(request, _doppelt_meldung(artikel, 'Ein Artikel mit diesem Namen existiert bereits im Lager!'))
+                return redirect('artikel_edit', lager_id=lager.id, id=artikel.id)
+            # Ohne Upload ist foto das bisherige Bild; nur ein neues wird verarbeitet
+            if isinstance(foto, UploadedFile):
+                bild_einreihen(artikel, foto)
+                messages.success(request, 'Artikel wurde erfolgreich bearbeitet! Das Bild wird im Hintergrund verarbeitet.')
+                return redirect('artikel_management', lager_id=lager.id)
             messages.success(request, 'Artikel wurde erfolgreich bearbeitet!')
             return redirect('artikel_management', lager_id=lager.id)
         else:
             messages.error(request, 'Bitte korrigiere die Fehler im Formular.')
     else:
-        form = ArtikelForm(instance=artikel)
+        form = ArtikelForm(instance=artikel, initial={'foto': artikel.foto})
 
     return render(request, 'artikel_edit.html', {'form': form, 'artikel': artikel, 'lager': lager})
 
 
+def _doppelt_meldung(artikel, meldung_name):
+    # Nur im Fehlerfall nachsehen, welcher der beiden eindeutigen Werte schon vergeben ist
+    andere = Artikel.objects.filter(lager_id=artikel.lager_id, code=artikel.code).exclude(id=artikel.id)
+    if artikel.code and andere.exists():
+        return f'Der Code {artikel.code} ist bereits einem anderen Artikel zugeordnet!'
+    return meldung_name
+
+
 # View zum Hinzufügen eines neuen Artikels
+@abfragen_budget(14)
 def artikel_create(request, lager_id):
-    lager = get_object_or_404(Lager, id=lager_id)
+    lager = lade_lager(request, lager_id)
 
     if request.method == 'POST':
         form = ArtikelForm(request.POST, request.FILES)
         if form.is_valid():
-            artikel_name = form.cleaned_data['name']
-
-            if Artikel.objects.filter(lager=lager, name=artikel_name).exists():
-                messages.error(request, 'Dieser Artikel existiert bereits im Lager!')
-                return render(request, 'artikel_create.html', {'form': form, 'lager': lager})
-
             artikel = form.save(commit=False)
             artikel.lager = lager
-            artikel.save()
+            try:
+                with db_transaction.atomic():
+                    anfangsbestand, artikel.menge = artikel.menge, 0
+                    artikel.save()
+                    lager_geaendert(lager.id)
+                    if anfangsbestand:
+                        buche_bewegung(lager, artikel.id, 'in', anfangsbestand)
+                    if artikel.mindestbestand:
+                        warnungen_pruefen(lager.id, [artikel.id])
+            except IntegrityError:
+                # Die Eindeutigkeit von (lager, name) und (lager, code) prüft die Datenbank
+                messages.error(request, _doppelt_meldung(artikel, 'Dieser Artikel existiert bereits im Lager!'))
+                return render(request, 'artikel_create.html', {'form': form, 'lager': lager})
 
+            if form.cleaned_data['foto']:
+                bild_einreihen(artikel, form.cleaned_data['foto'])
+                messages.success(request, 'Artikel wurde erfolgreich erstellt! Das Bild wird im Hintergrund verarbeitet.')
+                return redirect('artikel_management', lager_id=lager.id)
             messages.success(request, 'Artikel wurde erfolgreich erstellt!')
             return redirect('artikel_management', lager_id=lager.id)
         else:
@@ -127,29 +210,50 @@ def artikel_create(request, lager_id):
     return render(request, 'artikel_create.html', {'form': form, 'lager': lager})
 
 
-@login_required
+def artikel_import(request, lager_id):
+    """Importiert Artikel aus einer CSV-Datei (anlegen oder Menge aktualisieren)."""
+    lager = lade_lager(request, lager_id)
+    ergebnis = None
+
+    if request.method == 'POST':
+        form = ArtikelImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            ergebnis = importiere_artikel(lager, form.cleaned_data['datei'])
+            if ergebnis['fehler']:
+                messages.error(request, 'Einige Zeilen konnten nicht importiert werden.')
+            else:
+                messages.success(request, 'Artikel wurden erfolgreich importiert!')
+        else:
+            messages.error(request, 'Bitte korrigiere die Fehler im Formular.')
+    else:
+        form = ArtikelImportForm()
+
+    return render(request, 'artikel_import.html', {'form': form, 'lager': lager, 'ergebnis': ergebnis})
+
+
+@abfragen_budget(5)
+@nur_lesend
+@bedingte_anfrage()
 def artikel_management(request, lager_id):
     """Zeigt eine Übersicht aller Artikel im Lager mit Optionen zum Bearbeiten oder Hinzufügen."""
-    lager = get_object_or_404(Lager, id=lager_id)
+    lager = lade_lager(request, lager_id)
 
-    # Sicherstellen, dass der Benutzer dem Lager zugeordnet ist
-    if request.user not in lager.users.all():
-        return redirect('lager_list')
-
-    # Alle Artikel des Lagers abrufen
-    artikel_list = lager.artikel.all()
+    def liste():
+        # Artikel seitenweise (Keyset nach Name) abrufen
+        artikel_list, naechste_seite = keyset_seite(lager.artikel.all(), request.GET.get('nach'))
+        return {'artikel_list': artikel_list, 'naechste_seite': naechste_seite}
 
     return render(request, 'artikel_management.html', {
         'lager': lager,
-        'artikel_list': artikel_list,
+        'artikel_liste': fragment(request, lager, 'artikel_management_liste.html', liste),
     })
 
-@login_required
+@abfragen_budget(8)
 def grant_access(request, lager_id):
     """Zuweisung von Benutzern zu einem Lager."""
-    lager = get_object_or_404(Lager, id=lager_id)
+    lager = lade_lager(request, lager_id)
 
-    if lager.owner != request.user:
+    if lager.owner_id != request.user.id:
         messages.error(request, 'Du hast keine Berechtigung, Benutzer zu diesem Lager hinzuzufügen.')
         return redirect('lager_detail', lager_id=lager.id)
 
@@ -161,9 +265,10 @@ def grant_access(request, lager_id):
             messages.error(request, 'Der angegebene Benutzer existiert nicht.')
             return redirect('lager_detail', lager_id=lager.id)
 
-        if user not in lager.users.all():
+        if not lager.users.filter(id=user.id).exists():
             lager.users.add(user)
             LagerAccess.objects.create(lager=lager, user=user)
+            lager_geaendert(lager.id)
             messages.success(request, f'Benutzer {user.username} wurde erfolgreich dem Lager zugewiesen.')
         else:
             messages.info(request, f'Benutzer {user.username} ist bereits dem Lager zugewiesen.')
@@ -174,77 +279,357 @@ def grant_access(request, lager_id):
     return render(request, 'grant_access.html', {'lager': lager, 'users': users})
 
 
-@login_required
+@abfragen_budget(6)
+@nur_lesend
+@bedingte_anfrage(zeitraster=KENNZAHLEN_TIMEOUT)
 def lager_detail(request, lager_id):
     """Zeigt die Detailansicht eines Lagers mit den zugewiesenen Artikeln und Personen."""
-    lager = get_object_or_404(Lager, id=lager_id)
+    lager = lade_lager(request, lager_id)
 
-    # Sicherstellen, dass der Benutzer zu diesem Lager gehört
-    if request.user not in lager.users.all():
-        return redirect('lager_list')  # Wenn der Benutzer nicht zu diesem Lager gehört, weiterleiten
+    # Holen der Kennzahlen und der zugewiesenen Personen
+    def inhalt():
+        return {
+            'personen': lager.users.all(),  # Alle Benutzer (Personen), die dem Lager zugewiesen sind
+            'kennzahlen': kennzahlen([lager.id])[lager.id],
+        }
 
-    # Holen der Artikel und der zugewiesenen Personen
     context = {
         'lager': lager,
-        'personen': lager.users.all(),  # Alle Benutzer (Personen), die dem Lager zugewiesen sind
+        # Die Entfernen-Schaltflächen hängen vom Benutzer ab
+        'inhalt': fragment(request, lager, 'lager_detail_inhalt.html', inhalt, schluessel=[request.user.id]),
     }
     return render(request, 'lager_detail.html', context)
 
-from django.db.models import Q
-
-@login_required
+@abfragen_budget(5)
+@nur_lesend
+@bedingte_anfrage()
 def current_status(request, lager_id):
     """Zeigt den aktuellen Status aller Artikel eines Lagers mit Bild oder Standard-Icon."""
-    lager = get_object_or_404(Lager, id=lager_id)
-
-    # Zugriffsprüfung
-    if request.user not in lager.users.all():
-        return redirect('lager_list')
+    lager = lade_lager(request, lager_id)
 
     # Hole den Suchparameter aus der URL
     search_query = request.GET.get('q', '')  # Der Parameter q
-    if search_query:
-        # Filtere nach Artikeln, die den Suchbegriff enthalten
-        articles = lager.artikel.filter(
-            Q(name__icontains=search_query) & Q(menge__gt=0)
+
+    def liste():
+        # Nur Artikel mit Bestand > 0, seitenweise über den Teilindex (lager, name)
+        articles, naechste_seite = keyset_seite(
+            suche_artikel(lager.artikel.filter(menge__gt=0), search_query), request.GET.get('nach')
         )
-    else:
-        # Wenn kein Suchbegriff, zeige alle Artikel mit Bestand > 0
-        articles = lager.artikel.filter(menge__gt=0)
+        return {'articles': articles, 'search_query': search_query, 'naechste_seite': naechste_seite}
 
     return render(request, 'current_status.html', {
         'lager': lager,
-        'articles': articles,
+        'search_query': search_query,
+        'artikel_liste': fragment(request, lager, 'current_status_liste.html', liste),
     })
 
 
+# Live-Aktualisierung per Server-Sent Events
+async def live(request, lager_id):
+    """Hält eine SSE-Verbindung offen und schickt die Bestandsänderungen des Lagers.
+
+    Unter ASGI ist jede Verbindung nur eine wartende Coroutine. Unter WSGI
+    (``runserver``) würde sie einen Thread dauerhaft belegen; dort wird mit
+    204 geantwortet, worauf der Browser nicht erneut verbindet.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    async def ereignisse():
+        yield 'retry: 5000\n\n'
+        async for nachricht in kanal().abonnieren(lager_id):
+            yield ': herzschlag\n\n' if nachricht is None else sse(*nachricht)
+
+    response = StreamingHttpResponse(ereignisse(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx soll nicht puffern
+    return response
+
+
+@abfragen_budget(5)
+@nur_lesend
+def artikel_suche(request, lager_id):
+    """JSON-Suche für die Eingabe-Vervollständigung (``q``, Cursor ``nach``)."""
+    lager = lade_lager(request, lager_id)
+
+    limit = request.GET.get('limit', '')
+    groesse = min(int(limit), SEITENGROESSE) if limit.isdigit() and int(limit) > 0 else 20
+
+    artikel = lager.artikel.all()
+    if request.GET.get('bestand'):
+        artikel = artikel.filter(menge__gt=0)
+    # values() statt Modellinstanzen: die Antwort braucht nur vier Felder
+    treffer, naechste_seite = keyset_seite(
+        suche_artikel(artikel, request.GET.get('q', '')).values('id', 'name', 'menge', 'foto'),
+        request.GET.get('nach'),
+        groesse=groesse,
+    )
+    for eintrag in treffer:
+        eintrag['foto'] = thumbnail_url(eintrag['foto'])
+    return JsonResponse({'results': treffer, 'next': naechste_seite})
+
+
+@abfragen_budget(5)
+@nur_lesend
+def warnungen(request, lager_id):
+    """Offene Mindestbestand-Warnungen eines Lagers als JSON, neueste zuerst."""
+    lager = lade_lager(request, lager_id)
+    offen = lager.warnungen.filter(erledigt__isnull=True).order_by('-erstellt').values(
+        'id', 'artikel_id', 'menge', 'mindestbestand', 'erstellt',
+        artikel_name=F('artikel__name'), bestand=F('artikel__menge'),
+    )[:WARNUNGEN_LIMIT]
+    return JsonResponse({'results': list(offen)})
+
+
+@abfragen_budget(5)
+@nur_lesend
+def nachbestellung(request, lager_id):
+    """Bestellvorschläge aus der letzten Prognose als JSON, knappste Reichweite zuerst."""
+    lager = lade_lager(request, lager_id)
+    vorschlaege = lager.prognosen.filter(bestellmenge__gt=0).order_by(
+        F('reichweite_tage').asc(nulls_last=True), 'artikel_id'
+    ).values(
+        'artikel_id', 'verbrauch_mittel', 'verbrauch_geglaettet', 'reichweite_tage',
+        'meldebestand', 'bestellmenge', 'berechnet',
+        artikel_name=F('artikel__name'), bestand=F('artikel__menge'),
+    )[:NACHBESTELLUNG_LIMIT]
+    return JsonResponse({'results': list(vorschlaege)})
+
+
+# Laufzeitstatistik der Views
+@login_required
+def statistik(request):
+    """Messwerte der letzten Requests je URL-Name als JSON (nur für Staff, je Prozess)."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Nur für Administratoren.'}, status=403)
+    return JsonResponse({'views': messwerte()})
+
 
 # Wareneingang oder -ausgang
-@login_required
+@abfragen_budget(10)
 def transaction(request, lager_id):
-    """Führt einen Wareneingang oder -ausgang durch."""
-    lager = get_object_or_404(Lager, id=lager_id)
+    """Führt einen Wareneingang oder -ausgang durch.
+
+    Der Artikel kommt aus dem gescannten bzw. eingegebenen ``code`` oder,
+    ohne Code, aus der Auswahl ``article`` (gefüllt über die Artikelsuche,
+    der Katalog wird nicht mitgerendert).
+    """
+    lager = lade_lager(request, lager_id)
 
     if request.method == "POST":
         transaction_type = request.POST.get("transaction_type")
         article_id = request.POST.get("article")
-        quantity = int(request.POST.get("quantity"))
-
-        article = get_object_or_404(Artikel, id=article_id, lager=lager)
+        code = code_normalisieren(request.POST.get("code"))
+        if not code and not article_id:
+            messages.error(request, "Bitte scanne einen Code oder wähle einen Artikel aus.")
+            return redirect('transaction', lager_id=lager.id)
+        try:
+            quantity = int(request.POST.get("quantity"))
+        except (TypeError, ValueError):
+            messages.error(request, "Bitte gib eine gültige Menge an.")
+            return redirect('transaction', lager_id=lager.id)
 
-        if transaction_type == "in":
-            article.menge += quantity
-        elif transaction_type == "out":
-            if article.menge >= quantity:
-                article.menge -= quantity
+        # Scanner schicken die Kennung als Header, das Formular als verstecktes Feld
+        anfrage_id = request.headers.get('Idempotency-Key') or request.POST.get('anfrage_id') or None
+        try:
+            if code:
+                buchung = buche_scan(lager, code, transaction_type, quantity, anfrage_id)
             else:
-                messages.error(request, "Nicht genügend Artikel für den Abgang verfügbar!")
+                buchung = buche_bewegung(lager, article_id, transaction_type, quantity, anfrage_id)
+        except AnfrageKonflikt:
+            # Z. B. nach "Zurück" im Browser mit geänderter Menge erneut abgeschickt
+            messages.error(request, "Dieses Formular wurde bereits gebucht, die Änderung nicht. Bitte die Buchung neu erfassen.")
+            return redirect('transaction', lager_id=lager.id)
+        except Artikel.DoesNotExist:
+            if code:
+                messages.error(request, f"Kein Artikel mit dem Code {code} in diesem Lager.")
                 return redirect('transaction', lager_id=lager.id)
-
-        article.save()
-        Transaction.objects.create(article=article, lager=lager, type=transaction_type, quantity=quantity)
-        messages.success(request, 'Transaktion erfolgreich durchgeführt!')
+            raise Http404("Artikel nicht gefunden.")
+        except NichtGenugBestand:
+            messages.error(request, "Nicht genügend Artikel für den Abgang verfügbar!")
+            return redirect('transaction', lager_id=lager.id)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('transaction', lager_id=lager.id)
+
+        if getattr(buchung, 'wiederholt', False):
+            messages.info(request, 'Diese Transaktion wurde bereits gebucht.')
+        else:
+            messages.success(request, 'Transaktion erfolgreich durchgeführt!')
         return redirect('lager_detail', lager_id=lager.id)
 
     form = ArtikelForm()
-    return render(request, 'transaction.html', {'lager': lager, 'form': form})
+    # Neue Kennung je angezeigtem Formular: doppeltes Absenden bucht nur einmal
+    return render(request, 'transaction.html', {'lager': lager, 'form': form, 'anfrage_id': uuid.uuid4().hex})
+
+
+def _gebrochene_menge(positionen):
+    # Eine gebrochene Menge (2.7) ist ein Fehler des Clients, kein abgelehnter Posten
+    for i, position in enumerate(positionen):
+        menge = position.get('quantity') if isinstance(position, dict) else None
+        if isinstance(menge, float) and not menge.is_integer():
+            return JsonResponse({'error': f'Position {i}: "quantity" muss eine ganze Zahl sein.'}, status=400)
+    return None
+
+
+# Sammelbuchung für Scanner-Terminals
+@abfragen_budget(12)
+@require_POST
+def transaction_bulk(request, lager_id):
+    """Bucht viele Wareneingänge/-ausgänge aus einem JSON-Body in einem Schritt.
+
+    Erwartet ``{"lines": [{"article": <id>, "type": "in"|"out", "quantity": <n>}, ...]}``
+    und liefert das Ergebnis je Position zurück.
+    """
+    lager = lade_lager(request, lager_id)
+
+    try:
+        positionen = json.loads(request.body)['lines']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Ungültiger JSON-Body.'}, status=400)
+    if not isinstance(positionen, list):
+        return JsonResponse({'error': '"lines" muss eine Liste sein.'}, status=400)
+    if len(positionen) > BUCHUNG_MAX_POSITIONEN:
+        return JsonResponse({'error': f'Höchstens {BUCHUNG_MAX_POSITIONEN} Positionen je Sammelbuchung.'}, status=400)
+    if (fehler := _gebrochene_menge(positionen)) is not None:
+        return fehler
+
+    ergebnisse = buche_bewegungen(lager, positionen)
+    gebucht = sum(1 for e in ergebnisse if e['ok'])
+    return JsonResponse({
+        'results': ergebnisse,
+        'booked': gebucht,
+        'failed': len(ergebnisse) - gebucht,
+    })
+
+
+# Scan eines Barcodes bzw. einer SKU (Scanner-Terminals)
+@abfragen_budget(10)
+@require_http_methods(['GET', 'POST'])
+def scan(request, lager_id):
+    """GET ``?code=``: der Artikel zum Code. POST: bucht den Artikel zum Code.
+
+    Erwartet ``{"code": "...", "type": "in"|"out", "quantity": <n>}``; ohne
+    ``quantity`` ein Stück je Scan. Mit ``Idempotency-Key`` wiederholbar.
+    """
+    lager = lade_lager(request, lager_id)
+
+    if request.method == 'GET':
+        return _scan_nachschlagen(request, lager_id=lager.id)
+
+    try:
+        daten = json.loads(request.body)
+        code = code_normalisieren(daten['code'])
+        transaction_type, quantity = daten['type'], ganzzahl(daten.get('quantity', 1))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Erwartet {"code": "...", "type": "in"|"out", "quantity": <n>}.'}, status=400)
+    if code is None:
+        return JsonResponse({'error': '"code" darf nicht leer sein.'}, status=400)
+
+    anfrage_id = request.headers.get('Idempotency-Key') or daten.get('anfrage_id') or None
+    if anfrage_id is not None and not isinstance(anfrage_id, str):
+        return JsonResponse({'error': '"anfrage_id" muss ein Text sein.'}, status=400)
+    try:
+        buchung = buche_scan(lager, code, transaction_type, quantity, anfrage_id)
+    except AnfrageKonflikt:
+        return JsonResponse({'error': 'Die Anfrage-Kennung wurde bereits für eine andere Buchung verwendet.'}, status=422)
+    except Artikel.DoesNotExist:
+        return JsonResponse({'error': 'Kein Artikel mit diesem Code.'}, status=404)
+    except NichtGenugBestand:
+        return JsonResponse({'error': 'Nicht genügend Artikel für den Abgang verfügbar!'}, status=409)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = JsonResponse({
+        'id': buchung.id, 'article': buchung.article_id, 'code': code,
+        'type': buchung.type, 'quantity': buchung.quantity, 'date': buchung.date,
+    }, status=201)
+    if getattr(buchung, 'wiederholt', False):
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+@nur_lesend
+def _scan_nachschlagen(request, lager_id):
+    code = code_normalisieren(request.GET.get('code'))
+    artikel = None
+    if code:
+        artikel = Artikel.objects.filter(lager_id=lager_id, code=code).values('id', 'name', 'menge', 'code').first()
+    if artikel is None:
+        return JsonResponse({'error': 'Kein Artikel mit diesem Code.'}, status=404)
+    return JsonResponse(artikel)
+
+
+# Umbuchung zwischen zwei Lagern
+@abfragen_budget(14)
+@require_POST
+def umbuchung(request, lager_id):
+    """Bucht Artikel in einem Schritt von diesem Lager in ein anderes.
+
+    Erwartet ``{"target": <lager_id>, "lines": [{"article": <id>, "quantity": <n>}, ...]}``;
+    der Benutzer muss beiden Lagern angehören. Liefert das Ergebnis je Position
+    und die gemeinsame Kennung der Buchungen.
+    """
+    lager = lade_lager(request, lager_id)
+
+    try:
+        daten = json.loads(request.body)
+        ziel_id, positionen = int(daten['target']), daten['lines']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Ungültiger JSON-Body.'}, status=400)
+    if not isinstance(positionen, list):
+        return JsonResponse({'error': '"lines" muss eine Liste sein.'}, status=400)
+    if len(positionen) > UMBUCHUNG_MAX_POSITIONEN:
+        return JsonResponse({'error': f'Höchstens {UMBUCHUNG_MAX_POSITIONEN} Positionen je Umbuchung.'}, status=400)
+    if (fehler := _gebrochene_menge(positionen)) is not None:
+        return fehler
+
+    try:
+        ziel = lade_lager(request, ziel_id)
+    except Http404:
+        return JsonResponse({'error': 'Ziellager nicht gefunden.'}, status=404)
+    if not ziel.ist_mitglied:
+        return JsonResponse({'error': 'Kein Zugriff auf das Ziellager.'}, status=403)
+
+    try:
+        kennung, ergebnisse = umbuchen(lager, ziel, positionen)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except NichtGenugBestand:
+        return JsonResponse({'error': 'Der Bestand hat sich während der Umbuchung geändert.'}, status=409)
+
+    gebucht = sum(1 for e in ergebnisse if e['ok'])
+    return JsonResponse({
+        'umbuchung': kennung if gebucht else None,
+        'results': ergebnisse,
+        'booked': gebucht,
+        'failed': len(ergebnisse) - gebucht,
+    })
+
+
+# Export als CSV
+@abfragen_budget(4)
+@nur_lesend
+def export_bestand(request, lager_id):
+    """Streamt den aktuellen Bestand eines Lagers als CSV."""
+    lager = lade_lager(request, lager_id)
+    return _csv_antwort(bestand_zeilen(lager, using=lesedatenbank()), f'bestand_{lager.id}.csv')
+
+
+@abfragen_budget(4)
+@nur_lesend
+def export_transaktionen(request, lager_id):
+    """Streamt die Buchungen eines Lagers (optional ``von``/``bis`` als YYYY-MM-DD) als CSV."""
+    lager = lade_lager(request, lager_id)
+    try:
+        von, bis = tagesgrenzen(request.GET.get('von'), request.GET.get('bis'))
+    except ValueError:
+        return HttpResponseBadRequest('Ungültiges Datum (erwartet YYYY-MM-DD).')
+    # Die Zeilen werden erst beim Streamen gelesen, nach dem Ende des Requests; die Datenbank steht jetzt fest
+    return _csv_antwort(transaktions_zeilen(lager, von, bis, using=lesedatenbank()), f'transaktionen_{lager.id}.csv')
+
+
+def _csv_antwort(zeilen, dateiname):
+    response = StreamingHttpResponse(csv_stream(zeilen), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{dateiname}"'
+    return response
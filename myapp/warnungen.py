@@ -0,0 +1,48 @@
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Artikel, Warnung
+
+
+def warnungen_oeffnen(lager_id, artikel_ids=None):
+    """Legt für Artikel unter Mindestbestand eine Warnung an, falls noch keine offen ist.
+
+    Ein einziges ``INSERT ... SELECT``; ohne ``artikel_ids`` wird das ganze
+    Lager geprüft (z. B. nach einem Import). Doppelte Warnungen verhindert der
+    Teil-Unique-Index auf offene Warnungen (``ON CONFLICT DO NOTHING``), auch
+    bei parallelen Buchungen.
+    """
+    if artikel_ids is not None and not artikel_ids:
+        return
+    qn = connection.ops.quote_name
+    bedingung, parameter = '', []
+    if artikel_ids is not None:
+        bedingung = f" AND id IN ({', '.join(['%s'] * len(artikel_ids))})"
+        parameter = list(artikel_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {qn(Warnung._meta.db_table)} (lager_id, artikel_id, menge, mindestbestand, erstellt) "
+            f"SELECT lager_id, id, menge, mindestbestand, %s FROM {qn(Artikel._meta.db_table)} "
+            f"WHERE lager_id = %s AND menge < mindestbestand{bedingung} "
+            f"ON CONFLICT DO NOTHING",
+            [connection.ops.adapt_datetimefield_value(timezone.now()), lager_id, *parameter],
+        )
+
+
+def warnungen_schliessen(lager_id, artikel_ids=None):
+    """Erledigt offene Warnungen, deren Artikel wieder genug Bestand hat (ein ``UPDATE``)."""
+    if artikel_ids is not None and not artikel_ids:
+        return 0
+    offen = Warnung.objects.filter(
+        lager_id=lager_id, erledigt__isnull=True, artikel__menge__gte=F('artikel__mindestbestand')
+    )
+    if artikel_ids is not None:
+        offen = offen.filter(artikel_id__in=artikel_ids)
+    return offen.update(erledigt=timezone.now())
+
+
+def warnungen_pruefen(lager_id, artikel_ids=None):
+    """Bewertet die Warnungen für ``artikel_ids`` (bzw. das ganze Lager) neu."""
+    warnungen_oeffnen(lager_id, artikel_ids)
+    warnungen_schliessen(lager_id, artikel_ids)
@@ -0,0 +1,75 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db.models import Exists, OuterRef, Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+
+from .models import Lager, LagerAccess
+
+
+def mit_mitgliedschaft(queryset, user):
+    """Annotiert ``ist_mitglied``: gehört ``user`` dem Lager an (Besitzer, M2M oder LagerAccess)?
+
+    Die Prüfungen laufen als indizierte EXISTS-Unterabfragen in derselben
+    Abfrage, unabhängig davon, wie viele Benutzer ein Lager hat.
+    """
+    mitglieder = Lager.users.through.objects.filter(lager_id=OuterRef('pk'), user_id=user.id)
+    freigaben = LagerAccess.objects.filter(lager_id=OuterRef('pk'), user_id=user.id)
+    return queryset.annotate(ist_mitglied=Q(owner_id=user.id) | Q(Exists(mitglieder)) | Q(Exists(freigaben)))
+
+
+def zugaengliche_lager(user):
+    """Alle Lager, in denen ``user`` Mitglied im Sinne von ``mit_mitgliedschaft`` ist.
+
+    Gemeinsame Abfrage für Lagerliste und API; jedes Lager erscheint einmal.
+    """
+    return Lager.objects.filter(
+        Q(owner_id=user.id)
+        | Q(id__in=Lager.users.through.objects.filter(user_id=user.id).values('lager_id'))
+        | Q(id__in=LagerAccess.objects.filter(user_id=user.id).values('lager_id'))
+    ).distinct()
+
+
+def lade_lager(request, lager_id):
+    """Lädt ein Lager samt Mitgliedschaft des Benutzers mit einer Abfrage.
+
+    Das Ergebnis wird am Request gemerkt, weitere Aufrufe kosten keine Abfrage.
+    """
+    cache = request.__dict__.setdefault('_lager_cache', {})
+    if lager_id not in cache:
+        cache[lager_id] = get_object_or_404(mit_mitgliedschaft(Lager.objects.all(), request.user), id=lager_id)
+    return cache[lager_id]
+
+
+def lager_mitglied_erforderlich(view_func=None, *, json_antwort=False):
+    """Decorator für Lager-Views: Login plus Mitgliedschaft im Lager ``lager_id``.
+
+    Nicht-Mitglieder werden zur Lagerliste umgeleitet bzw. erhalten bei
+    ``json_antwort=True`` eine 403-Antwort. Funktioniert auch für async Views.
+    Die Views selbst brauchen daher kein eigenes ``login_required``.
+    """
+    def abweisen():
+        if json_antwort:
+            return JsonResponse({'error': 'Kein Zugriff auf dieses Lager.'}, status=403)
+        return redirect('lager_list')
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, lager_id, *args, **kwargs):
+                if not (await sync_to_async(lade_lager)(request, lager_id)).ist_mitglied:
+                    return abweisen()
+                return await view(request, lager_id, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, lager_id, *args, **kwargs):
+                if not lade_lager(request, lager_id).ist_mitglied:
+                    return abweisen()
+                return view(request, lager_id, *args, **kwargs)
+        return login_required(wrapper)
+
+    if view_func is not None:
+        return decorator(view_func)
+    return decorator